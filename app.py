@@ -3,14 +3,13 @@
 # -------------------------------------------------------------------------
 # Import necessary libraries for web application, data processing, visualization, 
 # database operations, and AI integration
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, Response, render_template, request, redirect, url_for, session, flash, jsonify, stream_template
 import pandas as pd
 import plotly.graph_objs as go
-import plotly
 import json
+import hashlib
 import os
 import numpy as np
-import sqlite3
 import werkzeug.routing.exceptions
 import markdown
 from markupsafe import Markup
@@ -18,6 +17,18 @@ import google.generativeai as genai
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from shopify_db import DB_PATH, get_read_connection
+from date_ranges import DateRange, parse_page_range, utc_today
+from insight_panels import PANELS, PanelContext, dashboard_windows, inventory_windows, load_panels, load_panels_as_completed, page_panels, page_requests, sales_windows
+from shopify_maintenance import start_idle_vacuum
+from query_budget import get_query_stats
+from chart_cache import cached_chart, figure_json, get_chart_cache_stats
+from chart_layouts import LAYOUTS_SCRIPT, LAYOUTS_VERSION
+from static_assets import PLOTLY_ASSET, load_manifest, plotly_cdn_url
+from query_cache import cached_read_sql, get_cache_stats, get_data_version
+from inventory_kpis import get_sku_kpis, summarize_kpis, top_sell_through
+from demand_forecast import get_demand_forecasts, top_forecasts
+from columnar_snapshot import load_sales_snapshot
 
 # Load environment variables from .env file
 load_dotenv()
@@ -29,12 +40,6 @@ app.secret_key = 'supersecretkey'  # Use env var in production
 # User dictionary for authentication (would use database in production)
 users = {}
 
-# -------------------------------------------------------------------------
-# DATABASE CONFIGURATION
-# -------------------------------------------------------------------------
-# Define path to the SQLite database file for Shopify data
-DB_PATH = 'database/shopify_data.db'
-
 # -------------------------------------------------------------------------
 # GEMINI AI CONFIGURATION
 # -------------------------------------------------------------------------
@@ -150,6 +155,9 @@ Inventory Status:
 Product Performance:
 {product_performance}
 
+Demand Forecast (units per day, trend and units expected over the next 14 days with an 80% interval):
+{demand_forecast}
+
 Generate 5 INVENTORY INTELLIGENCE insight cards with the following format:
 
 ### **🔹 INVENTORY INTELLIGENCE**
@@ -168,7 +176,7 @@ Generate 5 INVENTORY INTELLIGENCE insight cards with the following format:
 3. [Marketing or display change]
 4. [Performance tracking metric]
 
-Focus on stock levels, sales velocity, product variants, and revenue optimization. Every insight must have specific numbers and detailed reasoning behind the recommendation.
+Focus on stock levels, sales velocity, product variants, and revenue optimization. Use the demand forecast to size reorders and flag products whose stock will not cover the forecast. Every insight must have specific numbers and detailed reasoning behind the recommendation.
 """
 ''')
 
@@ -186,14 +194,15 @@ except ImportError:
 
 def get_db_connection():
     """
-    Create a database connection to the Shopify SQLite database
+    Get a read-only connection to the Shopify SQLite database
+    
+    Connections come from a per-thread pool (see shopify_db.py), so calling
+    close() on the result hands it back to the pool instead of closing it.
     
     Returns:
-        sqlite3.Connection: A connection object to the SQLite database with row factory set
+        sqlite3.Connection: A pooled read-only connection with row factory set
     """
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return get_read_connection()
 
 def check_database_exists():
     """
@@ -252,23 +261,21 @@ def prepare_shopify_sales_data_for_ai():
     try:
         conn = get_db_connection()
         
-        # Get top selling products with order data
+        # Get top selling products with order data (from the daily rollups)
         top_selling_query = """
         SELECT 
             p.title,
             v.sku,
             p.product_type,
             v.price,
-            SUM(oli.quantity) as total_quantity_sold,
-            SUM(oli.quantity * oli.price) as total_revenue,
-            COUNT(DISTINCT oli.order_id) as order_count,
-            AVG(oli.price) as avg_selling_price
-        FROM shopify_order_line_items oli
-        JOIN shopify_orders o ON oli.order_id = o.id
-        LEFT JOIN shopify_products p ON oli.product_id = p.id
-        LEFT JOIN shopify_variants v ON oli.variant_id = v.id
-        WHERE o.financial_status != 'refunded'
-        GROUP BY oli.product_id, oli.variant_id
+            SUM(r.units) as total_quantity_sold,
+            SUM(r.revenue) as total_revenue,
+            SUM(r.order_count) as order_count,
+            SUM(r.price_sum) / SUM(r.line_count) as avg_selling_price
+        FROM shopify_daily_variant_sales r
+        LEFT JOIN shopify_products p ON r.product_id = p.id
+        LEFT JOIN shopify_variants v ON r.variant_id = v.id
+        GROUP BY r.product_id, r.variant_id
         ORDER BY total_revenue DESC
         LIMIT 20
         """
@@ -276,14 +283,13 @@ def prepare_shopify_sales_data_for_ai():
         # Get order performance by time period
         order_performance_query = """
         SELECT 
-            DATE(o.created_at) as order_date,
-            COUNT(*) as daily_orders,
-            SUM(o.total_price) as daily_revenue,
-            AVG(o.total_price) as avg_order_value
-        FROM shopify_orders o
-        WHERE o.financial_status != 'refunded'
-        AND DATE(o.created_at) >= DATE('now', '-30 days')
-        GROUP BY DATE(o.created_at)
+            day as order_date,
+            SUM(order_count) as daily_orders,
+            SUM(revenue) as daily_revenue,
+            SUM(revenue) / SUM(order_count) as avg_order_value
+        FROM shopify_daily_order_stats
+        WHERE day >= ? AND day < ?
+        GROUP BY day
         ORDER BY order_date DESC
         LIMIT 30
         """
@@ -293,20 +299,19 @@ def prepare_shopify_sales_data_for_ai():
         SELECT 
             COALESCE(p.product_type, 'Uncategorized') as category,
             COUNT(DISTINCT p.id) as product_count,
-            SUM(oli.quantity) as total_units_sold,
-            SUM(oli.quantity * oli.price) as total_revenue
+            SUM(f.quantity) as total_units_sold,
+            SUM(f.revenue) as total_revenue
         FROM shopify_products p
-        LEFT JOIN shopify_order_line_items oli ON p.id = oli.product_id
-        LEFT JOIN shopify_orders o ON oli.order_id = o.id
-        WHERE o.financial_status != 'refunded' OR oli.id IS NULL
+        LEFT JOIN shopify_sales_facts f ON p.id = f.product_id
+        WHERE f.is_refunded = 0 OR f.line_item_id IS NULL
         GROUP BY p.product_type
         ORDER BY total_revenue DESC
         """
         
-        # Execute queries
-        top_products_df = pd.read_sql_query(top_selling_query, conn)
-        order_performance_df = pd.read_sql_query(order_performance_query, conn)
-        category_df = pd.read_sql_query(category_query, conn)
+        # Execute queries (cached until the next sync, see query_cache.py)
+        top_products_df = cached_read_sql(conn, top_selling_query)
+        order_performance_df = cached_read_sql(conn, order_performance_query, DateRange.last_days(30).bounds())
+        category_df = cached_read_sql(conn, category_query)
         
         conn.close()
         
@@ -336,12 +341,14 @@ def prepare_shopify_product_data_for_ai():
     1. Queries product inventory status and details
     2. Analyzes product performance metrics
     3. Summarizes inventory status by product category
+    4. Adds the demand forecasts of the best-selling variants
     
     Returns:
         dict: A dictionary containing formatted product data for AI analysis:
             - product_data_summary: Overview of product inventory
             - product_performance: Sales performance metrics by product
             - inventory_status: Summary of inventory by category
+            - demand_forecast: Forecast demand of the best-selling variants
     """
     try:
         conn = get_db_connection()
@@ -370,15 +377,14 @@ def prepare_shopify_product_data_for_ai():
             p.title,
             v.sku,
             p.product_type,
-            SUM(oli.quantity) as total_sold,
-            SUM(oli.quantity * oli.price) as total_revenue,
-            COUNT(DISTINCT oli.order_id) as unique_orders,
-            MAX(o.created_at) as last_sale_date
+            SUM(f.quantity) as total_sold,
+            SUM(f.revenue) as total_revenue,
+            COUNT(DISTINCT f.order_id) as unique_orders,
+            MAX(f.created_at) as last_sale_date
         FROM shopify_products p
         LEFT JOIN shopify_variants v ON p.id = v.product_id
-        LEFT JOIN shopify_order_line_items oli ON v.id = oli.variant_id
-        LEFT JOIN shopify_orders o ON oli.order_id = o.id
-        WHERE o.financial_status != 'refunded' OR oli.id IS NULL
+        LEFT JOIN shopify_sales_facts f ON v.id = f.variant_id
+        WHERE f.is_refunded = 0 OR f.line_item_id IS NULL
         GROUP BY p.id
         ORDER BY total_revenue DESC NULLS LAST
         LIMIT 30
@@ -397,10 +403,15 @@ def prepare_shopify_product_data_for_ai():
         ORDER BY total_products DESC
         """
         
-        # Execute queries
-        product_df = pd.read_sql_query(product_query, conn)
-        performance_df = pd.read_sql_query(performance_query, conn)
-        inventory_df = pd.read_sql_query(inventory_query, conn)
+        # Execute queries (cached until the next sync, see query_cache.py)
+        product_df = cached_read_sql(conn, product_query)
+        performance_df = cached_read_sql(conn, performance_query)
+        inventory_df = cached_read_sql(conn, inventory_query)
+        
+        # Get the stored demand forecasts of the best-selling variants (see demand_forecast.py)
+        forecast_df = top_forecasts(get_demand_forecasts(conn, get_data_version(conn), load_sales_snapshot()))
+        forecast_df = forecast_df[['product_name', 'sku', 'stock_on_hand', 'velocity', 'trend',
+                                   'forecast_units', 'forecast_lower', 'forecast_upper', 'days_of_cover']].round(2)
         
         conn.close()
         
@@ -408,18 +419,21 @@ def prepare_shopify_product_data_for_ai():
         product_data_summary = product_df.to_string(index=False)
         product_performance = performance_df.to_string(index=False)
         inventory_status = inventory_df.to_string(index=False)
+        demand_forecast = forecast_df.to_string(index=False)
         
         return {
             "product_data_summary": product_data_summary,
             "product_performance": product_performance,
-            "inventory_status": inventory_status
+            "inventory_status": inventory_status,
+            "demand_forecast": demand_forecast
         }
     except Exception as e:
         print(f"Error preparing Shopify product data: {e}")
         return {
             "product_data_summary": "Error retrieving product data",
             "product_performance": "Error retrieving performance data",  
-            "inventory_status": "Error retrieving inventory data"
+            "inventory_status": "Error retrieving inventory data",
+            "demand_forecast": "Error retrieving demand forecasts"
         }
 
 def generate_sales_insights():
@@ -529,7 +543,8 @@ def generate_inventory_insights():
         product_data_summary=product_data["product_data_summary"],
         sales_data_summary=sales_data["sales_data_summary"],
         inventory_status=product_data["inventory_status"],
-        product_performance=product_data["product_performance"]
+        product_performance=product_data["product_performance"],
+        demand_forecast=product_data["demand_forecast"]
     )
     
     try:
@@ -654,6 +669,234 @@ def logout():
     flash("You have been logged out", "info")
     return redirect(url_for('home'))
 
+def dashboard_revenue_chart(top_products_revenue):
+    """
+    Build the top products by revenue chart of the dashboard
+    
+    Args:
+        top_products_revenue (pd.DataFrame): The top_revenue panel
+    
+    Returns:
+        go.Figure: The chart
+    """
+    # Create enhanced visualization for top revenue products
+    colors = ['#5d5fef', '#4079ed', '#3cd856', '#a700ff', '#ffa412']
+    
+    # Create improved revenue bar chart
+    revenue_fig = go.Figure()
+    
+    # Truncate long product names for better display
+    display_names = [name[:30] + '...' if len(name) > 30 else name for name in top_products_revenue['product_name']]
+    
+    revenue_fig.add_trace(go.Bar(
+        x=display_names,
+        y=top_products_revenue['revenue'],
+        marker=dict(
+            color=colors,
+            line=dict(width=1, color='#333')
+        ),            hovertemplate='<b>Product:</b> %{customdata}<br><b>Revenue:</b> ₹%{y:,.2f}<extra></extra>',
+        customdata=top_products_revenue['product_name'],
+        text=top_products_revenue['revenue'].apply(lambda x: f'₹{x:,.0f}'),
+        textposition='auto'
+    ))
+    revenue_fig.update_layout(
+        title='Top 5 Products by Revenue',
+        xaxis_title='Product',
+        yaxis_title='Revenue (₹)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        margin=dict(l=60, r=30, t=50, b=100),
+        hoverlabel=dict(
+            bgcolor="white",
+            font_size=14
+        ),
+        font=dict(
+            family="Poppins, sans-serif",
+            size=12
+        ),
+        xaxis=dict(tickangle=-45)
+    )
+    
+    return revenue_fig
+
+def dashboard_quantity_chart(top_products_quantity):
+    """
+    Build the top products by quantity chart of the dashboard
+    
+    Args:
+        top_products_quantity (pd.DataFrame): The top_quantity panel
+    
+    Returns:
+        go.Figure: The chart
+    """
+    colors = ['#5d5fef', '#4079ed', '#3cd856', '#a700ff', '#ffa412']
+    
+    # Create quantity sold chart
+    quantity_fig = go.Figure()
+    
+    display_names_qty = [name[:30] + '...' if len(name) > 30 else name for name in top_products_quantity['product_name']]
+    
+    quantity_fig.add_trace(go.Bar(
+        x=display_names_qty,
+        y=top_products_quantity['quantity'],
+        marker=dict(
+            color=colors,
+            line=dict(width=1, color='#333'),
+            opacity=0.8
+        ),
+        hovertemplate='<b>Product:</b> %{customdata}<br><b>Quantity:</b> %{y}<extra></extra>',
+        customdata=top_products_quantity['product_name'],
+        text=top_products_quantity['quantity'].apply(lambda x: f'{int(x)}'),
+        textposition='auto'
+    ))
+    
+    quantity_fig.update_layout(
+        title='Top 5 Products by Quantity Sold',
+        xaxis_title='Product',
+        yaxis_title='Quantity Sold',
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        margin=dict(l=60, r=30, t=50, b=100),
+        hoverlabel=dict(
+            bgcolor="white",
+            font_size=14
+        ),
+        font=dict(
+            family="Poppins, sans-serif",
+            size=12
+        ),
+        xaxis=dict(tickangle=-45)
+    )
+    
+    return quantity_fig
+
+def dashboard_category_chart(category_sales):
+    """
+    Build the revenue by category chart of the dashboard
+    
+    Args:
+        category_sales (pd.DataFrame): The category panel
+    
+    Returns:
+        go.Figure: The chart
+    """
+    colors = ['#5d5fef', '#4079ed', '#3cd856', '#a700ff', '#ffa412']
+    
+    # Create category distribution chart
+    category_fig = go.Figure()
+    
+    category_fig.add_trace(go.Pie(
+        labels=category_sales['category'], 
+        values=category_sales['total_revenue'],
+        hole=0.4,
+        textinfo='label+percent',
+        marker=dict(
+            colors=colors * 2,  # Repeat colors if needed
+            line=dict(color='#FFFFFF', width=2)
+        ),
+        hovertemplate='<b>Category:</b> %{label}<br><b>Revenue:</b> ₹%{value:,.0f}<br><b>Percentage:</b> %{percent}<extra></extra>'
+    ))
+    
+    category_fig.update_layout(
+        title='Revenue Distribution by Product Category',
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=-0.2,
+            xanchor="center",
+            x=0.5
+        ),
+        margin=dict(l=20, r=20, t=50, b=20),
+        font=dict(
+            family="Poppins, sans-serif",
+            size=12
+        )
+    )
+    
+    return category_fig
+
+def dashboard_trend_chart(trend_data, trend_window, compare_data=None, compare_window=None):
+    """
+    Build the sales trend chart of the dashboard
+    
+    Args:
+        trend_data (pd.DataFrame): The trend panel
+        trend_window (DateRange): Days the trend covers
+        compare_data (pd.DataFrame): The trend_compare panel, if a
+            comparison period is shown
+        compare_window (DateRange): The comparison period
+    
+    Returns:
+        go.Figure: The chart
+    """
+    # Create sales trend over time (last 30 days unless a range was selected)
+    sales_trend_fig = go.Figure()
+    
+    # Add revenue line
+    sales_trend_fig.add_trace(go.Scatter(
+        x=trend_data['order_date'],
+        y=trend_data['daily_revenue'],
+        mode='lines+markers',
+        name='Daily Revenue',
+        line=dict(color='#5d5fef', width=3),
+        marker=dict(size=8),
+        hovertemplate='<b>Date:</b> %{x}<br><b>Revenue:</b> ₹%{y:,.2f}<extra></extra>'
+    ))
+    
+    # Add orders line on secondary y-axis
+    sales_trend_fig.add_trace(go.Scatter(
+        x=trend_data['order_date'],
+        y=trend_data['daily_orders'],
+        mode='lines+markers',
+        name='Daily Orders',
+        line=dict(color='#ffa412', width=3),
+        marker=dict(size=8),
+        yaxis='y2',
+        hovertemplate='<b>Date:</b> %{x}<br><b>Orders:</b> %{y}<extra></extra>'
+    ))
+    
+    # Add the comparison period's revenue, shifted onto the selected days
+    if compare_data is not None:
+        shift = pd.Timedelta(days=(trend_window.start - compare_window.start).days)
+        sales_trend_fig.add_trace(go.Scatter(
+            x=(pd.to_datetime(compare_data['order_date']) + shift).dt.strftime('%Y-%m-%d'),
+            y=compare_data['daily_revenue'],
+            customdata=compare_data['order_date'],
+            mode='lines',
+            name=f'Revenue ({compare_window.label})',
+            line=dict(color='#94a3b8', width=2, dash='dash'),
+            hovertemplate='<b>Date:</b> %{customdata}<br><b>Revenue:</b> ₹%{y:,.2f}<extra></extra>'
+        ))
+    sales_trend_fig.update_layout(
+        title=f'Sales Trend ({trend_window.label})',
+        xaxis_title='Date',
+        yaxis_title='Revenue (₹)',
+        yaxis2=dict(
+            title='Orders',
+            overlaying='y',
+            side='right'
+        ),
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=-0.3,
+            xanchor="center",
+            x=0.5
+        ),
+        margin=dict(l=60, r=60, t=50, b=80),
+        font=dict(
+            family="Poppins, sans-serif",
+            size=12
+        ),
+        hovermode="x unified"
+    )
+    
+    return sales_trend_fig
+
 @app.route('/dashboard')
 def dashboard():
     """
@@ -673,6 +916,11 @@ def dashboard():
     - Top products by quantity
     - Revenue by product category
     - Sales trend over time
+    
+    Query parameters (see date_ranges.py):
+    - start / end: Days covered by the sales trend (default: last 30 days)
+    - compare / compare_start / compare_end: Adds the revenue of a
+      comparison period to the sales trend
     """
     if 'user' not in session:
         flash("Please login to access the dashboard.", "warning")
@@ -686,255 +934,56 @@ def dashboard():
                              user=session.get('user'),
                              db_message=db_message)
     
+    # Selected date range (bound into the windowed queries)
+    page_range, range_error = parse_page_range(request.args)
+    if range_error:
+        flash(f"{range_error}. Showing the default periods.", "warning")
+    windows = dashboard_windows(page_range)
+    trend_window, compare_window = windows['trend'], windows['compare']
+    
     # Connect to Shopify database
     conn = get_db_connection()
     
-    try:        # Calculate metrics from Shopify data
-        metrics_query = """
-        SELECT 
-            SUM(o.total_price) as total_sales_value,
-            COUNT(DISTINCT o.id) as total_orders,
-            SUM(oli.quantity) as total_units_sold,
-            AVG(o.total_price) as avg_order_value
-        FROM shopify_orders o
-        LEFT JOIN shopify_order_line_items oli ON o.id = oli.order_id
-        WHERE o.financial_status != 'refunded'
-        """
-        metrics = pd.read_sql(metrics_query, conn).iloc[0]
+    # Panels share the page's time budget (see insight_panels.py)
+    panels = PanelContext(conn, 'dashboard', page_range)
+    budget = panels.budget
+    
+    try:
+        # Calculate metrics from Shopify data
+        metrics = panels.load('metrics').iloc[0]
         
         # Get product count
-        product_count_query = "SELECT COUNT(*) as product_count FROM shopify_products WHERE status = 'active'"
-        product_count = pd.read_sql(product_count_query, conn).iloc[0]['product_count']
-          # Get top products by revenue
-        top_revenue_query = """
-        SELECT 
-            CASE 
-                WHEN p.title IS NOT NULL THEN p.title || CASE WHEN v.title != 'Default Title' THEN ' - ' || v.title ELSE '' END
-                ELSE 'Unknown Product'
-            END as product_name,
-            SUM(oli.quantity * oli.price) as revenue
-        FROM shopify_order_line_items oli
-        JOIN shopify_orders o ON oli.order_id = o.id
-        LEFT JOIN shopify_products p ON oli.product_id = p.id
-        LEFT JOIN shopify_variants v ON oli.variant_id = v.id
-        WHERE o.financial_status != 'refunded'
-        GROUP BY oli.product_id, oli.variant_id
-        ORDER BY revenue DESC
-        LIMIT 5
-        """
-        top_products_revenue = pd.read_sql(top_revenue_query, conn)
-        
-        # Get top products by quantity
-        top_quantity_query = """
-        SELECT 
-            CASE 
-                WHEN p.title IS NOT NULL THEN p.title || CASE WHEN v.title != 'Default Title' THEN ' - ' || v.title ELSE '' END
-                ELSE 'Unknown Product'
-            END as product_name,
-            SUM(oli.quantity) as quantity
-        FROM shopify_order_line_items oli
-        JOIN shopify_orders o ON oli.order_id = o.id
-        LEFT JOIN shopify_products p ON oli.product_id = p.id
-        LEFT JOIN shopify_variants v ON oli.variant_id = v.id
-        WHERE o.financial_status != 'refunded'
-        GROUP BY oli.product_id, oli.variant_id
-        ORDER BY quantity DESC
-        LIMIT 5
-        """
-        top_products_quantity = pd.read_sql(top_quantity_query, conn)
-        
-        # Create enhanced visualization for top revenue products
-        colors = ['#5d5fef', '#4079ed', '#3cd856', '#a700ff', '#ffa412']
-        
-        # Create improved revenue bar chart
-        revenue_fig = go.Figure()
-        
-        # Truncate long product names for better display
-        display_names = [name[:30] + '...' if len(name) > 30 else name for name in top_products_revenue['product_name']]
-        
-        revenue_fig.add_trace(go.Bar(
-            x=display_names,
-            y=top_products_revenue['revenue'],
-            marker=dict(
-                color=colors,
-                line=dict(width=1, color='#333')
-            ),            hovertemplate='<b>Product:</b> %{customdata}<br><b>Revenue:</b> ₹%{y:,.2f}<extra></extra>',
-            customdata=top_products_revenue['product_name'],
-            text=top_products_revenue['revenue'].apply(lambda x: f'₹{x:,.0f}'),
-            textposition='auto'
-        ))
-        revenue_fig.update_layout(
-            title='Top 5 Products by Revenue',
-            xaxis_title='Product',
-            yaxis_title='Revenue (₹)',
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            margin=dict(l=60, r=30, t=50, b=100),
-            hoverlabel=dict(
-                bgcolor="white",
-                font_size=14
-            ),
-            font=dict(
-                family="Poppins, sans-serif",
-                size=12
-            ),
-            xaxis=dict(tickangle=-45)
-        )
-
-        # Create quantity sold chart
-        quantity_fig = go.Figure()
-        
-        display_names_qty = [name[:30] + '...' if len(name) > 30 else name for name in top_products_quantity['product_name']]
-        
-        quantity_fig.add_trace(go.Bar(
-            x=display_names_qty,
-            y=top_products_quantity['quantity'],
-            marker=dict(
-                color=colors,
-                line=dict(width=1, color='#333'),
-                opacity=0.8
-            ),
-            hovertemplate='<b>Product:</b> %{customdata}<br><b>Quantity:</b> %{y}<extra></extra>',
-            customdata=top_products_quantity['product_name'],
-            text=top_products_quantity['quantity'].apply(lambda x: f'{int(x)}'),
-            textposition='auto'
-        ))
-        
-        quantity_fig.update_layout(
-            title='Top 5 Products by Quantity Sold',
-            xaxis_title='Product',
-            yaxis_title='Quantity Sold',
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            margin=dict(l=60, r=30, t=50, b=100),
-            hoverlabel=dict(
-                bgcolor="white",
-                font_size=14
-            ),
-            font=dict(
-                family="Poppins, sans-serif",
-                size=12
-            ),
-            xaxis=dict(tickangle=-45)
-        )
-          # Create category distribution chart
-        category_query = """
-        SELECT 
-            COALESCE(p.product_type, 'Uncategorized') as category,
-            SUM(oli.quantity * oli.price) as total_revenue,
-            COUNT(DISTINCT p.id) as product_count
-        FROM shopify_products p
-        LEFT JOIN shopify_order_line_items oli ON p.id = oli.product_id
-        LEFT JOIN shopify_orders o ON oli.order_id = o.id
-        WHERE o.financial_status != 'refunded' OR oli.id IS NULL
-        GROUP BY p.product_type
-        HAVING total_revenue > 0
-        ORDER BY total_revenue DESC
-        LIMIT 8
-        """
-        category_sales = pd.read_sql(category_query, conn)
-        
-        category_fig = go.Figure()
-        
-        category_fig.add_trace(go.Pie(
-            labels=category_sales['category'], 
-            values=category_sales['total_revenue'],
-            hole=0.4,
-            textinfo='label+percent',
-            marker=dict(
-                colors=colors * 2,  # Repeat colors if needed
-                line=dict(color='#FFFFFF', width=2)
-            ),
-            hovertemplate='<b>Category:</b> %{label}<br><b>Revenue:</b> ₹%{value:,.0f}<br><b>Percentage:</b> %{percent}<extra></extra>'
-        ))
-        
-        category_fig.update_layout(
-            title='Revenue Distribution by Product Category',
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=-0.2,
-                xanchor="center",
-                x=0.5
-            ),
-            margin=dict(l=20, r=20, t=50, b=20),
-            font=dict(
-                family="Poppins, sans-serif",
-                size=12
-            )
-        )
-        
-        # Create sales trend over time (last 30 days)
-        trend_query = """
-        SELECT 
-            DATE(o.created_at) as order_date,
-            SUM(o.total_price) as daily_revenue,
-            COUNT(*) as daily_orders
-        FROM shopify_orders o
-        WHERE o.financial_status != 'refunded'
-        AND DATE(o.created_at) >= DATE('now', '-30 days')
-        GROUP BY DATE(o.created_at)
-        ORDER BY order_date ASC
-        """
-        trend_data = pd.read_sql(trend_query, conn)
-        
-        sales_trend_fig = go.Figure()
-        
-        # Add revenue line
-        sales_trend_fig.add_trace(go.Scatter(
-            x=trend_data['order_date'],
-            y=trend_data['daily_revenue'],
-            mode='lines+markers',
-            name='Daily Revenue',
-            line=dict(color='#5d5fef', width=3),
-            marker=dict(size=8),
-            hovertemplate='<b>Date:</b> %{x}<br><b>Revenue:</b> ₹%{y:,.2f}<extra></extra>'
-        ))
-        
-        # Add orders line on secondary y-axis
-        sales_trend_fig.add_trace(go.Scatter(
-            x=trend_data['order_date'],
-            y=trend_data['daily_orders'],
-            mode='lines+markers',
-            name='Daily Orders',
-            line=dict(color='#ffa412', width=3),
-            marker=dict(size=8),
-            yaxis='y2',
-            hovertemplate='<b>Date:</b> %{x}<br><b>Orders:</b> %{y}<extra></extra>'
-        ))
-        sales_trend_fig.update_layout(
-            title='Sales Trend (Last 30 Days)',
-            xaxis_title='Date',
-            yaxis_title='Revenue (₹)',
-            yaxis2=dict(
-                title='Orders',
-                overlaying='y',
-                side='right'
-            ),
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=-0.3,
-                xanchor="center",
-                x=0.5
-            ),
-            margin=dict(l=60, r=60, t=50, b=80),
-            font=dict(
-                family="Poppins, sans-serif",
-                size=12
-            ),
-            hovermode="x unified"
-        )
-
-        # Convert figures to JSON for the template
-        plotly_revenue_graph = json.dumps(revenue_fig, cls=plotly.utils.PlotlyJSONEncoder)
-        plotly_quantity_graph = json.dumps(quantity_fig, cls=plotly.utils.PlotlyJSONEncoder) 
-        plotly_category_graph = json.dumps(category_fig, cls=plotly.utils.PlotlyJSONEncoder)
-        plotly_trend_graph = json.dumps(sales_trend_fig, cls=plotly.utils.PlotlyJSONEncoder)
+        product_count = panels.load('product_count').iloc[0]['product_count']
+        
+        # Get top products by revenue and by quantity
+        top_products_revenue = panels.load('top_revenue')
+        top_products_quantity = panels.load('top_quantity')
+        
+        # Get revenue by category and the sales trend (last 30 days unless a
+        # range was selected), with the comparison period if one was asked for
+        category_sales = panels.load('category')
+        trend_data = panels.load('trend')
+        compare_data = panels.load('trend_compare') if compare_window is not None else None
+        
+        # Chart JSON is cached per version of the panel it is drawn from (see
+        # chart_cache.py and PanelContext.panel_version()); charts built from
+        # degraded panels are not
+        def chart_version(name):
+            return None if budget.degraded else panels.panel_version(name)
+        
+        plotly_revenue_graph = cached_chart('dashboard.revenue', chart_version('top_revenue'), page_range,
+            lambda: dashboard_revenue_chart(top_products_revenue))
+        plotly_quantity_graph = cached_chart('dashboard.quantity', chart_version('top_quantity'), page_range,
+            lambda: dashboard_quantity_chart(top_products_quantity))
+        plotly_category_graph = cached_chart('dashboard.category', chart_version('category'), page_range,
+            lambda: dashboard_category_chart(category_sales))
+        plotly_trend_graph = cached_chart('dashboard.trend', chart_version('trend'), page_range,
+            lambda: dashboard_trend_chart(trend_data, trend_window, compare_data, compare_window))
+
+        # Sell-through, turnover and days on hand of every SKU over the last
+        # 90 days (see inventory_kpis.py)
+        sku_kpis = get_sku_kpis(conn, budget.data_version, panels.snapshot)
+        kpi_summary = summarize_kpis(sku_kpis)
 
         conn.close()        # Prepare data for dashboard.html template
         # Create dummy data for top skus by sales to match the expected variable names
@@ -944,25 +993,28 @@ def dashboard():
             for i, row in top_products_revenue.iterrows()
         ]
         
-        # Create dummy data for top skus by sellthrough to match the expected variable names
         top_skus_by_sellthrough = [
-            {"sku_code": row["product_name"].split(' - ')[0][:10], 
-             "sell_through_rate_last_90_day": f"{(row['quantity'] / 100) * 80:.1f}"} 
-            for i, row in top_products_quantity.iterrows()
+            {"sku_code": row["sku"] or row["product_name"].split(' - ')[0][:10],
+             "sell_through_rate_last_90_day": f"{row['sell_through']:.1f}"}
+            for i, row in top_sell_through(sku_kpis).iterrows()
         ]
         
+        if budget.degraded:
+            flash("Some panels took too long to load and are showing cached or placeholder data.", "warning")
+        
         return render_template('dashboard.html',
             total_sales=round(metrics['total_sales_value'] or 0, 2),
             total_units=int(metrics['total_units_sold'] or 0),
-            avg_sell_through=75.5,  # Placeholder value expected by the template
-            avg_turnover_ratio=3.2,  # Placeholder value expected by the template
-            avg_days_on_hand=45.8,  # Placeholder value expected by the template
+            avg_sell_through=kpi_summary['avg_sell_through'],
+            avg_turnover_ratio=kpi_summary['avg_turnover_ratio'],
+            avg_days_on_hand=kpi_summary['avg_days_on_hand'],
             top_skus_by_sales=top_skus_by_sales,
             top_skus_by_sellthrough=top_skus_by_sellthrough,
             plotly_sales_graph=plotly_revenue_graph,
             plotly_units_graph=plotly_quantity_graph,
             plotly_category_graph=plotly_category_graph,
             plotly_jewelry_trend_graph=plotly_trend_graph,
+            date_range=page_range.query_args(),
             user=session.get('user')
         )
         
@@ -973,24 +1025,252 @@ def dashboard():
                              user=session.get('user'),
                              db_message=f"Error: {str(e)}")
 
+def unavailable_chart(title):
+    """
+    Build the chart shown in place of a panel that could not be loaded
+    
+    Args:
+        title (str): Title of the chart it replaces
+    
+    Returns:
+        go.Figure: An empty chart with a note
+    """
+    fig = go.Figure()
+    fig.add_annotation(
+        text="This chart could not be loaded",
+        xref="paper", yref="paper",
+        x=0.5, y=0.5, showarrow=False
+    )
+    fig.update_layout(
+        title=title,
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)'
+    )
+    return fig
+
+def panel_chart(chart_id, results, name, page_range, title, build):
+    """
+    Get the JSON of a chart drawn from one concurrently loaded panel
+    
+    The chart is cached per version of its panel (see chart_cache.py) unless
+    the panel was degraded; a panel that failed gets unavailable_chart().
+    
+    Args:
+        chart_id (str): Chart name, unique across pages
+        results (PanelResults): The page's panels (see insight_panels.load_panels)
+        name (str): Panel the chart is drawn from
+        page_range (PageRange): Selected date range of the page
+        title (str): Chart title, for the unavailable chart
+        build (callable): build(frame) -> go.Figure
+    
+    Returns:
+        str: The chart JSON for the template
+    """
+    if name in results.errors:
+        return figure_json(unavailable_chart(title))
+    version = None if name in results.degraded else results.versions.get(name)
+    return cached_chart(chart_id, version, page_range, lambda: build(results.frame(name)))
+
+def panel_pager(endpoint, name, frame, args):
+    """
+    Build the page links of a paged panel (see insight_panels.py)
+    
+    The links keep the request's other query parameters, i.e. the date
+    range and the pages of the other panels.
+    
+    Args:
+        endpoint (str): Endpoint of the page
+        name (str): Paged panel name (its page cursor is <name>_page)
+        frame (pd.DataFrame): The loaded page of the panel, or None
+        args (Mapping): The request query parameters (request.args)
+    
+    Returns:
+        dict or None: label, previous_url and next_url (None at either
+            end), or None when the panel failed or has a single page
+    """
+    page = frame.attrs.get('page') if frame is not None else None
+    if not page or not (page['previous'] or page['next']):
+        return None
+    
+    def page_url(cursor):
+        if cursor is None:
+            return None
+        query = {key: value for key, value in args.items() if key != f'{name}_page'}
+        query[f'{name}_page'] = cursor
+        return url_for(endpoint, **query)
+    
+    return {
+        'label': f"{page['total_rows']:,} items",
+        'previous_url': page_url(page['previous']),
+        'next_url': page_url(page['next']),
+    }
+
+def inventory_status_chart(product_status):
+    """
+    Build the product status chart of the inventory insights page
+    
+    Args:
+        product_status (pd.DataFrame): The status panel
+    
+    Returns:
+        go.Figure: The chart
+    """
+    # 1. Product Status Distribution
+    colors = ['#10b981', '#ef4444', '#f59e0b', '#8b5cf6']
+    status_fig = go.Figure(data=[
+        go.Pie(
+            labels=product_status['status'],
+            values=product_status['count'],
+            hole=.4,
+            textinfo='label+percent',
+            textposition='outside',
+            marker=dict(
+                colors=colors[:len(product_status)],
+                line=dict(color='#FFFFFF', width=2)
+            ),
+            hovertemplate='<b>Status:</b> %{label}<br><b>Products:</b> %{value}<br><b>Percentage:</b> %{percent}<extra></extra>'
+        )
+    ])
+    
+    status_fig.update_layout(
+        title='Product Status Distribution',
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        margin=dict(l=20, r=20, t=80, b=20),
+        font=dict(family="Poppins, sans-serif"),
+        legend=dict(orientation="h", yanchor="bottom", y=-0.15, xanchor="center", x=0.5)
+    )
+    
+    return status_fig
+
+def inventory_category_chart(category_performance, windows):
+    """
+    Build the category performance chart of the inventory insights page
+    
+    Args:
+        category_performance (pd.DataFrame): The category_performance panel
+        windows (dict): The page windows (see insight_panels.inventory_windows)
+    
+    Returns:
+        go.Figure: The chart
+    """
+    # 2. Category Performance Chart
+    category_fig = go.Figure()
+    category_fig.add_trace(go.Bar(
+        x=category_performance['category'],
+        y=category_performance['total_revenue'],
+        name='Revenue',
+        marker_color='#5d5fef',
+        yaxis='y',
+        offsetgroup=1
+    ))
+    category_fig.add_trace(go.Bar(
+        x=category_performance['category'],
+        y=category_performance['product_count'],
+        name='Product Count',
+        marker_color='#ffa412',
+        yaxis='y2',
+        offsetgroup=2
+    ))
+    
+    category_fig.update_layout(
+        title=f"Category Performance ({windows['performance'].label})",
+        xaxis_title='Category',
+        yaxis=dict(title='Revenue (₹)', side='left'),
+        yaxis2=dict(title='Product Count', side='right', overlaying='y'),
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        barmode='group',
+        legend=dict(orientation="h", yanchor="bottom", y=-0.2, xanchor="center", x=0.5)
+    )
+    
+    return category_fig
+
+def inventory_velocity_chart(velocity_data, windows):
+    """
+    Build the sales velocity chart of the inventory insights page
+    
+    Args:
+        velocity_data (pd.DataFrame): The velocity panel
+        windows (dict): The page windows (see insight_panels.inventory_windows)
+    
+    Returns:
+        go.Figure: The chart
+    """
+    # 3. Sales Velocity Chart (Products by sales in the recent vs the comparison period)
+    if not velocity_data.empty:
+        velocity_fig = go.Figure()
+        
+        # Truncate long product names
+        display_names = [name[:25] + '...' if len(name) > 25 else name for name in velocity_data['title']]
+        
+        velocity_fig.add_trace(go.Bar(
+            x=display_names,
+            y=velocity_data['prev_30_days'],
+            name=windows['velocity_compare'].label,
+            marker_color='#94a3b8'
+        ))
+        velocity_fig.add_trace(go.Bar(
+            x=display_names,
+            y=velocity_data['last_30_days'],
+            name=windows['recent'].label,
+            marker_color='#3cd856'
+        ))
+        
+        velocity_fig.update_layout(
+            title='Sales Velocity Comparison',
+            xaxis_title='Product',
+            yaxis_title='Units Sold',
+            plot_bgcolor='rgba(0,0,0,0)',
+            paper_bgcolor='rgba(0,0,0,0)',
+            barmode='group',
+            xaxis=dict(tickangle=-45),
+            margin=dict(b=100)
+        )
+    else:
+        # Create empty chart if no data
+        velocity_fig = go.Figure()
+        velocity_fig.add_annotation(
+            text="No sufficient sales data for velocity analysis",
+            xref="paper", yref="paper",
+            x=0.5, y=0.5, showarrow=False
+        )
+        velocity_fig.update_layout(
+            title='Sales Velocity Comparison',
+            plot_bgcolor='rgba(0,0,0,0)',
+            paper_bgcolor='rgba(0,0,0,0)'
+        )
+    
+    return velocity_fig
+
 @app.route('/inventory_insights')
 def inventory_insights():
     """
     Inventory insights route
     
     Displays inventory analysis including:
-    - Dead stock identification (products with no recent sales)
+    - Dead stock identification (variants with no sales in the window, paged)
     - Top performing products 
     - Variant analysis
     - New product performance
+    - Demand forecasts (sales velocity, trend and the next 14 days)
     - Interactive charts for product status, category performance, and sales velocity
     
     This route:
     1. Verifies user is logged in
     2. Checks database exists and has data
-    3. Queries database for inventory metrics
+    3. Queries database for inventory metrics, running the panels
+       concurrently (a panel that fails leaves an empty table or chart)
     4. Creates visualizations for inventory analysis
     5. Renders template with inventory insights
+    
+    Query parameters (see date_ranges.py):
+    - start / end: Days covered by the windowed panels (default: each
+      panel's own window, the last 30 or 90 days)
+    - compare / compare_start / compare_end: Period the sales velocity is
+      compared against (default: the period just before)
+    - dead_stock_page / top_performers_page: Page cursor of the dead stock
+      and top performers tables (default: the first page)
     """
     if 'user' not in session:
         flash("Please login to access inventory insights.", "warning")
@@ -1004,255 +1284,210 @@ def inventory_insights():
                              user=session.get('user'),
                              db_message=db_message)
     
-    # Connect to database
-    conn = get_db_connection()
+    # Selected date range (bound into the windowed queries)
+    page_range, range_error = parse_page_range(request.args)
+    if range_error:
+        flash(f"{range_error}. Showing the default periods.", "warning")
+    windows = inventory_windows(page_range)
     
-    try:        # Get products with no recent sales (potential dead stock)
-        dead_stock_query = """
-        SELECT 
-            p.title,
-            v.sku,
-            p.product_type,
-            v.price,
-            p.status,
-            COALESCE(SUM(oli.quantity), 0) as total_sold
-        FROM shopify_products p
-        LEFT JOIN shopify_variants v ON p.id = v.product_id
-        LEFT JOIN shopify_order_line_items oli ON v.id = oli.variant_id
-        LEFT JOIN shopify_orders o ON oli.order_id = o.id AND o.created_at >= DATE('now', '-90 days')
-        WHERE p.status = 'active'
-        GROUP BY p.id, v.id
-        HAVING total_sold = 0
-        ORDER BY p.created_at DESC
-        LIMIT 10
-        """
-        dead_stock_items = pd.read_sql(dead_stock_query, conn)
-          # Get top performing products (high sales)
-        top_performers_query = """
-        SELECT 
-            p.title,
-            v.sku,
-            p.product_type,
-            v.price,
-            SUM(oli.quantity) as total_sold,
-            SUM(oli.quantity * oli.price) as total_revenue
-        FROM shopify_products p
-        JOIN shopify_variants v ON p.id = v.product_id
-        JOIN shopify_order_line_items oli ON v.id = oli.variant_id
-        JOIN shopify_orders o ON oli.order_id = o.id
-        WHERE o.financial_status != 'refunded'
-        AND o.created_at >= DATE('now', '-90 days')
-        GROUP BY p.id, v.id
-        ORDER BY total_revenue DESC
-        LIMIT 10
-        """
-        top_performers = pd.read_sql(top_performers_query, conn)
-        
-        # Get products with single variants vs multiple variants
-        variant_analysis_query = """
-        SELECT 
-            p.title,
-            p.product_type,
-            COUNT(v.id) as variant_count,
-            SUM(COALESCE(oli.quantity, 0)) as total_sold
-        FROM shopify_products p
-        LEFT JOIN shopify_variants v ON p.id = v.product_id
-        LEFT JOIN shopify_order_line_items oli ON v.id = oli.variant_id
-        LEFT JOIN shopify_orders o ON oli.order_id = o.id AND o.created_at >= DATE('now', '-90 days')
-        WHERE p.status = 'active'
-        GROUP BY p.id
-        ORDER BY variant_count DESC
-        LIMIT 15
-        """
-        variant_analysis = pd.read_sql(variant_analysis_query, conn)
-          # Get recently added products
-        new_products_query = """
-        SELECT 
-            p.title,
-            v.sku,
-            p.product_type,
-            v.price,
-            p.created_at,
-            COALESCE(SUM(oli.quantity), 0) as sales_since_launch
-        FROM shopify_products p
-        LEFT JOIN shopify_variants v ON p.id = v.product_id
-        LEFT JOIN shopify_order_line_items oli ON v.id = oli.variant_id
-        LEFT JOIN shopify_orders o ON oli.order_id = o.id
-        WHERE p.created_at >= DATE('now', '-30 days')
-        GROUP BY p.id, v.id
-        ORDER BY p.created_at DESC
-        LIMIT 10
-        """
-        new_products = pd.read_sql(new_products_query, conn)
+    # Panels run concurrently, each on a pooled read-only connection, within
+    # the page's time budget (see insight_panels.py)
+    results = load_panels('inventory_insights', page_panels('inventory_insights'), page_range,
+                          page_requests('inventory_insights', request.args))
+    
+    try:
+        # Get one page of the variants with no recent sales (potential dead stock)
+        dead_stock_items = results.frame('dead_stock')
+        dead_stock_pager = panel_pager('inventory_insights', 'dead_stock', results.frames.get('dead_stock'), request.args)
         
-        # Create charts
-        # 1. Product Status Distribution
-        status_query = """
-        SELECT 
-            status,
-            COUNT(*) as count
-        FROM shopify_products
-        GROUP BY status
-        """
-        product_status = pd.read_sql(status_query, conn)
-        
-        colors = ['#10b981', '#ef4444', '#f59e0b', '#8b5cf6']
-        status_fig = go.Figure(data=[
-            go.Pie(
-                labels=product_status['status'],
-                values=product_status['count'],
-                hole=.4,
-                textinfo='label+percent',
-                textposition='outside',
-                marker=dict(
-                    colors=colors[:len(product_status)],
-                    line=dict(color='#FFFFFF', width=2)
-                ),
-                hovertemplate='<b>Status:</b> %{label}<br><b>Products:</b> %{value}<br><b>Percentage:</b> %{percent}<extra></extra>'
-            )
-        ])
+        # Get top performing products (high sales)
+        top_performers = results.frame('top_performers')
+        top_performers_pager = panel_pager('inventory_insights', 'top_performers', results.frames.get('top_performers'), request.args)
         
-        status_fig.update_layout(
-            title='Product Status Distribution',
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            margin=dict(l=20, r=20, t=80, b=20),
-            font=dict(family="Poppins, sans-serif"),
-            legend=dict(orientation="h", yanchor="bottom", y=-0.15, xanchor="center", x=0.5)
-        )
+        # Get products with single variants vs multiple variants
+        variant_analysis = results.frame('variant_analysis')
         
-        # 2. Category Performance Chart
-        category_performance_query = """
-        SELECT 
-            COALESCE(p.product_type, 'Uncategorized') as category,
-            COUNT(DISTINCT p.id) as product_count,
-            SUM(COALESCE(oli.quantity, 0)) as total_sold,
-            SUM(COALESCE(oli.quantity * oli.price, 0)) as total_revenue
-        FROM shopify_products p
-        LEFT JOIN shopify_order_line_items oli ON p.id = oli.product_id
-        LEFT JOIN shopify_orders o ON oli.order_id = o.id AND o.created_at >= DATE('now', '-90 days')
-        WHERE p.status = 'active'
-        GROUP BY p.product_type
-        ORDER BY total_revenue DESC
-        LIMIT 8
-        """
-        category_performance = pd.read_sql(category_performance_query, conn)
+        # Get recently added products
+        new_products = results.frame('new_products')
         
-        category_fig = go.Figure()
-        category_fig.add_trace(go.Bar(
-            x=category_performance['category'],
-            y=category_performance['total_revenue'],
-            name='Revenue',
-            marker_color='#5d5fef',
-            yaxis='y',
-            offsetgroup=1
-        ))
-        category_fig.add_trace(go.Bar(
-            x=category_performance['category'],
-            y=category_performance['product_count'],
-            name='Product Count',
-            marker_color='#ffa412',
-            yaxis='y2',
-            offsetgroup=2
-        ))
+        # Get the variants with the highest forecast demand (see demand_forecast.py);
+        # untracked stock and cover show as blanks
+        demand_forecast = results.frame('demand_forecast')
+        demand_forecast = demand_forecast.astype(object).where(demand_forecast.notna(), None)
         
-        category_fig.update_layout(
-            title='Category Performance (Last 90 Days)',
-            xaxis_title='Category',
-            yaxis=dict(title='Revenue (₹)', side='left'),
-            yaxis2=dict(title='Product Count', side='right', overlaying='y'),
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            barmode='group',
-            legend=dict(orientation="h", yanchor="bottom", y=-0.2, xanchor="center", x=0.5)
-        )
+        # Create charts (cached per data version, see chart_cache.py)
+        status_json = panel_chart('inventory.status', results, 'status', page_range,
+            'Product Status Distribution', inventory_status_chart)
+        category_json = panel_chart('inventory.category', results, 'category_performance', page_range,
+            'Category Performance', lambda frame: inventory_category_chart(frame, windows))
+        velocity_json = panel_chart('inventory.velocity', results, 'velocity', page_range,
+            'Sales Velocity Comparison', lambda frame: inventory_velocity_chart(frame, windows))
         
-        # 3. Sales Velocity Chart (Products by sales in last 30 vs 60 days)
-        velocity_query = """
-        SELECT 
-            p.title,
-            SUM(CASE WHEN o.created_at >= DATE('now', '-30 days') THEN oli.quantity ELSE 0 END) as last_30_days,
-            SUM(CASE WHEN o.created_at >= DATE('now', '-60 days') AND o.created_at < DATE('now', '-30 days') THEN oli.quantity ELSE 0 END) as prev_30_days
-        FROM shopify_products p
-        JOIN shopify_order_line_items oli ON p.id = oli.product_id
-        JOIN shopify_orders o ON oli.order_id = o.id
-        WHERE o.financial_status != 'refunded'
-        AND o.created_at >= DATE('now', '-60 days')
-        GROUP BY p.id
-        HAVING (last_30_days + prev_30_days) > 5
-        ORDER BY (last_30_days + prev_30_days) DESC
-        LIMIT 10
-        """
-        velocity_data = pd.read_sql(velocity_query, conn)
-        
-        if not velocity_data.empty:
-            velocity_fig = go.Figure()
-            
-            # Truncate long product names
-            display_names = [name[:25] + '...' if len(name) > 25 else name for name in velocity_data['title']]
-            
-            velocity_fig.add_trace(go.Bar(
-                x=display_names,
-                y=velocity_data['prev_30_days'],
-                name='31-60 Days Ago',
-                marker_color='#94a3b8'
-            ))
-            velocity_fig.add_trace(go.Bar(
-                x=display_names,
-                y=velocity_data['last_30_days'],
-                name='Last 30 Days',
-                marker_color='#3cd856'
-            ))
-            
-            velocity_fig.update_layout(
-                title='Sales Velocity Comparison',
-                xaxis_title='Product',
-                yaxis_title='Units Sold',
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)',
-                barmode='group',
-                xaxis=dict(tickangle=-45),
-                margin=dict(b=100)
-            )
-        else:
-            # Create empty chart if no data
-            velocity_fig = go.Figure()
-            velocity_fig.add_annotation(
-                text="No sufficient sales data for velocity analysis",
-                xref="paper", yref="paper",
-                x=0.5, y=0.5, showarrow=False
-            )
-            velocity_fig.update_layout(
-                title='Sales Velocity Comparison',
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)'
-            )
-        
-        # Convert figures to JSON for template
-        status_json = json.dumps(status_fig, cls=plotly.utils.PlotlyJSONEncoder)
-        category_json = json.dumps(category_fig, cls=plotly.utils.PlotlyJSONEncoder)
-        velocity_json = json.dumps(velocity_fig, cls=plotly.utils.PlotlyJSONEncoder)
-        
-        conn.close()
+        if results.errors:
+            flash("Some panels could not be loaded.", "warning")
+        if results.degraded:
+            flash("Some panels took too long to load and are showing cached or placeholder data.", "warning")
         
         return render_template('inventory_insights.html',
             dead_stock_items=dead_stock_items.to_dict(orient='records'),
+            dead_stock_pager=dead_stock_pager,
             top_performers=top_performers.to_dict(orient='records'),
+            top_performers_pager=top_performers_pager,
             variant_analysis=variant_analysis.to_dict(orient='records'),
             new_products=new_products.to_dict(orient='records'),
+            demand_forecast=demand_forecast.to_dict(orient='records'),
             product_status_chart=status_json,
             category_performance_chart=category_json,
             sales_velocity_chart=velocity_json,
+            date_range=page_range.query_args(),
             user=session.get('user')
         )
         
     except Exception as e:
         flash(f"Error loading inventory insights: {str(e)}", "error")
-        conn.close()
         return render_template('inventory_insights_no_data.html', 
                              user=session.get('user'),
                              db_message=f"Error: {str(e)}")
 
+def sales_growth_chart(growth_analysis, windows):
+    """
+    Build the revenue growth chart of the sales insights page
+    
+    Args:
+        growth_analysis (pd.DataFrame): The growth panel
+        windows (dict): The page windows (see insight_panels.sales_windows)
+    
+    Returns:
+        go.Figure: The chart
+    """
+    if not growth_analysis.empty:
+        growth_fig = go.Figure()
+        
+        # Truncate long product names
+        display_names = [name[:20] + '...' if len(name) > 20 else name for name in growth_analysis['title']]
+        
+        growth_fig.add_trace(go.Bar(
+            x=display_names,
+            y=growth_analysis['prev_revenue'],
+            name=windows['growth_compare'].label,
+            marker_color='#94a3b8'
+        ))
+        growth_fig.add_trace(go.Bar(
+            x=display_names,
+            y=growth_analysis['recent_revenue'],
+            name=windows['window'].label,
+            marker_color='#3cd856'
+        ))
+        
+        growth_fig.update_layout(                title='Revenue Growth Comparison',
+            xaxis_title='Product',
+            yaxis_title='Revenue (₹)',
+            plot_bgcolor='rgba(0,0,0,0)',
+            paper_bgcolor='rgba(0,0,0,0)',
+            barmode='group',
+            xaxis=dict(tickangle=-45),
+            margin=dict(b=100)
+        )
+    else:
+        growth_fig = go.Figure()
+        growth_fig.add_annotation(
+            text="No sufficient data for growth analysis",
+            xref="paper", yref="paper",
+            x=0.5, y=0.5, showarrow=False
+        )
+        growth_fig.update_layout(title='Revenue Growth Comparison')
+    
+    return growth_fig
+
+def sales_category_chart(category_trends, windows):
+    """
+    Build the category performance chart of the sales insights page
+    
+    Args:
+        category_trends (pd.DataFrame): The category trends panel
+        windows (dict): The page windows (see insight_panels.sales_windows)
+    
+    Returns:
+        go.Figure: The chart
+    """
+    window = windows['window']
+    colors = ['#5d5fef', '#4079ed', '#3cd856', '#a700ff', '#ffa412']
+    
+    if not category_trends.empty:
+        category_fig = go.Figure()
+        
+        category_fig.add_trace(go.Bar(
+            x=category_trends['category'],
+            y=category_trends['last_30_days'],
+            marker_color=colors[0],
+            name=f'{window.label} Revenue'
+        ))
+        
+        category_fig.update_layout(                title=f'Category Performance ({window.label})',
+            xaxis_title='Category',
+            yaxis_title='Revenue (₹)',
+            plot_bgcolor='rgba(0,0,0,0)',
+            paper_bgcolor='rgba(0,0,0,0)',
+            xaxis=dict(tickangle=-45)
+        )
+    else:
+        category_fig = go.Figure()
+        category_fig.add_annotation(
+            text="No category data available",
+            xref="paper", yref="paper",
+            x=0.5, y=0.5, showarrow=False
+        )
+        category_fig.update_layout(title='Category Performance')
+    
+    return category_fig
+
+def sales_hourly_chart(hourly_sales, windows):
+    """
+    Build the hourly sales pattern chart of the sales insights page
+    
+    Args:
+        hourly_sales (pd.DataFrame): The hourly sales panel
+        windows (dict): The page windows (see insight_panels.sales_windows)
+    
+    Returns:
+        go.Figure: The chart
+    """
+    if not hourly_sales.empty:
+        hourly_fig = go.Figure()
+        
+        hourly_fig.add_trace(go.Scatter(
+            x=[f"{int(h):02d}:00" for h in hourly_sales['hour']],
+            y=hourly_sales['revenue'],
+            mode='lines+markers',
+            name='Hourly Revenue',
+            line=dict(color='#5d5fef', width=3),
+            marker=dict(size=8)
+        ))
+        
+        hourly_fig.update_layout(                title=f"Sales Pattern by Hour of Day ({windows['window'].label})",
+            xaxis_title='Hour of Day',
+            yaxis_title='Revenue (₹)',
+            plot_bgcolor='rgba(0,0,0,0)',
+            paper_bgcolor='rgba(0,0,0,0)'
+        )
+    else:
+        hourly_fig = go.Figure()
+        hourly_fig.add_annotation(
+            text="No hourly sales data available",
+            xref="paper", yref="paper",
+            x=0.5, y=0.5, showarrow=False
+        )
+        hourly_fig.update_layout(title='Sales Pattern by Hour')
+    
+    return hourly_fig
+
+# Charts of the sales insights page, by the panel they are drawn from
+SALES_CHARTS = {
+    'growth': sales_growth_chart,
+    'category_trends': sales_category_chart,
+    'hourly_sales': sales_hourly_chart,
+}
+
 @app.route('/sales_insights')
 def sales_insights():
     """
@@ -1260,7 +1495,7 @@ def sales_insights():
     
     Displays detailed sales analysis including:
     - Revenue growth comparison between time periods
-    - Low performing products identification
+    - Low performing products identification (every variant, paged)
     - High-value orders analysis
     - Customer purchase patterns and repeat customer data
     - Product category trends and performance
@@ -1269,9 +1504,23 @@ def sales_insights():
     This route:
     1. Verifies user is logged in
     2. Checks database exists and has data
-    3. Queries database for sales metrics and trends
-    4. Creates visualizations for sales performance
-    5. Renders template with sales insights data
+    3. Streams the page shell (layout, range form, empty panel slots) at once
+    4. Loads every panel concurrently (see insight_panels.py) and streams
+       each one, with its chart, as soon as it is ready; a small script
+       moves it into its slot
+    5. Closes the page when the last panel has been sent
+    
+    A slow or failing panel only delays or replaces its own slot; the rest
+    of the page is usable while it loads.
+    
+    Query parameters (see date_ranges.py):
+    - start / end: Days covered by the windowed panels (default: the last
+      30 days)
+    - compare / compare_start / compare_end: Period the revenue growth is
+      compared against (default: the period just before)
+    - low_performers_page / high_value_orders_page / customer_patterns_page:
+      Page cursor of the low performers, high-value orders and repeat
+      customers tables (default: the first page)
     """
     if 'user' not in session:
         flash("Please login to access sales insights.", "warning")
@@ -1285,245 +1534,43 @@ def sales_insights():
                              user=session.get('user'),
                              db_message=db_message)
     
-    # Connect to database
-    conn = get_db_connection()
-    
-    try:        # 1. Revenue Growth Analysis (comparing periods)
-        growth_query = """
-        SELECT 
-            p.title,
-            v.sku,
-            p.product_type,
-            SUM(CASE WHEN o.created_at >= DATE('now', '-30 days') THEN oli.quantity * oli.price ELSE 0 END) as recent_revenue,
-            SUM(CASE WHEN o.created_at >= DATE('now', '-60 days') AND o.created_at < DATE('now', '-30 days') THEN oli.quantity * oli.price ELSE 0 END) as prev_revenue
-        FROM shopify_products p
-        JOIN shopify_variants v ON p.id = v.product_id
-        JOIN shopify_order_line_items oli ON v.id = oli.variant_id
-        JOIN shopify_orders o ON oli.order_id = o.id
-        WHERE o.financial_status != 'refunded'
-        AND o.created_at >= DATE('now', '-60 days')
-        GROUP BY p.id, v.id
-        HAVING prev_revenue > 0
-        ORDER BY (recent_revenue - prev_revenue) DESC
-        LIMIT 10
-        """
-        growth_analysis = pd.read_sql(growth_query, conn)
-        
-        # Calculate growth rate
-        if not growth_analysis.empty:
-            growth_analysis['growth_rate'] = ((growth_analysis['recent_revenue'] - growth_analysis['prev_revenue']) / growth_analysis['prev_revenue'] * 100).round(2)
-          # 2. Low Performing Products
-        low_performers_query = """
-        SELECT 
-            p.title,
-            v.sku,
-            p.product_type,
-            v.price,
-            COALESCE(SUM(oli.quantity), 0) as total_sold,
-            COALESCE(SUM(oli.quantity * oli.price), 0) as total_revenue,
-            p.created_at
-        FROM shopify_products p
-        LEFT JOIN shopify_variants v ON p.id = v.product_id
-        LEFT JOIN shopify_order_line_items oli ON v.id = oli.variant_id
-        LEFT JOIN shopify_orders o ON oli.order_id = o.id AND o.created_at >= DATE('now', '-90 days')
-        WHERE p.status = 'active'
-        AND p.created_at <= DATE('now', '-30 days')  -- Exclude very new products
-        GROUP BY p.id, v.id
-        ORDER BY total_revenue ASC
-        LIMIT 10
-        """
-        low_performers = pd.read_sql(low_performers_query, conn)
-        
-        # 3. High-Value Orders Analysis
-        high_value_orders_query = """
-        SELECT 
-            o.id as order_id,
-            o.total_price,
-            o.created_at,
-            COUNT(oli.id) as item_count,
-            o.email
-        FROM shopify_orders o
-        JOIN shopify_order_line_items oli ON o.id = oli.order_id
-        WHERE o.financial_status != 'refunded'
-        AND o.created_at >= DATE('now', '-30 days')
-        GROUP BY o.id
-        ORDER BY o.total_price DESC
-        LIMIT 10
-        """
-        high_value_orders = pd.read_sql(high_value_orders_query, conn)
-          # 4. Customer Purchase Patterns
-        customer_patterns_query = """
-        SELECT 
-            o.email,
-            COUNT(DISTINCT o.id) as order_count,
-            SUM(o.total_price) as total_spent,
-            AVG(o.total_price) as avg_order_value,
-            MIN(o.created_at) as first_order,
-            MAX(o.created_at) as last_order
-        FROM shopify_orders o
-        WHERE o.financial_status != 'refunded'
-        AND o.email IS NOT NULL
-        AND o.email != ''
-        GROUP BY o.email
-        HAVING order_count > 1
-        ORDER BY total_spent DESC
-        LIMIT 10
-        """
-        repeat_customers = pd.read_sql(customer_patterns_query, conn)
-        
-        # 5. Product Category Trends
-        category_trends_query = """
-        SELECT 
-            COALESCE(p.product_type, 'Uncategorized') as category,
-            SUM(CASE WHEN o.created_at >= DATE('now', '-7 days') THEN oli.quantity * oli.price ELSE 0 END) as last_7_days,
-            SUM(CASE WHEN o.created_at >= DATE('now', '-14 days') AND o.created_at < DATE('now', '-7 days') THEN oli.quantity * oli.price ELSE 0 END) as prev_7_days,
-            SUM(CASE WHEN o.created_at >= DATE('now', '-30 days') THEN oli.quantity * oli.price ELSE 0 END) as last_30_days
-        FROM shopify_products p
-        JOIN shopify_order_line_items oli ON p.id = oli.product_id
-        JOIN shopify_orders o ON oli.order_id = o.id
-        WHERE o.financial_status != 'refunded'
-        AND o.created_at >= DATE('now', '-30 days')
-        GROUP BY p.product_type
-        ORDER BY last_30_days DESC
-        """
-        category_trends = pd.read_sql(category_trends_query, conn)
-        
-        # 6. Seasonal/Time-based Analysis
-        hourly_sales_query = """
-        SELECT 
-            strftime('%H', o.created_at) as hour,
-            COUNT(*) as order_count,
-            SUM(o.total_price) as revenue
-        FROM shopify_orders o
-        WHERE o.financial_status != 'refunded'
-        AND o.created_at >= DATE('now', '-30 days')
-        GROUP BY strftime('%H', o.created_at)
-        ORDER BY hour
-        """
-        hourly_sales = pd.read_sql(hourly_sales_query, conn)
-        
-        # Create visualization data
-        colors = ['#5d5fef', '#4079ed', '#3cd856', '#a700ff', '#ffa412']
-        
-        # 1. Growth trend chart
-        if not growth_analysis.empty:
-            growth_fig = go.Figure()
-            
-            # Truncate long product names
-            display_names = [name[:20] + '...' if len(name) > 20 else name for name in growth_analysis['title']]
-            
-            growth_fig.add_trace(go.Bar(
-                x=display_names,
-                y=growth_analysis['prev_revenue'],
-                name='Previous 30 Days',
-                marker_color='#94a3b8'
-            ))
-            growth_fig.add_trace(go.Bar(
-                x=display_names,
-                y=growth_analysis['recent_revenue'],
-                name='Last 30 Days',
-                marker_color='#3cd856'
-            ))
-            
-            growth_fig.update_layout(                title='Revenue Growth Comparison',
-                xaxis_title='Product',
-                yaxis_title='Revenue (₹)',
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)',
-                barmode='group',
-                xaxis=dict(tickangle=-45),
-                margin=dict(b=100)
-            )
-        else:
-            growth_fig = go.Figure()
-            growth_fig.add_annotation(
-                text="No sufficient data for growth analysis",
-                xref="paper", yref="paper",
-                x=0.5, y=0.5, showarrow=False
-            )
-            growth_fig.update_layout(title='Revenue Growth Comparison')
-        
-        # 2. Category performance chart
-        if not category_trends.empty:
-            category_fig = go.Figure()
-            
-            category_fig.add_trace(go.Bar(
-                x=category_trends['category'],
-                y=category_trends['last_30_days'],
-                marker_color=colors[0],
-                name='Last 30 Days Revenue'
-            ))
-            
-            category_fig.update_layout(                title='Category Performance (Last 30 Days)',
-                xaxis_title='Category',
-                yaxis_title='Revenue (₹)',
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)',
-                xaxis=dict(tickangle=-45)
-            )
-        else:
-            category_fig = go.Figure()
-            category_fig.add_annotation(
-                text="No category data available",
-                xref="paper", yref="paper",
-                x=0.5, y=0.5, showarrow=False
-            )
-            category_fig.update_layout(title='Category Performance')
-        
-        # 3. Hourly sales pattern
-        if not hourly_sales.empty:
-            hourly_fig = go.Figure()
-            
-            hourly_fig.add_trace(go.Scatter(
-                x=[f"{int(h):02d}:00" for h in hourly_sales['hour']],
-                y=hourly_sales['revenue'],
-                mode='lines+markers',
-                name='Hourly Revenue',
-                line=dict(color='#5d5fef', width=3),
-                marker=dict(size=8)
-            ))
-            
-            hourly_fig.update_layout(                title='Sales Pattern by Hour of Day (Last 30 Days)',
-                xaxis_title='Hour of Day',
-                yaxis_title='Revenue (₹)',
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)'
-            )
-        else:
-            hourly_fig = go.Figure()
-            hourly_fig.add_annotation(
-                text="No hourly sales data available",
-                xref="paper", yref="paper",
-                x=0.5, y=0.5, showarrow=False
-            )
-            hourly_fig.update_layout(title='Sales Pattern by Hour')
-        
-        # Convert figures to JSON for template
-        growth_json = json.dumps(growth_fig, cls=plotly.utils.PlotlyJSONEncoder)
-        category_json = json.dumps(category_fig, cls=plotly.utils.PlotlyJSONEncoder)
-        hourly_json = json.dumps(hourly_fig, cls=plotly.utils.PlotlyJSONEncoder)
-        
-        conn.close()
-        return render_template('sales_insights.html',
-            title="Sales Insights",
-            growth_analysis=growth_analysis.to_dict(orient='records'),
-            low_performers=low_performers.to_dict(orient='records'),
-            high_value_orders=high_value_orders.to_dict(orient='records'),
-            repeat_customers=repeat_customers.to_dict(orient='records'),
-            category_trends=category_trends.to_dict(orient='records'),
-            hourly_sales=hourly_sales.to_dict(orient='records'),
-            growth_chart=growth_json,
-            category_chart=category_json,
-            hourly_chart=hourly_json,
-            user=session.get('user')
-        )
-        
-    except Exception as e:
-        flash(f"Error loading sales insights: {str(e)}", "error")
-        conn.close()
-        return render_template('sales_insights_no_data.html', 
-                             user=session.get('user'),
-                             db_message=f"Error: {str(e)}")
+    # Selected date range (bound into the windowed queries)
+    page_range, range_error = parse_page_range(request.args)
+    if range_error:
+        flash(f"{range_error}. Showing the default periods.", "warning")
+    windows = sales_windows(page_range)
+    pages = page_requests('sales_insights', request.args)
+    
+    def panel_stream():
+        # Panels in the order they finish, rendered by the template as they arrive
+        for name, frame, degraded, error, version in load_panels_as_completed('sales_insights', page_panels('sales_insights'), page_range, pages):
+            chart = None
+            if frame is not None and name in SALES_CHARTS:
+                try:
+                    # Cached per panel version unless the panel was degraded (see chart_cache.py)
+                    chart = cached_chart(f'sales_insights.{name}', None if degraded else version, page_range,
+                        lambda: SALES_CHARTS[name](frame, windows))
+                except Exception as e:
+                    print(f"WARNING: Chart of panel {name} failed: {e}")
+            yield {
+                'name': name,
+                'rows': frame.to_dict(orient='records') if frame is not None else [],
+                'pager': panel_pager('sales_insights', name, frame, request.args),
+                'chart': chart,
+                'degraded': degraded,
+                'error': error,
+            }
+    
+    response = Response(stream_template('sales_insights.html',
+        title="Sales Insights",
+        panel_stream=panel_stream(),
+        range_labels={'last_7': windows['last_week'].label, 'prev_7': windows['previous_week'].label, 'last_30': windows['window'].label},
+        date_range=page_range.query_args(),
+        user=session.get('user')
+    ))
+    # Ask proxies not to buffer the stream, so panels reach the browser as they finish
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/settings')
 def settings():
@@ -1541,6 +1588,228 @@ def settings():
     flash("Settings functionality coming soon!", "info")
     return redirect(url_for('dashboard'))
 
+@app.route('/query_stats')
+def query_stats():
+    """
+    Query budget statistics route
+    
+    Returns, as JSON, how often each analytics query ran, how often it hit
+    its route's time budget, and whether stale data or a placeholder was
+    served instead, together with the hit/miss counters and memory use of
+    the query result cache and the chart cache (counters are per server
+    process).
+    """
+    if 'user' not in session:
+        flash("Please login to view query statistics.", "warning")
+        return redirect(url_for('login', next=request.path))
+    
+    return jsonify({
+        'queries': get_query_stats(),
+        'cache': get_cache_stats(),
+        'charts': get_chart_cache_stats()
+    })
+
+# -------------------------------------------------------------------------
+# VERSIONED ASSETS
+# -------------------------------------------------------------------------
+# Assets generated by the application (e.g. the shared chart layouts, see
+# chart_layouts.py) and third-party assets vendored under static/ (e.g.
+# the Plotly bundle, see static_assets.py). Their URLs carry a content
+# version, so browsers keep them for good and only download them again
+# after they change.
+# -------------------------------------------------------------------------
+
+# Versioned asset responses never change
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Vendored assets: logical name -> content-hashed file under static/
+STATIC_MANIFEST = load_manifest()
+if PLOTLY_ASSET not in STATIC_MANIFEST:
+    print("WARNING: No vendored Plotly bundle found (run python static_assets.py). Loading the basic Plotly bundle from the CDN.")
+
+@app.context_processor
+def inject_asset_urls():
+    """
+    Make the versioned asset URLs available to every template
+    """
+    if PLOTLY_ASSET in STATIC_MANIFEST:
+        plotly_url = url_for('static', filename=STATIC_MANIFEST[PLOTLY_ASSET])
+    else:
+        plotly_url = plotly_cdn_url()
+    return {
+        'plotly_url': plotly_url,
+        'chart_layouts_url': url_for('chart_layouts_asset', version=LAYOUTS_VERSION)
+    }
+
+@app.after_request
+def cache_versioned_assets(response):
+    """
+    Let browsers cache vendored (content-hashed) static files for good
+    """
+    filename = (request.view_args or {}).get('filename')
+    if request.endpoint == 'static' and filename in STATIC_MANIFEST.values():
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+@app.route('/assets/chart-layouts.<version>.js')
+def chart_layouts_asset(version):
+    """
+    Shared chart layouts route
+    
+    Serves the script that defines window.ChartLayouts, which the insight
+    pages use to expand their compact chart specs. The current version is
+    cached for good; a page still referring to an older version gets the
+    current script without being allowed to cache it.
+    """
+    response = Response(LAYOUTS_SCRIPT, mimetype='application/javascript')
+    if version == LAYOUTS_VERSION:
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# -------------------------------------------------------------------------
+# JSON DATA API
+# -------------------------------------------------------------------------
+# Every panel of the insight pages (see insight_panels.py) is available as
+# JSON at /api/v1/panels/<name>, with the same start/end/compare query
+# parameters as the pages (and page=N for paged panels). Responses carry a strong ETag derived from the
+# data version, so clients revalidate with If-None-Match and get a 304
+# without the panel being recomputed until the next sync.
+# -------------------------------------------------------------------------
+
+# Panel responses may be stored by the browser but must be revalidated on
+# every use; they depend on the login session, so shared caches must not
+# store them
+API_CACHE_CONTROL = 'private, no-cache'
+
+def api_error(message, status):
+    """
+    Build a JSON error response for the data API
+    """
+    response = jsonify({'error': message})
+    response.status_code = status
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def panel_etag(name, version, page_range, pages=None):
+    """
+    Build the ETag of one panel response
+    
+    A panel's rows only change with the version of the data it reads (the
+    database, and the columnar snapshot for snapshot panels), the selected
+    date range, the requested page and, for windows relative to today, the
+    date. The tag is strong: equal tags mean byte-identical responses.
+    
+    Args:
+        name (str): Panel name
+        version (tuple): (data version, snapshot version or None) the panel
+            is read at (see PanelContext.panel_version())
+        page_range (PageRange): Selected date range
+        pages (dict): Requested page of a paged panel (see page_requests())
+    
+    Returns:
+        str: The ETag value (without quotes)
+    """
+    key = json.dumps([name, list(version), sorted(page_range.query_args().items()),
+                      sorted((pages or {}).items()), utc_today().isoformat()])
+    return f"{name}-v{version[0]}-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}"
+
+@app.route('/api/v1/panels')
+def api_panels():
+    """
+    Data API index route
+    
+    Returns, as JSON, every panel name with its page and description.
+    """
+    if 'user' not in session:
+        return api_error("Authentication required", 401)
+    
+    return jsonify({
+        'panels': [
+            {'name': p.name, 'page': p.route, 'description': p.description,
+             'url': url_for('api_panel', name=p.name)}
+            for p in PANELS.values()
+        ]
+    })
+
+@app.route('/api/v1/panels/<name>')
+def api_panel(name):
+    """
+    Data API panel route
+    
+    Returns the rows of one panel as JSON.
+    
+    This route:
+    1. Checks the user is logged in and the panel and date range are valid
+    2. Builds the panel's ETag from the versions of the data it reads (the
+       database, and the columnar snapshot for snapshot panels) before
+       running anything
+    3. Answers 304 Not Modified when the client's If-None-Match matches
+    4. Otherwise loads the panel within its page's time budget and returns
+       {panel, page, data_version, range, columns, rows}, plus pagination
+       ({size, total_rows, previous, next}, the cursors of the neighbouring
+       pages) for paged panels
+    
+    Degraded responses (stale or placeholder data after a timeout) are sent
+    without an ETag and with Cache-Control: no-store, so they are never
+    revalidated as if they were complete.
+    """
+    if 'user' not in session:
+        return api_error("Authentication required", 401)
+    
+    panel_def = PANELS.get(name)
+    if panel_def is None:
+        return api_error(f"Unknown panel '{name}'", 404)
+    
+    page_range, range_error = parse_page_range(request.args)
+    if range_error:
+        return api_error(range_error, 400)
+    
+    db_exists, db_message = check_database_exists()
+    if not db_exists:
+        return api_error(f"Database issue: {db_message}", 503)
+    
+    conn = get_db_connection()
+    try:
+        pages = page_requests(panel_def.route, request.args, name)
+        panels = PanelContext(conn, panel_def.route, page_range, pages=pages)
+        data_version = panels.data_version
+        version = panels.panel_version(name)
+        etag = panel_etag(name, version, page_range, pages) if version is not None else None
+        
+        # Unchanged since the client's copy: nothing to compute or send
+        if etag is not None and request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = API_CACHE_CONTROL
+            return response
+        
+        frame = panels.load(name)
+        payload = {
+            'panel': name,
+            'page': panel_def.route,
+            'data_version': data_version,
+            'range': page_range.query_args(),
+            'columns': list(frame.columns),
+            'rows': json.loads(frame.to_json(orient='records', date_format='iso', double_precision=15)),
+        }
+        if panel_def.paged:
+            payload['pagination'] = frame.attrs.get('page')
+        response = jsonify(payload)
+        
+        if etag is not None and not panels.budget.degraded:
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = API_CACHE_CONTROL
+        else:
+            response.headers['Cache-Control'] = 'no-store'
+        return response
+    except Exception as e:
+        print(f"Error loading panel {name}: {e}")
+        return api_error(f"Error loading panel: {str(e)}", 500)
+    finally:
+        conn.close()
+
 @app.route('/setup_db_route')
 def setup_db_route():
     """
@@ -1766,5 +2035,8 @@ if __name__ == '__main__':
     db_exists, db_message = check_database_exists()
     print(f"Database Status: {db_message}")
     
+    # Release free database pages in the background while no sync is running
+    start_idle_vacuum()
+    
     # Run the Flask app - only on localhost to prevent multiple interfaces for security
     app.run(debug=True, host='127.0.0.1', port=5000)
\ No newline at end of file
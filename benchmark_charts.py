@@ -0,0 +1,115 @@
+# -------------------------------------------------------------------------
+# CHART SERIALIZATION BENCHMARK
+# -------------------------------------------------------------------------
+# Measures the CPU time per request of the insight pages on a synthetic
+# store (see benchmark_dashboard.py), with:
+# - before:   figures rebuilt on every request and serialized with
+#             json.dumps(..., cls=PlotlyJSONEncoder)
+# - orjson:   figures rebuilt on every request and serialized with orjson
+# - cached:   serialized figures served from the chart cache
+#
+# The query result cache is warmed first in every mode, so the numbers
+# show the cost of building and serializing the charts (plus rendering
+# the page), not of the queries.
+#
+# Usage:
+#   python benchmark_charts.py                 # 100k line items
+#   python benchmark_charts.py 250000          # custom size
+# -------------------------------------------------------------------------
+
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+# Pages measured
+PAGES = ('/dashboard', '/inventory_insights', '/sales_insights')
+
+# Default store size (line items)
+DEFAULT_LINE_ITEMS = 100_000
+
+# Timed requests per page and mode (the median is reported)
+REPEATS = 20
+
+
+def cpu_per_request(client, path, repeats=REPEATS):
+    """
+    Median process CPU time of one request (all threads, so the panel
+    workers of streamed pages are included)
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.process_time()
+        response = client.get(path)
+        response.get_data()
+        times.append(time.process_time() - start)
+    return statistics.median(times)
+
+
+def benchmark(line_items):
+    """
+    Generate one store and measure every page in every mode
+
+    Returns:
+        dict: {mode: {page: CPU seconds per request}}
+    """
+    from benchmark_dashboard import generate_store
+    generate_store(line_items)
+
+    import app as appmod
+    import chart_cache
+
+    client = appmod.app.test_client()
+    with client.session_transaction() as session:
+        session['user'] = 'benchmark'
+
+    # Warm the query and snapshot caches
+    for path in PAGES:
+        client.get(path).get_data()
+
+    engine, max_bytes = chart_cache.JSON_ENGINE, chart_cache.chart_cache.max_bytes
+    results = {}
+    try:
+        for mode, mode_engine, mode_max_bytes in (('before', 'json', 0), ('orjson', engine, 0), ('cached', engine, max_bytes)):
+            chart_cache.JSON_ENGINE = mode_engine
+            chart_cache.chart_cache.max_bytes = mode_max_bytes
+            chart_cache.chart_cache.clear()
+            results[mode] = {path: cpu_per_request(client, path) for path in PAGES}
+    finally:
+        chart_cache.JSON_ENGINE = engine
+        chart_cache.chart_cache.max_bytes = max_bytes
+    return results
+
+
+def main(line_items):
+    """
+    Run the benchmark in a temporary directory and print the results
+    """
+    repo = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, repo)
+    original_cwd = os.getcwd()
+
+    workdir = tempfile.mkdtemp(prefix='chart_bench_')
+    try:
+        # Database paths are relative to the working directory
+        os.chdir(workdir)
+        os.makedirs('database', exist_ok=True)
+        print(f"Generating a store with {line_items:,} line items...")
+        results = benchmark(line_items)
+    finally:
+        os.chdir(original_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    print(f"{'page':<22} {'before':>10} {'orjson':>10} {'cached':>10} {'speedup':>8}")
+    for path in PAGES:
+        before, fast, cached = (results[mode][path] * 1000 for mode in ('before', 'orjson', 'cached'))
+        print(f"{path:<22} {before:>8.1f}ms {fast:>8.1f}ms {cached:>8.1f}ms {before / cached:>7.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    requested = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LINE_ITEMS
+    sys.exit(main(requested))
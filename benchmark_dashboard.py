@@ -0,0 +1,276 @@
+# -------------------------------------------------------------------------
+# DASHBOARD ENGINE BENCHMARK
+# -------------------------------------------------------------------------
+# Compares the six SQL dashboard queries with the single-pass engine
+# (dashboard_engine.py) on synthetic stores of a given number of line items,
+# and checks that both return the same panels.
+#
+# Usage:
+#   python benchmark_dashboard.py                 # 100k and 1M line items
+#   python benchmark_dashboard.py 250000          # custom sizes
+#
+# Every store is generated in its own temporary directory; the real
+# database is never touched.
+# -------------------------------------------------------------------------
+
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Default store sizes (line items)
+DEFAULT_SIZES = (100_000, 1_000_000)
+
+# Timed repetitions per path (the median is reported)
+REPEATS = 5
+
+# Shape of the synthetic store
+PRODUCTS = 4000
+VARIANTS_PER_PRODUCT = 3
+LINE_ITEMS_PER_ORDER = 3
+DAYS_OF_HISTORY = 120
+PRODUCT_TYPES = ['Rings', 'Necklaces', 'Earrings', 'Bracelets', 'Anklets', 'Pendants', None]
+
+INSERT_BATCH_ROWS = 50000
+
+
+def generate_store(line_items, seed=7):
+    """
+    Load a synthetic store with the given number of line items
+
+    Rows are written straight into the default partitions and then moved
+    into monthly partitions, like a database migrated from before
+    partitioning, and the derived tables and snapshots are built the same
+    way a sync builds them.
+    """
+    from shopify_db import write_connection, publish_read_snapshot
+    from shopify_derived import refresh_derived_tables
+    from shopify_partitions import PARTITIONED_TABLES, repartition
+    from shopify_setup import setup_database, update_metadata
+    from columnar_snapshot import export_sales_snapshot
+
+    rng = random.Random(seed)
+    now = datetime.now()
+    setup_database()
+
+    orders = max(line_items // LINE_ITEMS_PER_ORDER, 1)
+
+    with write_connection() as conn:
+        cursor = conn.cursor()
+
+        cursor.executemany(
+            "INSERT INTO shopify_products (id, title, product_type, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (product_id, f"Product {product_id}", PRODUCT_TYPES[product_id % len(PRODUCT_TYPES)],
+                 'draft' if product_id % 11 == 0 else 'active',
+                 (now - timedelta(days=product_id % 400)).strftime('%Y-%m-%dT%H:%M:%S+05:30'),
+                 now.strftime('%Y-%m-%dT%H:%M:%S+05:30'))
+                for product_id in range(1, PRODUCTS + 1)
+            ]
+        )
+
+        variants = []
+        for product_id in range(1, PRODUCTS + 1):
+            for position in range(VARIANTS_PER_PRODUCT):
+                variant_id = product_id * 10 + position
+                variants.append((variant_id, product_id, 'Default Title' if position == 0 else f"Size {position}",
+                                 float(100 + (variant_id * 37) % 4900), f"SKU-{variant_id}"))
+        cursor.executemany(
+            "INSERT INTO shopify_variants (id, product_id, title, price, sku) VALUES (?, ?, ?, ?, ?)",
+            variants
+        )
+
+        order_rows = []
+        order_dates = {}
+        for order_id in range(1, orders + 1):
+            created_at = (now - timedelta(seconds=rng.randrange(DAYS_OF_HISTORY * 86400))).strftime('%Y-%m-%dT%H:%M:%S+05:30')
+            order_dates[order_id] = created_at
+            status = rng.choice(['paid'] * 8 + ['refunded', None])
+            order_rows.append((order_id, created_at, float(rng.randrange(100, 20000)), status))
+            if len(order_rows) >= INSERT_BATCH_ROWS:
+                cursor.executemany(
+                    "INSERT INTO shopify_orders_default (id, created_at, total_price, financial_status) VALUES (?, ?, ?, ?)",
+                    order_rows
+                )
+                order_rows = []
+        cursor.executemany(
+            "INSERT INTO shopify_orders_default (id, created_at, total_price, financial_status) VALUES (?, ?, ?, ?)",
+            order_rows
+        )
+
+        line_rows = []
+        for line_item_id in range(1, line_items + 1):
+            order_id = rng.randrange(1, orders + 1)
+            product_id = rng.randrange(1, PRODUCTS + 1)
+            variant_id = product_id * 10 + rng.randrange(VARIANTS_PER_PRODUCT)
+            line_rows.append((line_item_id, order_id, variant_id, product_id, rng.randrange(1, 4),
+                              float(100 + (variant_id * 37) % 4900), order_dates[order_id]))
+            if len(line_rows) >= INSERT_BATCH_ROWS:
+                cursor.executemany(
+                    "INSERT INTO shopify_order_line_items_default (id, order_id, variant_id, product_id, quantity, price, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    line_rows
+                )
+                line_rows = []
+        cursor.executemany(
+            "INSERT INTO shopify_order_line_items_default (id, order_id, variant_id, product_id, quantity, price, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            line_rows
+        )
+
+        for table in PARTITIONED_TABLES:
+            repartition(cursor, table)
+
+        cursor.execute("SELECT DISTINCT substr(created_at, 1, 10) FROM shopify_orders")
+        refresh_derived_tables(cursor, {row[0] for row in cursor.fetchall()})
+        update_metadata(status="success", products_count=PRODUCTS, orders_count=orders, conn=conn)
+        conn.commit()
+        conn.execute("ANALYZE")
+        publish_read_snapshot(conn)
+
+    export_sales_snapshot()
+
+
+def run_sql_panels(conn):
+    """
+    Run the six dashboard queries the way the dashboard runs them without a snapshot
+    """
+    from dashboard_engine import DASHBOARD_QUERIES, dashboard_query_params
+    params = dashboard_query_params()
+    return {name: pd.read_sql(sql, conn, params=params[name]) for name, sql in DASHBOARD_QUERIES.items()}
+
+
+def _timed(function, repeats=REPEATS):
+    """
+    Run a function several times and return (median seconds, last result)
+    """
+    times = []
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def compare_panels(sql_panels, engine_panels):
+    """
+    Check that the engine returns the SQL panels
+
+    Float totals are compared with a relative tolerance (summation order
+    differs). Rows whose ranking value ties with another row may come back
+    in either order, so ranked panels compare the values row by row and the
+    names as sets within each tie (any of the rows tied at the LIMIT may be
+    the one kept).
+
+    Returns:
+        list: Descriptions of every mismatch (empty if the panels match)
+    """
+    problems = []
+    for name, expected in sql_panels.items():
+        actual = engine_panels[name]
+        if list(expected.columns) != list(actual.columns) or len(expected) != len(actual):
+            problems.append(f"{name}: shape {list(expected.columns)}x{len(expected)} != {list(actual.columns)}x{len(actual)}")
+            continue
+
+        for column in expected.columns:
+            left, right = expected[column], actual[column]
+            if pd.api.types.is_numeric_dtype(left) or pd.api.types.is_numeric_dtype(right):
+                if not np.allclose(pd.to_numeric(left).astype(float), pd.to_numeric(right).astype(float),
+                                   rtol=1e-9, equal_nan=True):
+                    problems.append(f"{name}.{column}: {left.tolist()} != {right.tolist()}")
+
+        label = {'top_revenue': 'product_name', 'top_quantity': 'product_name', 'category': 'category'}.get(name)
+        if label:
+            value = expected.columns[1]
+            cutoff = float(expected[value].iloc[-1])
+            for tie_value, group in expected.groupby(value):
+                # SQLite keeps any of the rows tied at the LIMIT, so only
+                # rows above the cutoff must be the same ones
+                if np.isclose(float(tie_value), cutoff):
+                    continue
+                names = set(actual.loc[np.isclose(actual[value].astype(float), float(tie_value)), label])
+                if not set(group[label]) <= names:
+                    problems.append(f"{name}: {sorted(group[label])} missing at {tie_value}")
+        elif name == 'trend' and list(expected['order_date']) != list(actual['order_date']):
+            problems.append("trend: days differ")
+    return problems
+
+
+def benchmark(line_items):
+    """
+    Generate one store and time both dashboard paths on it
+
+    Returns:
+        dict: Timings (seconds) and the panel comparison result
+    """
+    from shopify_db import get_read_connection, close_read_connection
+    from columnar_snapshot import load_sales_snapshot
+    from dashboard_engine import compute_dashboard_panels
+
+    start = time.perf_counter()
+    generate_store(line_items)
+    generated = time.perf_counter() - start
+
+    conn = get_read_connection()
+    sql_seconds, sql_panels = _timed(lambda: run_sql_panels(conn))
+
+    snapshot = load_sales_snapshot()
+    cold_start = time.perf_counter()
+    engine_panels = compute_dashboard_panels(snapshot)
+    engine_cold = time.perf_counter() - cold_start
+    engine_seconds, engine_panels = _timed(lambda: compute_dashboard_panels(snapshot))
+
+    close_read_connection()
+    return {
+        'line_items': line_items,
+        'generate_seconds': generated,
+        'sql_seconds': sql_seconds,
+        'engine_cold_seconds': engine_cold,
+        'engine_seconds': engine_seconds,
+        'problems': compare_panels(sql_panels, engine_panels),
+    }
+
+
+def main(sizes):
+    """
+    Run the benchmark for every size in its own temporary directory
+    """
+    repo = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, repo)
+    original_cwd = os.getcwd()
+
+    results = []
+    for line_items in sizes:
+        workdir = tempfile.mkdtemp(prefix='dashboard_bench_')
+        try:
+            # Database paths are relative to the working directory
+            os.chdir(workdir)
+            os.makedirs('database', exist_ok=True)
+            print(f"Generating a store with {line_items:,} line items...")
+            results.append(benchmark(line_items))
+        finally:
+            os.chdir(original_cwd)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    print(f"{'line items':>12} {'6 SQL queries':>14} {'engine (cold)':>14} {'engine':>10} {'speedup':>8}  panels")
+    for result in results:
+        print(f"{result['line_items']:>12,} {result['sql_seconds'] * 1000:>12.1f}ms "
+              f"{result['engine_cold_seconds'] * 1000:>12.1f}ms {result['engine_seconds'] * 1000:>8.1f}ms "
+              f"{result['sql_seconds'] / result['engine_seconds']:>7.1f}x  "
+              f"{'match' if not result['problems'] else 'MISMATCH'}")
+        for problem in result['problems']:
+            print(f"    {problem}")
+
+    return 0 if all(not result['problems'] for result in results) else 1
+
+
+if __name__ == '__main__':
+    requested = [int(arg) for arg in sys.argv[1:]] or list(DEFAULT_SIZES)
+    sys.exit(main(requested))
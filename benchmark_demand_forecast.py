@@ -0,0 +1,161 @@
+# -------------------------------------------------------------------------
+# DEMAND FORECAST BENCHMARK
+# -------------------------------------------------------------------------
+# Times forecast_demand() (demand_forecast.py) on synthetic daily sales of a
+# given number of variants over HISTORY_DAYS days: steady, trending,
+# intermittent and newly launched SKUs, plus SKUs that never sold.
+#
+# The forecasts of a sample of variants are checked against a plain
+# per-variant implementation of the same smoothing recursion.
+#
+# Usage:
+#   python benchmark_demand_forecast.py                 # 100k variants
+#   python benchmark_demand_forecast.py 250000          # custom sizes
+# -------------------------------------------------------------------------
+
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+# Default catalog sizes (variants)
+DEFAULT_SIZES = (100_000,)
+
+# Timed repetitions (the median is reported)
+REPEATS = 3
+
+# Variants checked against the per-variant implementation
+CHECKED_VARIANTS = 200
+
+# First forecast day of the synthetic history
+TODAY = date(2026, 1, 1)
+
+
+def generate_sales(variants, seed=7):
+    """
+    Daily sales of every variant as (codes, days, units) arrays
+    """
+    from demand_forecast import HISTORY_DAYS
+
+    rng = np.random.default_rng(seed)
+    first = int(np.datetime64(TODAY - timedelta(days=HISTORY_DAYS), 'D').astype(np.int64))
+
+    # Expected units per day: a base rate with a linear trend, zero before launch
+    base = rng.gamma(0.6, 1.5, variants)
+    slope = rng.normal(0, 0.004, variants) * base
+    launch = np.where(rng.random(variants) < 0.2, rng.integers(0, HISTORY_DAYS, variants), 0)
+    base[rng.random(variants) < 0.1] = 0
+
+    codes, days, units = [], [], []
+    for offset in range(HISTORY_DAYS):
+        rate = np.clip(base + slope * offset, 0, None) * (offset >= launch)
+        sold = rng.poisson(rate)
+        selling = np.flatnonzero(sold)
+        codes.append(selling)
+        days.append(np.full(len(selling), first + offset))
+        units.append(sold[selling])
+    return np.concatenate(codes), np.concatenate(days), np.concatenate(units)
+
+
+def reference_forecast(series):
+    """
+    The smoothing recursion of demand_forecast.py for one variant's daily series
+    """
+    from demand_forecast import (DAMPING, HORIZON_DAYS, INTERVAL_Z, LEVEL_SMOOTHING,
+                                 TREND_SMOOTHING)
+
+    level = trend = 0.0
+    started = False
+    squared_errors = 0.0
+    error_days = 0
+    for units in series:
+        if not started:
+            level, trend, started = units, 0.0, units > 0
+            continue
+        fitted = level + DAMPING * trend
+        squared_errors += (units - fitted) ** 2
+        error_days += 1
+        new_level = LEVEL_SMOOTHING * units + (1 - LEVEL_SMOOTHING) * fitted
+        trend = TREND_SMOOTHING * (new_level - level) + (1 - TREND_SMOOTHING) * DAMPING * trend
+        level = new_level
+
+    forecast = sum(level + sum(DAMPING ** i for i in range(1, h + 1)) * trend for h in range(1, HORIZON_DAYS + 1))
+    forecast = max(forecast, 0)
+    rmse = (squared_errors / error_days) ** 0.5 if error_days else 0.0
+    return forecast, forecast + INTERVAL_Z * rmse * HORIZON_DAYS ** 0.5
+
+
+def check_forecasts(codes, days, units, variants, forecasts):
+    """
+    Compare a sample of variants with the per-variant implementation
+
+    Returns:
+        list: Variant codes whose forecasts differ
+    """
+    from demand_forecast import HISTORY_DAYS
+
+    first = int(np.datetime64(TODAY - timedelta(days=HISTORY_DAYS), 'D').astype(np.int64))
+    mismatches = []
+    for code in range(0, variants, max(variants // CHECKED_VARIANTS, 1)):
+        series = np.zeros(HISTORY_DAYS)
+        mine = codes == code
+        np.add.at(series, days[mine] - first, units[mine])
+        forecast, upper = reference_forecast(series)
+        if not (np.isclose(forecasts['forecast_units'][code], forecast)
+                and np.isclose(forecasts['forecast_upper'][code], upper)):
+            mismatches.append(code)
+    return mismatches
+
+
+def benchmark(variants):
+    """
+    Generate one catalog's sales and time the forecasts
+
+    Returns:
+        dict: Timings (seconds) and the variants failing the check
+    """
+    from demand_forecast import forecast_demand
+
+    codes, days, units = generate_sales(variants)
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        forecasts = forecast_demand(codes, days, units, variants, TODAY)
+        times.append(time.perf_counter() - start)
+
+    return {
+        'variants': variants,
+        'sales': len(codes),
+        'seconds': statistics.median(times),
+        'mismatches': check_forecasts(codes, days, units, variants, forecasts),
+    }
+
+
+def main(sizes):
+    """
+    Run the benchmark for every size
+    """
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    results = []
+    for variants in sizes:
+        print(f"Generating daily sales of {variants:,} variants...")
+        results.append(benchmark(variants))
+
+    print()
+    print(f"{'variants':>10} {'daily sales':>12} {'forecast':>10}  check")
+    for result in results:
+        print(f"{result['variants']:>10,} {result['sales']:>12,} {result['seconds'] * 1000:>8.1f}ms  "
+              f"{'match' if not result['mismatches'] else 'MISMATCH'}")
+        for code in result['mismatches'][:10]:
+            print(f"    variant code {code}")
+
+    return 0 if all(not result['mismatches'] for result in results) else 1
+
+
+if __name__ == '__main__':
+    requested = [int(arg) for arg in sys.argv[1:]] or list(DEFAULT_SIZES)
+    sys.exit(main(requested))
@@ -0,0 +1,246 @@
+# -------------------------------------------------------------------------
+# FACT TABLE BENCHMARK
+# -------------------------------------------------------------------------
+# Measures the latency of the dashboard, inventory and sales insight pages
+# on a synthetic store (1M line items by default) at three revisions:
+# - baseline:      every analytics query joins orders, line items,
+#                  products and variants
+# - daily rollups: trend, category, velocity and top-product queries read
+#                  the daily rollups (user-027)
+# - fact table:    the remaining joins read the line-item fact table
+#                  (user-028)
+#
+# Each revision is exported with "git archive" into its own temporary
+# directory and runs in its own process. Every process loads the same
+# synthetic store (same seed) through that revision's setup_database() and
+# derived-table refresh, then renders each page with the Flask test client
+# (one untimed warm-up render, then the median of REPEATS renders).
+#
+# Later revisions moved these pages onto snapshots, caches and panels, so
+# the current tree is not measured here; see benchmark_dashboard.py and
+# benchmark_charts.py for those.
+#
+# Usage:
+#   python benchmark_fact_table.py                 # 1M line items
+#   python benchmark_fact_table.py 100000          # custom size
+# -------------------------------------------------------------------------
+
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+# Default store size (line items)
+DEFAULT_LINE_ITEMS = 1_000_000
+
+# Revisions measured (label, commit)
+REVISIONS = (
+    ('baseline', '9eceb9e'),
+    ('daily rollups', 'c57dee5'),
+    ('fact table', 'cac4bf1'),
+)
+
+# Pages measured
+PAGES = ('/dashboard', '/inventory_insights', '/sales_insights')
+
+# Timed renders per page and revision (the median is reported)
+REPEATS = 3
+
+# Shape of the synthetic store (12k variants, 333k orders at 1M line items)
+PRODUCTS = 4000
+VARIANTS_PER_PRODUCT = 3
+LINE_ITEMS_PER_ORDER = 3
+DAYS_OF_HISTORY = 90
+PRODUCT_TYPES = ['Rings', 'Necklaces', 'Earrings', 'Bracelets', 'Anklets', 'Pendants', None]
+
+INSERT_BATCH_ROWS = 50000
+
+
+def generate_store(line_items, seed=7):
+    """
+    Load a synthetic store into the database of the revision on sys.path
+
+    Only the raw tables every revision shares are written directly; the
+    revision's own setup_database() creates its schema and, where the
+    revision has them, its derived tables are refreshed for every day the
+    way its sync refreshes them.
+    """
+    from shopify_setup import DB_PATH, setup_database, update_metadata
+
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    setup_database()
+
+    orders = max(line_items // LINE_ITEMS_PER_ORDER, 1)
+
+    with sqlite3.connect(DB_PATH, timeout=20) as conn:
+        cursor = conn.cursor()
+
+        cursor.executemany(
+            "INSERT INTO shopify_products (id, title, product_type, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (product_id, f"Product {product_id}", PRODUCT_TYPES[product_id % len(PRODUCT_TYPES)],
+                 'draft' if product_id % 11 == 0 else 'active',
+                 (now - timedelta(days=product_id % 400)).strftime('%Y-%m-%dT%H:%M:%S+00:00'),
+                 now.strftime('%Y-%m-%dT%H:%M:%S+00:00'))
+                for product_id in range(1, PRODUCTS + 1)
+            ]
+        )
+
+        variants = []
+        for product_id in range(1, PRODUCTS + 1):
+            for position in range(VARIANTS_PER_PRODUCT):
+                variant_id = product_id * 10 + position
+                variants.append((variant_id, product_id, 'Default Title' if position == 0 else f"Size {position}",
+                                 float(100 + (variant_id * 37) % 4900), f"SKU-{variant_id}"))
+        cursor.executemany(
+            "INSERT INTO shopify_variants (id, product_id, title, price, sku) VALUES (?, ?, ?, ?, ?)",
+            variants
+        )
+
+        order_rows = []
+        order_dates = {}
+        for order_id in range(1, orders + 1):
+            created_at = (now - timedelta(seconds=rng.randrange(DAYS_OF_HISTORY * 86400))).strftime('%Y-%m-%dT%H:%M:%S+00:00')
+            order_dates[order_id] = created_at
+            status = rng.choice(['paid'] * 8 + ['refunded', None])
+            order_rows.append((order_id, f"customer{order_id % 5000}@example.com", created_at,
+                               float(rng.randrange(100, 20000)), status))
+            if len(order_rows) >= INSERT_BATCH_ROWS:
+                cursor.executemany(
+                    "INSERT INTO shopify_orders (id, email, created_at, total_price, financial_status) VALUES (?, ?, ?, ?, ?)",
+                    order_rows
+                )
+                order_rows = []
+        cursor.executemany(
+            "INSERT INTO shopify_orders (id, email, created_at, total_price, financial_status) VALUES (?, ?, ?, ?, ?)",
+            order_rows
+        )
+
+        line_rows = []
+        for line_item_id in range(1, line_items + 1):
+            order_id = rng.randrange(1, orders + 1)
+            product_id = rng.randrange(1, PRODUCTS + 1)
+            variant_id = product_id * 10 + rng.randrange(VARIANTS_PER_PRODUCT)
+            line_rows.append((line_item_id, order_id, variant_id, product_id, rng.randrange(1, 4),
+                              float(100 + (variant_id * 37) % 4900), order_dates[order_id]))
+            if len(line_rows) >= INSERT_BATCH_ROWS:
+                cursor.executemany(
+                    "INSERT INTO shopify_order_line_items (id, order_id, variant_id, product_id, quantity, price, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    line_rows
+                )
+                line_rows = []
+        cursor.executemany(
+            "INSERT INTO shopify_order_line_items (id, order_id, variant_id, product_id, quantity, price, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            line_rows
+        )
+
+        try:
+            import shopify_derived
+        except ImportError:
+            shopify_derived = None
+        if shopify_derived is not None:
+            cursor.execute("SELECT DISTINCT substr(created_at, 1, 10) FROM shopify_orders")
+            days = {row[0] for row in cursor.fetchall()}
+            refresh = getattr(shopify_derived, 'refresh_derived_tables', None) or shopify_derived.refresh_daily_rollups
+            refresh(cursor, days)
+        conn.commit()
+
+    update_metadata(status="success", products_count=PRODUCTS, orders_count=orders)
+
+
+def render_seconds(client, path, repeats=REPEATS):
+    """
+    Median wall-clock time of one render of a page, after a warm-up render
+    """
+    client.get(path).get_data()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        response = client.get(path)
+        response.get_data()
+        times.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}")
+    return statistics.median(times)
+
+
+def measure_revision(line_items):
+    """
+    Generate the store for the revision on sys.path and time every page
+
+    Returns:
+        dict: {page: seconds per render}
+    """
+    generate_store(line_items)
+
+    import app as appmod
+    client = appmod.app.test_client()
+    with client.session_transaction() as session:
+        session['user'] = 'benchmark'
+    return {path: render_seconds(client, path) for path in PAGES}
+
+
+def run_revision(repo, commit, line_items):
+    """
+    Export one revision into a temporary directory and measure it there in
+    a child process (each revision has its own modules)
+
+    Returns:
+        dict: {page: seconds per render}
+    """
+    workdir = tempfile.mkdtemp(prefix='fact_table_bench_')
+    try:
+        archive = subprocess.run(['git', '-C', repo, 'archive', commit], check=True, capture_output=True).stdout
+        subprocess.run(['tar', '-x', '-C', workdir], input=archive, check=True)
+        os.makedirs(os.path.join(workdir, 'database'), exist_ok=True)
+
+        # Database paths are relative to the working directory
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--revision', workdir, str(line_items)],
+            cwd=workdir, check=True, stdout=subprocess.PIPE, text=True
+        )
+        return json.loads(child.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(line_items):
+    """
+    Measure every revision and print the results
+    """
+    repo = os.path.dirname(os.path.abspath(__file__))
+
+    results = {}
+    for label, commit in REVISIONS:
+        print(f"Measuring {label} ({commit}) with {line_items:,} line items...")
+        results[label] = run_revision(repo, commit, line_items)
+
+    labels = [label for label, _ in REVISIONS]
+    print()
+    print(f"{'page':<22}" + ''.join(f"{label:>16}" for label in labels) + f"{'speedup':>10}")
+    for path in PAGES:
+        seconds = [results[label][path] for label in labels]
+        print(f"{path:<22}" + ''.join(f"{value:>15.2f}s" for value in seconds)
+              + f"{seconds[0] / seconds[-1]:>9.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--revision':
+        # Child process: measure the revision exported into sys.argv[2],
+        # importing nothing from the current tree
+        sys.path[0] = sys.argv[2]
+        timings = measure_revision(int(sys.argv[3]))
+        print(json.dumps(timings))
+        sys.exit(0)
+
+    requested = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LINE_ITEMS
+    sys.exit(main(requested))
@@ -0,0 +1,253 @@
+# -------------------------------------------------------------------------
+# INVENTORY KPI ENGINE BENCHMARK
+# -------------------------------------------------------------------------
+# Compares the SQL KPI path (query_sku_kpis()) with the snapshot engine
+# (compute_sku_kpis(), see inventory_kpis.py) on a synthetic catalog of a
+# given number of variants, each with:
+# - line items on a few random days of the KPI window
+# - a stock checkpoint every CHECKPOINT_INTERVAL_DAYS and stock deltas on
+#   some days in between (the inventory history tables)
+#
+# Both paths must return the same KPIs, and the average stock of a sample
+# of variants is checked against the daily series of get_stock_series().
+#
+# Usage:
+#   python benchmark_inventory_kpis.py                 # 100k variants
+#   python benchmark_inventory_kpis.py 250000          # custom sizes
+# -------------------------------------------------------------------------
+
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+import numpy as np
+
+# Default catalog sizes (variants)
+DEFAULT_SIZES = (100_000,)
+
+# Timed repetitions (the median is reported)
+REPEATS = 5
+
+# Shape of the synthetic catalog
+VARIANTS_PER_PRODUCT = 4
+SALES_PER_VARIANT = 6
+LINE_ITEMS_PER_ORDER = 3
+DELTAS_PER_VARIANT = 8
+HISTORY_DAYS = 180
+
+# Variants whose average stock is checked against the daily series
+CHECKED_VARIANTS = 200
+
+
+def generate_catalog(variants, seed=7):
+    """
+    Load a synthetic catalog with sales and inventory history
+
+    Orders are written into the default partitions and moved into monthly
+    partitions, and the derived tables and the columnar snapshot are built
+    the same way a sync builds them (see benchmark_dashboard.py).
+    """
+    from shopify_db import write_connection, publish_read_snapshot
+    from shopify_derived import refresh_derived_tables
+    from shopify_inventory import CHECKPOINT_INTERVAL_DAYS
+    from shopify_partitions import PARTITIONED_TABLES, repartition
+    from columnar_snapshot import export_sales_snapshot
+    from shopify_setup import setup_database, update_metadata
+    from date_ranges import utc_today
+
+    rng = np.random.default_rng(seed)
+    today = utc_today()
+    days = [(today - timedelta(days=offset)).isoformat() for offset in range(HISTORY_DAYS)]
+    setup_database()
+
+    variant_ids = np.arange(1, variants + 1)
+    product_ids = (variant_ids - 1) // VARIANTS_PER_PRODUCT + 1
+    stock = rng.integers(-2, 120, variants)
+
+    with write_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            "INSERT INTO shopify_products (id, title, product_type, status, created_at) VALUES (?, ?, ?, 'active', ?)",
+            [(int(product_id), f"Product {product_id}", f"Type {product_id % 12}", f"{days[offset]}T09:00:00+00:00")
+             for product_id, offset in zip(np.unique(product_ids), rng.integers(0, HISTORY_DAYS, product_ids[-1]))]
+        )
+        cursor.executemany(
+            "INSERT INTO shopify_variants (id, product_id, title, price, sku, inventory_quantity) VALUES (?, ?, ?, ?, ?, ?)",
+            [(int(variant_id), int(product_id), f"Size {variant_id % VARIANTS_PER_PRODUCT}", 499.0,
+              f"SKU-{variant_id}", None if variant_id % 50 == 0 else int(quantity))
+             for variant_id, product_id, quantity in zip(variant_ids, product_ids, stock)]
+        )
+
+        # Line items on random days of the last 90 days, LINE_ITEMS_PER_ORDER per order
+        line_variants = np.repeat(variant_ids, SALES_PER_VARIANT)
+        rng.shuffle(line_variants)
+        line_count = len(line_variants)
+        order_count = -(-line_count // LINE_ITEMS_PER_ORDER)
+        order_created = [f"{days[day]}T{hour:02d}:00:00+00:00"
+                         for day, hour in zip(rng.integers(0, 90, order_count), rng.integers(0, 24, order_count))]
+        order_status = rng.choice(['paid', 'paid', 'paid', 'paid', 'refunded'], order_count)
+        cursor.executemany(
+            "INSERT INTO shopify_orders_default (id, created_at, total_price, financial_status) VALUES (?, ?, ?, ?)",
+            [(order_id + 1, created_at, 1497.0, str(status))
+             for order_id, (created_at, status) in enumerate(zip(order_created, order_status))]
+        )
+        line_orders = np.arange(line_count) // LINE_ITEMS_PER_ORDER
+        cursor.executemany(
+            "INSERT INTO shopify_order_line_items_default (id, order_id, variant_id, product_id, quantity, price, created_at) "
+            "VALUES (?, ?, ?, ?, ?, 499.0, ?)",
+            [(line_id + 1, int(order_id) + 1, int(variant_id), int((variant_id - 1) // VARIANTS_PER_PRODUCT + 1),
+              int(quantity), order_created[order_id])
+             for line_id, (order_id, variant_id, quantity)
+             in enumerate(zip(line_orders, line_variants, rng.integers(1, 5, line_count)))]
+        )
+        for table in PARTITIONED_TABLES:
+            repartition(cursor, table)
+        refresh_derived_tables(cursor, {created_at[:10] for created_at in order_created})
+
+        # A checkpoint every CHECKPOINT_INTERVAL_DAYS, deltas in between
+        checkpoint_offsets = range(HISTORY_DAYS - 1, -1, -CHECKPOINT_INTERVAL_DAYS)
+        cursor.executemany(
+            "INSERT INTO shopify_inventory_checkpoints (variant_id, day, quantity) VALUES (?, ?, ?)",
+            [(int(variant_id), days[offset], int(quantity))
+             for offset in checkpoint_offsets
+             for variant_id, quantity in zip(variant_ids, rng.integers(0, 150, variants))]
+        )
+        delta_variants = np.repeat(variant_ids, DELTAS_PER_VARIANT)
+        delta_days = rng.integers(0, HISTORY_DAYS, len(delta_variants))
+        deltas = np.unique(np.stack([delta_variants, delta_days]).T, axis=0)
+        cursor.executemany(
+            "INSERT OR IGNORE INTO shopify_inventory_deltas (variant_id, day, delta) VALUES (?, ?, ?)",
+            [(int(variant_id), days[day], int(delta))
+             for (variant_id, day), delta in zip(deltas, rng.integers(-6, 10, len(deltas)))]
+        )
+
+        update_metadata(status="success", products_count=int(product_ids[-1]), orders_count=order_count, conn=conn)
+        conn.commit()
+        conn.execute("ANALYZE")
+        publish_read_snapshot(conn)
+
+    export_sales_snapshot()
+
+
+def compare_kpis(expected, actual):
+    """
+    Compare the engine's KPIs with the SQL path's
+
+    Returns:
+        list: Descriptions of the columns that differ
+    """
+    problems = []
+    if list(expected['variant_id']) != list(actual['variant_id']):
+        return ["variant rows differ"]
+    for column in ('sku', 'product_name', 'product_type', 'units_sold'):
+        if not expected[column].equals(actual[column]):
+            problems.append(f"{column} differs")
+    for column in ('stock_on_hand', 'revenue', 'avg_stock', 'sell_through', 'turnover', 'days_on_hand'):
+        if not np.allclose(expected[column].to_numpy(dtype='float64'), actual[column].to_numpy(dtype='float64'), equal_nan=True):
+            problems.append(f"{column} differs")
+    return problems
+
+
+def check_average_stock(conn, kpis):
+    """
+    Compare the average stock of a sample of variants with the mean of
+    their daily series
+
+    Returns:
+        list: Descriptions of the variants whose averages differ
+    """
+    from inventory_kpis import KPI_WINDOW_DAYS
+    from shopify_inventory import get_stock_series
+    from date_ranges import utc_today
+
+    today = utc_today()
+    sample = kpis['variant_id'].to_numpy()[::max(len(kpis) // CHECKED_VARIANTS, 1)].tolist()
+    series = get_stock_series(variant_ids=sample, start_day=(today - timedelta(days=KPI_WINDOW_DAYS)).isoformat(),
+                              end_day=today.isoformat(), conn=conn)
+    expected = series.dropna().groupby('variant_id')['quantity'].mean().clip(lower=0)
+    actual = kpis.set_index('variant_id')['avg_stock']
+    return [f"average stock of variant {variant_id}" for variant_id, value in expected.items()
+            if not np.isclose(actual[variant_id], value)]
+
+
+def benchmark(variants):
+    """
+    Generate one catalog and time both KPI paths on it
+
+    Returns:
+        dict: Timings (seconds) and the problems found by the checks
+    """
+    from shopify_db import get_read_connection, close_read_connection
+    from columnar_snapshot import load_sales_snapshot
+    from inventory_kpis import compute_sku_kpis, query_sku_kpis
+
+    generate_catalog(variants)
+    conn = get_read_connection()
+
+    start = time.perf_counter()
+    sql_kpis = query_sku_kpis(conn)
+    sql_seconds = time.perf_counter() - start
+
+    snapshot = load_sales_snapshot()
+    start = time.perf_counter()
+    kpis = compute_sku_kpis(snapshot)
+    cold_seconds = time.perf_counter() - start
+
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        kpis = compute_sku_kpis(snapshot)
+        times.append(time.perf_counter() - start)
+
+    problems = compare_kpis(sql_kpis, kpis) + check_average_stock(conn, kpis)
+    close_read_connection()
+    return {
+        'variants': variants,
+        'sql_seconds': sql_seconds,
+        'engine_cold_seconds': cold_seconds,
+        'engine_seconds': statistics.median(times),
+        'problems': problems,
+    }
+
+
+def main(sizes):
+    """
+    Run the benchmark for every size in its own temporary directory
+    """
+    repo = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, repo)
+    original_cwd = os.getcwd()
+
+    results = []
+    for variants in sizes:
+        workdir = tempfile.mkdtemp(prefix='kpi_bench_')
+        try:
+            # Database paths are relative to the working directory
+            os.chdir(workdir)
+            os.makedirs('database', exist_ok=True)
+            print(f"Generating a catalog with {variants:,} variants...")
+            results.append(benchmark(variants))
+        finally:
+            os.chdir(original_cwd)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    print(f"{'variants':>10} {'SQL':>10} {'engine (cold)':>14} {'engine':>10} {'speedup':>8}  KPIs")
+    for result in results:
+        print(f"{result['variants']:>10,} {result['sql_seconds'] * 1000:>8.1f}ms "
+              f"{result['engine_cold_seconds'] * 1000:>12.1f}ms {result['engine_seconds'] * 1000:>8.1f}ms "
+              f"{result['sql_seconds'] / result['engine_seconds']:>7.1f}x  "
+              f"{'match' if not result['problems'] else 'MISMATCH'}")
+        for problem in result['problems'][:10]:
+            print(f"    {problem}")
+
+    return 0 if all(not result['problems'] for result in results) else 1
+
+
+if __name__ == '__main__':
+    requested = [int(arg) for arg in sys.argv[1:]] or list(DEFAULT_SIZES)
+    sys.exit(main(requested))
@@ -0,0 +1,207 @@
+# -------------------------------------------------------------------------
+# VARIANT SCAN BENCHMARK
+# -------------------------------------------------------------------------
+# Compares the keyset pages of the top performer, dead stock and low
+# performer panels read from SQL with the snapshot scans (see
+# variant_scans.py) on the synthetic catalog of benchmark_inventory_kpis.py,
+# for windows of WINDOW_DAYS days:
+# - SQL: the first page and a deep page (a seek to the cursor's key)
+# - scan: the first page on a cold cache (bitmap, totals and order), then
+#   the first and a deep page from the cached order
+#
+# Both paths must return the same number of rows and the same first, deep
+# (after and before the deep cursor) and last pages.
+#
+# Usage:
+#   python benchmark_variant_scans.py                 # 250k variants
+#   python benchmark_variant_scans.py 100000 500000   # custom sizes
+# -------------------------------------------------------------------------
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Default catalog sizes (variants)
+DEFAULT_SIZES = (250_000,)
+
+# Windows the scans are run for (days before today)
+WINDOW_DAYS = (7, 30, 90)
+
+# Deep page timed (or the last page, if there are fewer)
+DEEP_PAGE = 1000
+
+# Panel -> (scan, sort key columns) of the snapshot-backed paged panels
+PANEL_SCANS = {
+    'top_performers': ('scan_top_performers', ['total_revenue', 'variant_id']),
+    'dead_stock': ('scan_dead_stock', ['created_at', 'variant_id']),
+    'low_performers': ('scan_low_performers', ['total_revenue', 'total_sold', 'variant_id']),
+}
+
+
+def timed(function):
+    """
+    Run function() once
+
+    Returns:
+        tuple: (its result, seconds taken)
+    """
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def panel_page(conn, snapshot, panel, window, cursor):
+    """
+    One page of a panel, read as the panels read it: from the snapshot, or
+    from SQL when snapshot is None
+    """
+    from date_ranges import PageRange
+    from insight_panels import PANELS, PanelContext
+
+    context = PanelContext(conn, PANELS[panel].route, PageRange(selected=window),
+                           pages={panel: cursor} if cursor else None)
+    context._snapshot = snapshot
+    context._snapshot_loaded = True
+    return context.load(panel)
+
+
+def page_cursors(rows, key_columns, deep_page):
+    """
+    Cursors of the compared pages, with the rows each should return
+
+    Returns:
+        list: (label, cursor, expected variant ids) of the first page, the
+            pages after and before the deep page's cursor, and the last page
+    """
+    from insight_panels import PANEL_PAGE_ROWS, _sort_key, encode_cursor
+
+    def key(position):
+        return _sort_key(rows.iloc[position], key_columns)
+
+    ids = list(rows['variant_id'])
+    deep = (deep_page - 1) * PANEL_PAGE_ROWS
+    cursors = [('first', None, ids[:PANEL_PAGE_ROWS])]
+    if deep > 0:
+        cursors.append(('deep', encode_cursor('after', key(deep - 1)), ids[deep:deep + PANEL_PAGE_ROWS]))
+    if deep > PANEL_PAGE_ROWS:
+        cursors.append(('before deep', encode_cursor('before', key(deep)), ids[deep - PANEL_PAGE_ROWS:deep]))
+    if len(ids) > PANEL_PAGE_ROWS:
+        cursors.append(('last', encode_cursor('after', key(len(ids) - PANEL_PAGE_ROWS - 1)), ids[-PANEL_PAGE_ROWS:]))
+    return cursors
+
+
+def compare_results(snapshot, conn, panel, window, rows, deep_page):
+    """
+    Compare pages of the scan with the SQL panel
+
+    Args:
+        rows (pd.DataFrame): Every row of the scan, in page order
+
+    Returns:
+        list: Descriptions of the pages that differ
+    """
+    problems = []
+    first = panel_page(conn, None, panel, window, None)
+    if first.attrs['page']['total_rows'] != len(rows):
+        problems.append(f"{panel} {window.label} row count")
+    for label, cursor, expected in page_cursors(rows, PANEL_SCANS[panel][1], deep_page):
+        for path, source in (('SQL', None), ('scan', snapshot)):
+            if list(panel_page(conn, source, panel, window, cursor)['variant_id']) != expected:
+                problems.append(f"{panel} {window.label} {label} page ({path})")
+    return problems
+
+
+def benchmark(variants):
+    """
+    Generate one catalog and time both paths on it
+
+    Returns:
+        list: One dict of timings and problems per panel and window
+    """
+    import variant_scans
+    from benchmark_inventory_kpis import generate_catalog
+    from columnar_snapshot import load_sales_snapshot
+    from date_ranges import DateRange, utc_today
+    from insight_panels import PANEL_PAGE_ROWS
+    from shopify_db import get_read_connection, close_read_connection
+
+    generate_catalog(variants)
+    conn = get_read_connection()
+    snapshot = load_sales_snapshot()
+
+    results = []
+    for days in WINDOW_DAYS:
+        window = DateRange.last_days(days, utc_today())
+        for panel, (scan_name, key_columns) in PANEL_SCANS.items():
+            scan = getattr(variant_scans, scan_name)
+            first_sql, first_sql_seconds = timed(lambda: panel_page(conn, None, panel, window, None))
+            _, cold_seconds = timed(lambda: panel_page(conn, snapshot, panel, window, None))
+            _, first_seconds = timed(lambda: panel_page(conn, snapshot, panel, window, None))
+
+            # The deep page starts after the last row of the page before it
+            rows = scan(snapshot, window)
+            deep_page = max(min(DEEP_PAGE, -(-len(rows) // PANEL_PAGE_ROWS)), 1)
+            deep_cursor = dict((label, cursor) for label, cursor, _ in page_cursors(rows, key_columns, deep_page))
+            deep_cursor = deep_cursor.get('deep')
+            _, deep_sql_seconds = timed(lambda: panel_page(conn, None, panel, window, deep_cursor))
+            _, deep_seconds = timed(lambda: panel_page(conn, snapshot, panel, window, deep_cursor))
+            results.append({
+                'panel': panel,
+                'days': days,
+                'rows': first_sql.attrs['page']['total_rows'],
+                'deep_page': deep_page,
+                'sql_first': first_sql_seconds,
+                'sql_deep': deep_sql_seconds,
+                'scan_cold': cold_seconds,
+                'scan_first': first_seconds,
+                'scan_deep': deep_seconds,
+                'problems': compare_results(snapshot, conn, panel, window, rows, deep_page),
+            })
+
+    close_read_connection()
+    return results
+
+
+def main(sizes):
+    """
+    Run the benchmark for every size in its own temporary directory
+    """
+    repo = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, repo)
+    original_cwd = os.getcwd()
+
+    for variants in sizes:
+        workdir = tempfile.mkdtemp(prefix='scan_bench_')
+        try:
+            # Database paths are relative to the working directory
+            os.chdir(workdir)
+            os.makedirs('database', exist_ok=True)
+            print(f"Generating a catalog with {variants:,} variants...")
+            results = benchmark(variants)
+        finally:
+            os.chdir(original_cwd)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        print()
+        print(f"{variants:,} variants")
+        print(f"{'panel':>15} {'days':>5} {'rows':>8} {'SQL p1':>9} {'SQL deep':>9} "
+              f"{'scan cold':>10} {'scan p1':>9} {'scan deep':>10}  results")
+        failed = False
+        for result in results:
+            print(f"{result['panel']:>15} {result['days']:>5} {result['rows']:>8,} "
+                  f"{result['sql_first'] * 1000:>7.1f}ms {result['sql_deep'] * 1000:>7.1f}ms "
+                  f"{result['scan_cold'] * 1000:>8.1f}ms {result['scan_first'] * 1000:>7.2f}ms "
+                  f"{result['scan_deep'] * 1000:>8.2f}ms  {'match' if not result['problems'] else 'MISMATCH'}")
+            for problem in result['problems']:
+                print(f"    {problem}")
+            failed = failed or bool(result['problems'])
+        print(f"(deep = page {DEEP_PAGE:,}, or the last page)")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    requested = [int(arg) for arg in sys.argv[1:]] or list(DEFAULT_SIZES)
+    sys.exit(main(requested))
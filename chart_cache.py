@@ -0,0 +1,197 @@
+# -------------------------------------------------------------------------
+# SERIALIZED CHART CACHE
+# -------------------------------------------------------------------------
+# Every page view used to rebuild its Plotly figures (go.Figure validates
+# every property it is given) and run them through json.dumps with
+# PlotlyJSONEncoder, although the result only changes when a sync runs or
+# the selected date range changes. This module caches the final figure
+# JSON strings in process memory, keyed by:
+# - the chart id (e.g. 'dashboard.revenue')
+# - the version of the data the chart's panel was read from: the data
+#   version of its connection (see query_cache.py) and, for panels served
+#   from the columnar snapshot, the snapshot version (see
+#   PanelContext.panel_version()), so a sync or a new export makes older
+#   entries unreachable
+# - the current (UTC) date and the page's date range parameters, because
+#   the default windows are relative to today
+#
+# On a hit the figure is not built at all. On a miss it is built, turned
+# into a compact chart spec (see chart_layouts.py) and serialized with
+# orjson when installed, falling back to the standard encoder (see
+# figure_json()).
+#
+# Charts built from degraded panels (stale or placeholder data, see
+# query_budget.py) are never cached.
+# -------------------------------------------------------------------------
+
+import json       # Fallback serializer
+import threading  # For guarding the shared cache
+from collections import OrderedDict
+
+import numpy as np
+import plotly
+
+from chart_layouts import compact_figure
+from date_ranges import utc_today
+
+try:
+    import orjson
+    JSON_ENGINE = 'orjson'
+except ImportError:
+    print("WARNING: orjson is not installed. Charts are serialized with the slower standard JSON encoder.")
+    orjson = None
+    JSON_ENGINE = 'json'
+
+# Memory allowed for cached chart JSON per process
+MAX_CHART_CACHE_BYTES = 16 * 1024 * 1024
+
+
+def _to_json_value(value):
+    """
+    Convert the values orjson does not handle itself (numpy arrays and scalars)
+    """
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def figure_json(fig):
+    """
+    Serialize a Plotly figure for the templates
+
+    The figure becomes a compact chart spec (see chart_layouts.py): its
+    traces, its own layout settings and the id of the shared layout
+    template the browser merges them into.
+
+    go.Figure keeps its validated traces and layout as plain dicts of
+    lists and numpy arrays. orjson writes those directly, without the deep
+    copy (and base64 encoding of numeric arrays) of fig.to_dict() that
+    PlotlyJSONEncoder goes through; NaN and infinity become null either way.
+
+    Args:
+        fig (go.Figure): The figure
+
+    Returns:
+        str: The chart spec as JSON
+    """
+    spec = compact_figure(fig._data, fig._layout)
+    if JSON_ENGINE != 'orjson':
+        return json.dumps(spec, cls=plotly.utils.PlotlyJSONEncoder)
+    return orjson.dumps(spec, default=_to_json_value).decode('utf-8')
+
+
+class ChartCache:
+    """
+    LRU cache of serialized figures (JSON strings) with a memory cap
+    """
+
+    def __init__(self, max_bytes=MAX_CHART_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> JSON string
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        """
+        Get a cached chart
+
+        Returns:
+            str or None: The chart JSON, or None on a miss
+        """
+        with self._lock:
+            chart = self._entries.get(key)
+            if chart is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return chart
+
+    def put(self, key, chart):
+        """
+        Cache a chart, evicting least recently used entries to stay under the cap
+        """
+        size = len(chart)
+
+        with self._lock:
+            if size > self.max_bytes:
+                return
+
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+
+            self._entries[key] = chart
+            self._bytes += size
+
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        """
+        Remove every entry (counters are kept)
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self):
+        """
+        Get the cache counters and current size
+
+        Returns:
+            dict: hits, misses, evictions, hit_rate, entries, bytes,
+                max_bytes and the JSON engine in use
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['max_bytes'] = self.max_bytes
+        stats['engine'] = JSON_ENGINE
+        return stats
+
+
+# Cache shared by every request handled by this process
+chart_cache = ChartCache()
+
+
+def cached_chart(chart_id, version, page_range, build):
+    """
+    Get the JSON of a chart, building it only on a cache miss
+
+    Args:
+        chart_id (str): Chart name, unique across pages
+        version (tuple): Version the chart's panel was read at (see
+            PanelContext.panel_version(): data version and, for snapshot
+            panels, snapshot version), or None to build the chart without
+            caching it (no version known, or its panel was degraded)
+        page_range (PageRange): Selected date range of the page
+        build (callable): Builds the go.Figure on a miss
+
+    Returns:
+        str: The chart JSON for the template
+    """
+    if version is None:
+        return figure_json(build())
+
+    key = (chart_id, version, utc_today().isoformat(), tuple(sorted(page_range.query_args().items())))
+    chart = chart_cache.get(key)
+    if chart is None:
+        chart = figure_json(build())
+        chart_cache.put(key, chart)
+    return chart
+
+
+def get_chart_cache_stats():
+    """
+    Get the counters of the shared chart cache
+    """
+    return chart_cache.get_stats()
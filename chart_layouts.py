@@ -0,0 +1,117 @@
+# -------------------------------------------------------------------------
+# SHARED CHART LAYOUTS
+# -------------------------------------------------------------------------
+# A Plotly figure's layout carries the whole theme template (colorway,
+# fonts, axis and hover styling), about 85% of every chart's JSON, and
+# most charts repeat the same transparent backgrounds and fonts on top.
+# Charts are therefore sent to the browser as a compact spec:
+#
+#   {"data": [...], "layout": {<chart's own settings>}, "template": "<id>"}
+#
+# where <id> names one of LAYOUT_TEMPLATES. The templates are served once
+# as a JavaScript asset (layouts_script()) that the browser caches for good
+# under a content-versioned URL, and that merges a spec back into the full
+# layout before Plotly.newPlot:
+#
+#   Plotly.newPlot(id, chart.data, ChartLayouts.layout(chart), config)
+#
+# A chart only gets a template whose settings it has itself, so the merged
+# layout is exactly the figure's original layout.
+# -------------------------------------------------------------------------
+
+import hashlib  # For the asset version
+import json
+
+import plotly.io as pio
+
+# Trace types the pages draw; the theme's defaults for other types are not sent
+TRACE_TYPES = ('bar', 'pie', 'scatter')
+
+# The theme template every go.Figure gets by default, and what the browser gets of it
+_DEFAULT_THEME = pio.templates[pio.templates.default].to_plotly_json()
+THEME = {
+    'data': {trace: _DEFAULT_THEME['data'][trace] for trace in TRACE_TYPES if trace in _DEFAULT_THEME['data']},
+    'layout': _DEFAULT_THEME['layout'],
+}
+
+TRANSPARENT_BACKGROUND = {
+    'plot_bgcolor': 'rgba(0,0,0,0)',
+    'paper_bgcolor': 'rgba(0,0,0,0)',
+}
+
+# Template id -> layout settings shared by the charts using it
+LAYOUT_TEMPLATES = {
+    # Every chart: the theme only
+    'theme': {'template': THEME},
+    # Charts drawn on the card background
+    'transparent': {'template': THEME, **TRANSPARENT_BACKGROUND},
+    # Dashboard charts
+    'dashboard': {
+        'template': THEME,
+        **TRANSPARENT_BACKGROUND,
+        'font': {'family': 'Poppins, sans-serif', 'size': 12},
+    },
+}
+
+
+def compact_figure(data, layout):
+    """
+    Turn a figure's data and layout into a compact chart spec
+
+    The template with the most settings the layout shares is chosen and
+    those settings are left out of the layout. Figures with a theme other
+    than the default one keep their full layout.
+
+    Args:
+        data (list): The figure's traces
+        layout (dict): The figure's layout (including its template)
+
+    Returns:
+        dict: {'data', 'layout'} plus 'template' (the template id)
+    """
+    if layout.get('template') != _DEFAULT_THEME:
+        return {'data': data, 'layout': layout}
+
+    best = 'theme'
+    for template_id, settings in LAYOUT_TEMPLATES.items():
+        shared = all(layout.get(key) == value for key, value in settings.items() if key != 'template')
+        if shared and len(settings) > len(LAYOUT_TEMPLATES[best]):
+            best = template_id
+
+    own = {key: value for key, value in layout.items() if key not in LAYOUT_TEMPLATES[best]}
+    return {'data': data, 'layout': own, 'template': best}
+
+
+def layouts_script():
+    """
+    The JavaScript asset defining window.ChartLayouts
+
+    ChartLayouts.layout(chart) returns the full layout of a compact chart
+    spec: a fresh copy of its template (Plotly modifies the layouts it is
+    given) with the chart's own settings merged in, objects key by key.
+    """
+    return (
+        "// Shared chart layouts (generated by chart_layouts.py)\n"
+        "window.ChartLayouts = (() => {\n"
+        f"  const templates = {json.dumps(LAYOUT_TEMPLATES, separators=(',', ':'))};\n"
+        "  const isObject = (value) => value !== null && typeof value === 'object' && !Array.isArray(value);\n"
+        "  const merge = (base, own) => {\n"
+        "    Object.keys(own).forEach((key) => {\n"
+        "      base[key] = isObject(base[key]) && isObject(own[key]) ? merge(base[key], own[key]) : own[key];\n"
+        "    });\n"
+        "    return base;\n"
+        "  };\n"
+        "  return {\n"
+        "    layout: (chart) => {\n"
+        "      const template = templates[chart.template];\n"
+        "      return template ? merge(JSON.parse(JSON.stringify(template)), chart.layout) : chart.layout;\n"
+        "    }\n"
+        "  };\n"
+        "})();\n"
+    )
+
+
+LAYOUTS_SCRIPT = layouts_script()
+
+# Changes whenever the templates do, so the asset URL can be cached forever
+LAYOUTS_VERSION = hashlib.sha1(LAYOUTS_SCRIPT.encode('utf-8')).hexdigest()[:12]
@@ -0,0 +1,730 @@
+# -------------------------------------------------------------------------
+# COLUMNAR SALES SNAPSHOT
+# -------------------------------------------------------------------------
+# After each successful sync the line-item facts are exported as typed NumPy
+# column files. Web workers memory-map those files instead of re-reading and
+# re-boxing rows through pd.read_sql, so every worker process shares the same
+# page-cached copy and aggregates become vectorized array operations.
+#
+# Layout on disk:
+#   database/columnar/CURRENT                 -> name of the live version
+#   database/columnar/<version>/meta.json     -> row count and dictionaries
+#   database/columnar/<version>/<column>.npy  -> one typed array per column
+#
+# Columns (all rows sorted by day):
+#   line_item_id, order_id, product_id, variant_id   int64 keys (-1 = NULL)
+#   day                                              int32 days since 1970-01-01
+#   hour                                             int8 store-local hour
+#   is_refunded                                      bool
+#   quantity                                         int64
+#   revenue, unit_price                              float64
+#   item_code                                        int32 index into the item dictionary
+#   product_type_code                                int32 index into product types (-1 = unknown product)
+#   order_code                                       int32 index into the order columns (-1 = no order)
+#
+# Order columns (one row per order, sorted by order id):
+#   order_id                                         int64
+#   order_total_price                                float64 (NaN = NULL)
+#   order_day                                        int32 days since 1970-01-01
+#   order_is_counted                                 bool, financial_status is set and not 'refunded'
+#
+# Catalog columns (one row per variant, sorted by variant id; SKUs and
+# display names are in meta.json):
+#   catalog_variant_id, catalog_product_id           int64
+#   catalog_type_code                                int32 index into product types (-1 = unknown product)
+#   catalog_stock                                    float64 current inventory_quantity (NaN = not tracked)
+#   catalog_price                                    float64 variant price (NaN = NULL)
+#   catalog_active                                   bool, the product's status is 'active'
+#   catalog_created_rank                             int32 rank of the product's created_at among
+#                                                    the sorted distinct values in meta.json
+#                                                    (-1 = unknown product or NULL)
+#
+# Stock columns (the inventory history resolved to one level per variant
+# and day on which it changed, see shopify_inventory.py; sorted by variant
+# and day):
+#   stock_catalog_code                               int32 index into the catalog columns
+#   stock_day                                        int32 days since 1970-01-01
+#   stock_level                                      float64 (NaN = not tracked from that day)
+#
+# Forecast columns (one row per catalog variant, see demand_forecast.py;
+# meta.json holds the first forecast day):
+#   forecast_velocity, forecast_trend                float64 smoothed units per day and its daily change
+#   forecast_units, forecast_lower, forecast_upper   float64 units over the forecast horizon and its interval
+#
+# Snapshots exported before the catalog and forecast columns existed (or
+# with an older CATALOG_FORMAT) load without them (SalesSnapshot.catalog and
+# .forecast are None).
+# -------------------------------------------------------------------------
+
+import json       # For the snapshot metadata file
+import os         # For file system operations
+import shutil     # For removing old snapshot versions
+import threading  # For guarding the per-process snapshot cache
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from date_ranges import utc_today
+from demand_forecast import forecast_demand
+from shopify_db import DB_PATH, live_read_connection
+from shopify_inventory import read_stock_levels
+
+# Define snapshot location next to the SQLite database
+SNAPSHOT_DIR = os.path.join(os.path.dirname(DB_PATH), 'columnar')
+CURRENT_POINTER = os.path.join(SNAPSHOT_DIR, 'CURRENT')
+
+# Number of old versions kept so that workers still mapping them keep working
+KEEP_VERSIONS = 2
+
+# Rows fetched from SQLite per batch while exporting
+EXPORT_BATCH_ROWS = 50000
+
+# Column name -> dtype of every exported array
+COLUMN_TYPES = {
+    'line_item_id': np.int64,
+    'order_id': np.int64,
+    'product_id': np.int64,
+    'variant_id': np.int64,
+    'day': np.int32,
+    'hour': np.int8,
+    'is_refunded': np.bool_,
+    'quantity': np.int64,
+    'revenue': np.float64,
+    'unit_price': np.float64,
+    'item_code': np.int32,
+    'product_type_code': np.int32,
+    'order_code': np.int32,
+}
+
+# Column name -> dtype of every exported order array
+ORDER_COLUMN_TYPES = {
+    'order_id': np.int64,
+    'order_total_price': np.float64,
+    'order_day': np.int32,
+    'order_is_counted': np.bool_,
+}
+
+# Column name -> dtype of every exported catalog array
+CATALOG_COLUMN_TYPES = {
+    'catalog_variant_id': np.int64,
+    'catalog_product_id': np.int64,
+    'catalog_type_code': np.int32,
+    'catalog_stock': np.float64,
+    'catalog_price': np.float64,
+    'catalog_active': np.bool_,
+    'catalog_created_rank': np.int32,
+}
+
+# Version of the catalog columns; snapshots with another one load without
+# a catalog (until the next sync exports a new version)
+CATALOG_FORMAT = 2
+
+# Column name -> dtype of every exported stock history array
+STOCK_COLUMN_TYPES = {
+    'stock_catalog_code': np.int32,
+    'stock_day': np.int32,
+    'stock_level': np.float64,
+}
+
+# Forecast (see demand_forecast.py) -> file name of its float64 array
+FORECAST_FILES = {
+    'velocity': 'forecast_velocity',
+    'trend': 'forecast_trend',
+    'forecast_units': 'forecast_units',
+    'forecast_lower': 'forecast_lower',
+    'forecast_upper': 'forecast_upper',
+}
+
+# Per-process cache of the currently mapped snapshot
+_snapshot_lock = threading.Lock()
+_loaded_snapshot = None
+
+
+def _day_number(day):
+    """
+    Convert a YYYY-MM-DD string to days since 1970-01-01 (-1 if missing)
+    """
+    if not day:
+        return -1
+    try:
+        return int(np.datetime64(day, 'D').astype(np.int64))
+    except ValueError:
+        return -1
+
+
+def export_sales_snapshot():
+    """
+    Export the line-item facts as a new columnar snapshot version
+
+    The export reads the live database rather than the published read
+    snapshot, so the sync can export before it publishes and both copies
+    hold the same committed data.
+
+    This function:
+    1. Reads the orders, then the fact table, in batches through one read
+       transaction on a read-only connection to the live database
+    2. Writes every column straight into a memory-mapped .npy file
+    3. Dictionary-encodes (product, variant) items, product types and orders
+    4. Writes the variant catalog and its stock history
+    5. Forecasts the demand of every catalog variant
+    6. Publishes the new version by atomically replacing the CURRENT pointer
+    7. Removes versions older than the last KEEP_VERSIONS
+
+    Returns:
+        str: The name of the published snapshot version
+    """
+    version = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    directory = os.path.join(SNAPSHOT_DIR, version)
+    os.makedirs(directory, exist_ok=True)
+
+    with live_read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+
+        # Product types come from the products table so that categories
+        # without sales still report their product count
+        cursor.execute('''
+        SELECT product_type, COUNT(*) FROM shopify_products
+        GROUP BY product_type ORDER BY product_type
+        ''')
+        type_rows = cursor.fetchall()
+        product_types = [row[0] for row in type_rows]
+        product_type_counts = [row[1] for row in type_rows]
+        type_codes = {product_type: code for code, product_type in enumerate(product_types)}
+
+        cursor.execute("SELECT COUNT(*) FROM shopify_products WHERE status = 'active'")
+        active_product_count = cursor.fetchone()[0]
+
+        order_ids = _export_orders(cursor, directory)
+
+        cursor.execute("SELECT COUNT(*) FROM shopify_sales_facts")
+        row_count = cursor.fetchone()[0]
+
+        columns = {
+            name: np.lib.format.open_memmap(
+                os.path.join(directory, f"{name}.npy"), mode='w+', dtype=dtype, shape=(row_count,)
+            )
+            for name, dtype in COLUMN_TYPES.items()
+        }
+
+        item_codes = {}
+        item_names = []
+        day_numbers = {}
+
+        cursor.execute('''
+        SELECT line_item_id, order_id, product_id, variant_id, day, hour,
+            is_refunded, quantity, revenue, unit_price,
+            product_title, product_type, display_name
+        FROM shopify_sales_facts
+        ORDER BY day, line_item_id
+        ''')
+
+        offset = 0
+        while True:
+            rows = cursor.fetchmany(EXPORT_BATCH_ROWS)
+            if not rows:
+                break
+
+            end = offset + len(rows)
+            batch = list(zip(*rows))
+
+            for index, name in enumerate(('line_item_id', 'order_id', 'product_id', 'variant_id')):
+                columns[name][offset:end] = [-1 if value is None else value for value in batch[index]]
+
+            # Order ids are sorted, so each fact's order is a binary search
+            fact_orders = columns['order_id'][offset:end]
+            if len(order_ids):
+                positions = np.minimum(np.searchsorted(order_ids, fact_orders), len(order_ids) - 1)
+                columns['order_code'][offset:end] = np.where(order_ids[positions] == fact_orders, positions, -1)
+            else:
+                columns['order_code'][offset:end] = -1
+
+            for day in set(batch[4]):
+                if day not in day_numbers:
+                    day_numbers[day] = _day_number(day)
+            columns['day'][offset:end] = [day_numbers[day] for day in batch[4]]
+            columns['hour'][offset:end] = [int(hour) if hour else -1 for hour in batch[5]]
+            columns['is_refunded'][offset:end] = batch[6]
+            columns['quantity'][offset:end] = [value or 0 for value in batch[7]]
+            columns['revenue'][offset:end] = [value or 0.0 for value in batch[8]]
+            columns['unit_price'][offset:end] = [value or 0.0 for value in batch[9]]
+
+            codes = []
+            for product_id, variant_id, name in zip(batch[2], batch[3], batch[12]):
+                key = (product_id, variant_id)
+                code = item_codes.get(key)
+                if code is None:
+                    code = item_codes[key] = len(item_names)
+                    item_names.append(name)
+                codes.append(code)
+            columns['item_code'][offset:end] = codes
+
+            # Line items of products that no longer exist have no category
+            columns['product_type_code'][offset:end] = [
+                type_codes.get(product_type, -1) if title is not None else -1
+                for title, product_type in zip(batch[10], batch[11])
+            ]
+
+            offset = end
+
+        catalog_meta = _export_catalog(conn, directory, type_codes)
+
+    for array in columns.values():
+        array.flush()
+    del columns
+
+    item_keys = np.array(list(item_codes.keys()), dtype=object).reshape(-1, 2)
+    np.save(os.path.join(directory, 'item_product_id.npy'),
+            np.array([-1 if key is None else key for key in item_keys[:, 0]], dtype=np.int64))
+    np.save(os.path.join(directory, 'item_variant_id.npy'),
+            np.array([-1 if key is None else key for key in item_keys[:, 1]], dtype=np.int64))
+
+    forecast_meta = _export_forecasts(directory)
+
+    with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'version': version,
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'row_count': row_count,
+            'order_count': len(order_ids),
+            'active_product_count': active_product_count,
+            'item_names': item_names,
+            'product_types': product_types,
+            'product_type_counts': product_type_counts,
+            **catalog_meta,
+            **forecast_meta,
+        }, f)
+
+    # Publish atomically: readers see either the old or the new version
+    pointer_tmp = CURRENT_POINTER + '.tmp'
+    with open(pointer_tmp, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(pointer_tmp, CURRENT_POINTER)
+
+    _remove_old_versions(version)
+    return version
+
+
+def _export_orders(cursor, directory):
+    """
+    Write the order columns of a snapshot version
+
+    Only the order attributes the dashboard aggregates need are exported;
+    everything else about an order is reached through the facts.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor on the read-only export connection
+        directory (str): Directory of the snapshot version
+
+    Returns:
+        np.ndarray: The exported order ids (sorted), for encoding the facts
+    """
+    cursor.execute("SELECT COUNT(*) FROM shopify_orders")
+    order_count = cursor.fetchone()[0]
+
+    columns = {
+        name: np.lib.format.open_memmap(
+            os.path.join(directory, f"{name}.npy"), mode='w+', dtype=dtype, shape=(order_count,)
+        )
+        for name, dtype in ORDER_COLUMN_TYPES.items()
+    }
+
+    # Same conditions as the SQL dashboard queries (NULL status is not counted)
+    cursor.execute('''
+    SELECT id, total_price, substr(created_at, 1, 10),
+        COALESCE(financial_status != 'refunded', 0)
+    FROM shopify_orders
+    ORDER BY id
+    ''')
+
+    day_numbers = {}
+    offset = 0
+    while True:
+        rows = cursor.fetchmany(EXPORT_BATCH_ROWS)
+        if not rows:
+            break
+
+        end = offset + len(rows)
+        batch = list(zip(*rows))
+
+        columns['order_id'][offset:end] = batch[0]
+        columns['order_total_price'][offset:end] = [np.nan if value is None else value for value in batch[1]]
+        for day in set(batch[2]):
+            if day not in day_numbers:
+                day_numbers[day] = _day_number(day)
+        columns['order_day'][offset:end] = [day_numbers[day] for day in batch[2]]
+        columns['order_is_counted'][offset:end] = batch[3]
+
+        offset = end
+
+    for array in columns.values():
+        array.flush()
+    return np.array(columns['order_id'])
+
+
+def catalog_codes(catalog_variant_ids, variant_ids):
+    """
+    Catalog codes (positions in the sorted catalog variant ids) of variant ids
+
+    Returns:
+        np.ndarray: int64 code of every variant id (-1 if not in the catalog)
+    """
+    variant_ids = np.asarray(variant_ids, dtype=np.int64)
+    if not len(catalog_variant_ids):
+        return np.full(len(variant_ids), -1, dtype=np.int64)
+    positions = np.minimum(np.searchsorted(catalog_variant_ids, variant_ids), len(catalog_variant_ids) - 1)
+    return np.where(catalog_variant_ids[positions] == variant_ids, positions, -1)
+
+
+def _export_catalog(conn, directory, type_codes):
+    """
+    Write the catalog and stock history columns of a snapshot version
+
+    Args:
+        conn (sqlite3.Connection): The read-only export connection
+        directory (str): Directory of the snapshot version
+        type_codes (dict): Product type -> product type code
+
+    Returns:
+        dict: The catalog entries of meta.json (catalog_format,
+            catalog_count, catalog_skus, catalog_names,
+            catalog_created_values and stock_count)
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+    SELECT
+        v.id,
+        v.product_id,
+        p.title IS NOT NULL,
+        p.product_type,
+        v.inventory_quantity,
+        v.sku,
+        CASE
+            WHEN p.title IS NOT NULL THEN p.title || CASE WHEN v.title != 'Default Title' THEN ' - ' || v.title ELSE '' END
+            ELSE 'Unknown Product'
+        END,
+        v.price,
+        COALESCE(p.status = 'active', 0),
+        p.created_at
+    FROM shopify_variants v
+    LEFT JOIN shopify_products p ON v.product_id = p.id
+    ORDER BY v.id
+    ''')
+    rows = cursor.fetchall()
+    batch = list(zip(*rows)) if rows else [()] * 10
+
+    # Products are ordered by their created_at text (as in SQL), so each
+    # variant keeps the rank of its product's value
+    created_values = sorted({value for value in batch[9] if value is not None})
+    created_ranks = {value: rank for rank, value in enumerate(created_values)}
+
+    variant_ids = np.array(batch[0], dtype=np.int64)
+    catalog = {
+        'catalog_variant_id': variant_ids,
+        'catalog_product_id': np.array([-1 if value is None else value for value in batch[1]], dtype=np.int64),
+        'catalog_type_code': np.array([
+            type_codes.get(product_type, -1) if has_product else -1
+            for has_product, product_type in zip(batch[2], batch[3])
+        ], dtype=np.int32),
+        'catalog_stock': np.array([np.nan if value is None else value for value in batch[4]], dtype=np.float64),
+        'catalog_price': np.array([np.nan if value is None else value for value in batch[7]], dtype=np.float64),
+        'catalog_active': np.array(batch[8], dtype=np.bool_),
+        'catalog_created_rank': np.array([created_ranks.get(value, -1) for value in batch[9]], dtype=np.int32),
+    }
+
+    # Levels of variants no longer in the catalog are left out
+    levels = read_stock_levels(conn)
+    codes = catalog_codes(variant_ids, levels['variant_id'].to_numpy(dtype=np.int64))
+    in_catalog = codes >= 0
+    level_days = levels['day'].to_numpy()
+    day_numbers = {day: _day_number(day) for day in set(level_days)}
+    stock = {
+        'stock_catalog_code': codes[in_catalog].astype(np.int32),
+        'stock_day': np.array([day_numbers[day] for day in level_days[in_catalog]], dtype=np.int32),
+        'stock_level': levels['quantity'].to_numpy(dtype=np.float64)[in_catalog],
+    }
+
+    for name, values in {**catalog, **stock}.items():
+        np.save(os.path.join(directory, f"{name}.npy"), values)
+
+    return {
+        'catalog_format': CATALOG_FORMAT,
+        'catalog_count': len(variant_ids),
+        'catalog_skus': list(batch[5]),
+        'catalog_names': list(batch[6]),
+        'catalog_created_values': created_values,
+        'stock_count': int(in_catalog.sum()),
+    }
+
+
+def _export_forecasts(directory):
+    """
+    Write the demand forecast columns of a snapshot version
+
+    The forecasts are computed from the version's own (already written)
+    line-item and catalog columns.
+
+    Args:
+        directory (str): Directory of the snapshot version
+
+    Returns:
+        dict: The forecast entries of meta.json (forecast_day)
+    """
+    def load(name):
+        return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+
+    today = utc_today()
+    keep = ~load('is_refunded')
+    item_codes = catalog_codes(load('catalog_variant_id'), load('item_variant_id'))
+    forecasts = forecast_demand(
+        item_codes[load('item_code')[keep]],
+        load('day')[keep],
+        load('quantity')[keep],
+        len(load('catalog_variant_id')),
+        today,
+    )
+
+    for name in FORECAST_FILES:
+        np.save(os.path.join(directory, f"{FORECAST_FILES[name]}.npy"), forecasts[name])
+    return {'forecast_day': today.isoformat()}
+
+
+def _remove_old_versions(current_version):
+    """
+    Delete snapshot versions beyond the last KEEP_VERSIONS
+
+    Processes that still map a deleted version keep their pages until they
+    switch to the new one, so removing the files is safe.
+    """
+    versions = sorted(
+        name for name in os.listdir(SNAPSHOT_DIR)
+        if os.path.isdir(os.path.join(SNAPSHOT_DIR, name))
+    )
+    for name in versions[:-KEEP_VERSIONS]:
+        if name != current_version:
+            shutil.rmtree(os.path.join(SNAPSHOT_DIR, name), ignore_errors=True)
+
+
+def withdraw_sales_snapshot():
+    """
+    Remove the CURRENT pointer so the web app falls back to SQL
+
+    Used when an export fails: the previous version would otherwise keep
+    being served next to SQL panels that already show the new sync.
+    """
+    if os.path.exists(CURRENT_POINTER):
+        os.remove(CURRENT_POINTER)
+
+
+def remove_sales_snapshots():
+    """
+    Delete every snapshot version together with the CURRENT pointer
+    """
+    if os.path.exists(SNAPSHOT_DIR):
+        shutil.rmtree(SNAPSHOT_DIR, ignore_errors=True)
+
+
+class SalesSnapshot:
+    """
+    Memory-mapped view of one exported snapshot version
+
+    Column arrays are opened with np.load(..., mmap_mode='r'), so nothing is
+    copied into the process until an aggregate actually touches the pages.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+
+        self.version = meta['version']
+        self.row_count = meta['row_count']
+        self.item_names = meta['item_names']
+        self.product_types = meta['product_types']
+        self.product_type_counts = np.array(meta['product_type_counts'], dtype=np.int64)
+        self.columns = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+            for name in COLUMN_TYPES
+        }
+        self.order_count = meta['order_count']
+        self.active_product_count = meta['active_product_count']
+        self.orders = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+            for name in ORDER_COLUMN_TYPES
+        }
+        self.item_product_id = np.load(os.path.join(directory, 'item_product_id.npy'), mmap_mode='r')
+        self.item_variant_id = np.load(os.path.join(directory, 'item_variant_id.npy'), mmap_mode='r')
+
+        # Variant catalog and stock history (None in older snapshots)
+        self.catalog = None
+        self.stock = None
+        self.forecast = None
+        self.forecast_day = None
+        self._item_catalog_codes = None
+        if meta.get('catalog_format') == CATALOG_FORMAT:
+            self.catalog_skus = meta['catalog_skus']
+            self.catalog_names = meta['catalog_names']
+            self.catalog_created_values = meta['catalog_created_values']
+            self.catalog = {
+                name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+                for name in CATALOG_COLUMN_TYPES
+            }
+            self.stock = {
+                name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+                for name in STOCK_COLUMN_TYPES
+            }
+        if self.catalog is not None and 'forecast_day' in meta:
+            self.forecast_day = meta['forecast_day']
+            self.forecast = {
+                name: np.load(os.path.join(directory, f"{FORECAST_FILES[name]}.npy"), mmap_mode='r')
+                for name in FORECAST_FILES
+            }
+
+    def __len__(self):
+        return self.row_count
+
+    def item_catalog_codes(self):
+        """
+        Catalog code of every item code (-1 for variants not in the catalog)
+
+        Returns:
+            np.ndarray: Indexed by item code
+        """
+        if self._item_catalog_codes is None:
+            self._item_catalog_codes = catalog_codes(np.asarray(self.catalog['catalog_variant_id']),
+                                                     np.asarray(self.item_variant_id))
+        return self._item_catalog_codes
+
+    def day_range(self, start_day=None, end_day=None):
+        """
+        Get the row slice covering [start_day, end_day)
+
+        Rows are sorted by day, so a window is two binary searches.
+
+        Args:
+            start_day (str): Inclusive YYYY-MM-DD lower bound, or None
+            end_day (str): Exclusive YYYY-MM-DD upper bound, or None
+
+        Returns:
+            slice: Row positions inside the window
+        """
+        days = self.columns['day']
+        start = 0 if start_day is None else int(np.searchsorted(days, _day_number(start_day), 'left'))
+        end = len(days) if end_day is None else int(np.searchsorted(days, _day_number(end_day), 'left'))
+        return slice(start, end)
+
+    def top_items(self, metric='revenue', limit=5):
+        """
+        Top (product, variant) items by revenue or quantity, non-refunded only
+
+        Args:
+            metric (str): 'revenue' or 'quantity'
+            limit (int): Number of items to return
+
+        Returns:
+            pd.DataFrame: Columns product_name and the metric, best first
+        """
+        keep = ~self.columns['is_refunded']
+        codes = self.columns['item_code'][keep]
+        size = len(self.item_names)
+
+        sold = np.bincount(codes, minlength=size) > 0
+        totals = np.bincount(codes, weights=self.columns[metric][keep], minlength=size)
+        return self.rank_items(totals, sold, metric, limit)
+
+    def rank_items(self, totals, sold, metric, limit):
+        """
+        Build the top items frame from per-item totals
+
+        Args:
+            totals (np.ndarray): Metric total per item code
+            sold (np.ndarray): True for item codes with at least one counted row
+            metric (str): 'revenue' or 'quantity' (the result column)
+            limit (int): Number of items to return
+
+        Returns:
+            pd.DataFrame: Columns product_name and the metric, best first
+        """
+        candidates = np.flatnonzero(sold)
+        order = candidates[np.argsort(-totals[candidates], kind='stable')][:limit]
+
+        values = totals[order]
+        if metric == 'quantity':
+            values = values.astype(np.int64)
+
+        return pd.DataFrame({
+            'product_name': [self.item_names[code] for code in order],
+            metric: values,
+        })
+
+    def category_revenue(self, limit=8):
+        """
+        Non-refunded revenue per product category
+
+        Matches the dashboard category query: categories without revenue are
+        left out and product_count includes every product of the category.
+
+        Args:
+            limit (int): Number of categories to return
+
+        Returns:
+            pd.DataFrame: Columns category, total_revenue and product_count
+        """
+        type_codes = self.columns['product_type_code']
+        keep = ~self.columns['is_refunded'] & (type_codes >= 0)
+        totals = np.bincount(
+            type_codes[keep],
+            weights=self.columns['revenue'][keep],
+            minlength=len(self.product_types)
+        )
+        return self.rank_categories(totals, limit)
+
+    def rank_categories(self, totals, limit):
+        """
+        Build the category revenue frame from per-product-type revenue
+
+        Args:
+            totals (np.ndarray): Revenue per product type code
+            limit (int): Number of categories to return
+
+        Returns:
+            pd.DataFrame: Columns category, total_revenue and product_count
+        """
+        candidates = np.flatnonzero(totals > 0)
+        order = candidates[np.argsort(-totals[candidates], kind='stable')][:limit]
+
+        return pd.DataFrame({
+            'category': ['Uncategorized' if self.product_types[code] is None else self.product_types[code]
+                         for code in order],
+            'total_revenue': totals[order],
+            'product_count': self.product_type_counts[order],
+        })
+
+
+def load_sales_snapshot():
+    """
+    Get the current snapshot, mapping a newer version when one is published
+
+    Returns:
+        SalesSnapshot or None: The live snapshot, or None if none exists yet
+    """
+    global _loaded_snapshot
+
+    try:
+        with open(CURRENT_POINTER, 'r', encoding='utf-8') as f:
+            version = f.read().strip()
+    except OSError:
+        return None
+
+    snapshot = _loaded_snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    with _snapshot_lock:
+        if _loaded_snapshot is None or _loaded_snapshot.version != version:
+            try:
+                _loaded_snapshot = SalesSnapshot(os.path.join(SNAPSHOT_DIR, version))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"WARNING: Could not load columnar snapshot {version}: {e}")
+                return None
+        return _loaded_snapshot
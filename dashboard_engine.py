@@ -0,0 +1,289 @@
+# -------------------------------------------------------------------------
+# DASHBOARD AGGREGATION ENGINE
+# -------------------------------------------------------------------------
+# The dashboard shows six panels (headline metrics, active product count,
+# top products by revenue and by quantity, revenue by category and the 30
+# day sales trend). In SQL each panel is a separate scan of the line-item
+# facts or orders (DASHBOARD_QUERIES below).
+#
+# This engine computes all six panels from the memory-mapped columnar
+# snapshot (see columnar_snapshot.py) in one pass: the columns are mapped
+# once, the refund masks are built once, and every panel is a bincount
+# (group-by on the integer item, product type, order and day codes) over
+# those shared arrays. Results match the SQL panels row for row.
+#
+# The SQL in DASHBOARD_QUERIES remains the definition of each panel; it is
+# what the dashboard runs when no snapshot has been exported yet, and the
+# baseline of benchmark_dashboard.py. The trend query takes its window as
+# bound parameters (see date_ranges.py and dashboard_query_params()).
+# -------------------------------------------------------------------------
+
+import threading  # For guarding the per-process panel cache
+
+import numpy as np
+import pandas as pd
+
+from date_ranges import DateRange, OPEN_END, utc_today
+
+# Days shown by the sales trend panel
+TREND_DAYS = 30
+
+# Rows shown by the top products and category panels
+TOP_PRODUCTS_LIMIT = 5
+CATEGORY_LIMIT = 8
+
+# Reference SQL of each dashboard panel
+DASHBOARD_QUERIES = {
+    'metrics': """
+        SELECT
+            SUM(o.total_price) as total_sales_value,
+            COUNT(DISTINCT o.id) as total_orders,
+            SUM(f.quantity) as total_units_sold,
+            AVG(o.total_price) as avg_order_value
+        FROM shopify_orders o
+        LEFT JOIN shopify_sales_facts f ON o.id = f.order_id
+        WHERE o.financial_status != 'refunded'
+        """,
+    'product_count': "SELECT COUNT(*) as product_count FROM shopify_products WHERE status = 'active'",
+    'top_revenue': """
+        SELECT
+            CASE
+                WHEN p.title IS NOT NULL THEN p.title || CASE WHEN v.title != 'Default Title' THEN ' - ' || v.title ELSE '' END
+                ELSE 'Unknown Product'
+            END as product_name,
+            s.revenue
+        FROM (
+            SELECT product_id, variant_id, SUM(revenue) as revenue
+            FROM shopify_sales_facts
+            WHERE is_refunded = 0
+            GROUP BY variant_id, product_id
+            ORDER BY revenue DESC
+            LIMIT 5
+        ) s
+        LEFT JOIN shopify_products p ON s.product_id = p.id
+        LEFT JOIN shopify_variants v ON s.variant_id = v.id
+        ORDER BY s.revenue DESC
+        """,
+    'top_quantity': """
+        SELECT
+            CASE
+                WHEN p.title IS NOT NULL THEN p.title || CASE WHEN v.title != 'Default Title' THEN ' - ' || v.title ELSE '' END
+                ELSE 'Unknown Product'
+            END as product_name,
+            s.quantity
+        FROM (
+            SELECT product_id, variant_id, SUM(quantity) as quantity
+            FROM shopify_sales_facts
+            WHERE is_refunded = 0
+            GROUP BY variant_id, product_id
+            ORDER BY quantity DESC
+            LIMIT 5
+        ) s
+        LEFT JOIN shopify_products p ON s.product_id = p.id
+        LEFT JOIN shopify_variants v ON s.variant_id = v.id
+        ORDER BY s.quantity DESC
+        """,
+    'category': """
+        SELECT
+            COALESCE(p.product_type, 'Uncategorized') as category,
+            SUM(f.revenue) as total_revenue,
+            COUNT(DISTINCT p.id) as product_count
+        FROM shopify_products p
+        LEFT JOIN shopify_sales_facts f ON p.id = f.product_id AND f.is_refunded = 0
+        GROUP BY p.product_type
+        HAVING total_revenue > 0
+        ORDER BY total_revenue DESC
+        LIMIT 8
+        """,
+    'trend': """
+        SELECT
+            day as order_date,
+            SUM(revenue) as daily_revenue,
+            SUM(order_count) as daily_orders
+        FROM shopify_daily_order_stats
+        WHERE day >= ? AND day < ?
+        GROUP BY day
+        ORDER BY order_date ASC
+        """,
+}
+
+# Per-process cache of the panels of the current snapshot version and day
+_panels_lock = threading.Lock()
+_cached_panels = {}
+
+
+def dashboard_query_params(trend_window=None):
+    """
+    Bound parameters of the dashboard queries
+
+    Args:
+        trend_window (DateRange): Window of the trend panel, defaults to the
+            last TREND_DAYS days
+
+    Returns:
+        dict: Panel name -> parameters (None for queries without any)
+    """
+    trend_window = trend_window or DateRange.last_days(TREND_DAYS)
+    return {name: (trend_window.bounds() if name == 'trend' else None) for name in DASHBOARD_QUERIES}
+
+
+def _sum_or_none(values):
+    """
+    SUM() semantics: None when there is nothing to add up
+    """
+    return values.sum().item() if len(values) else None
+
+
+def compute_dashboard_panels(snapshot, today=None):
+    """
+    Compute every dashboard panel from a columnar snapshot in one pass
+
+    This function:
+    1. Builds the refund masks of the facts and orders once
+    2. Counts fact rows per order, which the metrics need because the SQL
+       metrics sum order totals over the order/fact join
+    3. Aggregates revenue and quantity per item and revenue per product
+       type with one bincount each over the non-refunded facts
+    4. Aggregates orders and revenue per day for the trend window (see
+       compute_trend_panel())
+
+    Args:
+        snapshot (SalesSnapshot): The mapped snapshot
+        today (date): Day the trend window ends on, defaults to today (UTC,
+            like DATE('now'))
+
+    Returns:
+        dict: Panel name (as in DASHBOARD_QUERIES) -> pd.DataFrame with the
+            same columns and rows as the SQL query
+    """
+    today = today or utc_today()
+    facts = snapshot.columns
+    orders = snapshot.orders
+
+    # Shared masks and keys
+    keep = ~facts['is_refunded']
+    item_codes = facts['item_code'][keep]
+    type_codes = facts['product_type_code'][keep]
+    revenue = facts['revenue'][keep]
+    quantity = facts['quantity']
+    order_codes = facts['order_code']
+
+    item_count = len(snapshot.item_names)
+    order_is_counted = np.asarray(orders['order_is_counted'])
+    order_price = np.asarray(orders['order_total_price'])
+
+    # Headline metrics: every counted order joined to its facts (or to a
+    # single NULL row when it has none)
+    has_order = order_codes >= 0
+    fact_counted = np.zeros(len(order_codes), dtype=bool)
+    fact_counted[has_order] = order_is_counted[order_codes[has_order]]
+    join_rows = np.maximum(np.bincount(order_codes[has_order], minlength=len(order_price)), 1)
+    priced = order_is_counted & ~np.isnan(order_price)
+
+    total_sales = _sum_or_none(order_price[priced] * join_rows[priced])
+    priced_rows = join_rows[priced].sum()
+    units = _sum_or_none(quantity[fact_counted])
+
+    metrics = pd.DataFrame([{
+        'total_sales_value': total_sales,
+        'total_orders': int(order_is_counted.sum()),
+        'total_units_sold': units,
+        'avg_order_value': total_sales / priced_rows if priced_rows else None,
+    }])
+
+    # Top items and categories over the non-refunded facts
+    sold = np.bincount(item_codes, minlength=item_count) > 0
+    item_revenue = np.bincount(item_codes, weights=revenue, minlength=item_count)
+    item_quantity = np.bincount(item_codes, weights=quantity[keep], minlength=item_count)
+
+    known_type = type_codes >= 0
+    type_revenue = np.bincount(
+        type_codes[known_type], weights=revenue[known_type], minlength=len(snapshot.product_types)
+    )
+
+    return {
+        'metrics': metrics,
+        'product_count': pd.DataFrame({'product_count': [snapshot.active_product_count]}),
+        'top_revenue': snapshot.rank_items(item_revenue, sold, 'revenue', TOP_PRODUCTS_LIMIT),
+        'top_quantity': snapshot.rank_items(item_quantity, sold, 'quantity', TOP_PRODUCTS_LIMIT),
+        'category': snapshot.rank_categories(type_revenue, CATEGORY_LIMIT),
+        'trend': compute_trend_panel(snapshot, DateRange.last_days(TREND_DAYS, today)),
+    }
+
+
+def _day_number(day):
+    """
+    Days since 1970-01-01 of a YYYY-MM-DD string (the snapshot's order_day)
+    """
+    return int(np.datetime64(day, 'D').astype(np.int64))
+
+
+def compute_trend_panel(snapshot, window):
+    """
+    Compute the sales trend panel for any window from the snapshot orders
+
+    Matches the trend query: revenue (SUM, NULL when no order of the day
+    has a price) and order count per day, for counted orders whose day
+    falls in the window, oldest day first.
+
+    Args:
+        snapshot (SalesSnapshot): The mapped snapshot
+        window (DateRange): Days to include
+
+    Returns:
+        pd.DataFrame: Columns order_date, daily_revenue and daily_orders
+    """
+    orders = snapshot.orders
+    order_is_counted = np.asarray(orders['order_is_counted'])
+    order_price = np.asarray(orders['order_total_price'])
+    order_day = np.asarray(orders['order_day'])
+
+    start, end = window.bounds()
+    first_day = _day_number(start)
+    in_window = order_is_counted & (order_day >= first_day)
+    if end != OPEN_END:
+        in_window &= order_day < _day_number(end)
+
+    offsets = order_day[in_window] - first_day
+    window_prices = order_price[in_window]
+    window_priced = ~np.isnan(window_prices)
+    day_orders = np.bincount(offsets)
+    day_revenue = np.bincount(offsets[window_priced], weights=window_prices[window_priced],
+                              minlength=len(day_orders))
+    day_priced = np.bincount(offsets[window_priced], minlength=len(day_orders))
+    trend_days = np.flatnonzero(day_orders)
+
+    return pd.DataFrame({
+        'order_date': np.datetime_as_string(
+            (trend_days + first_day).astype('datetime64[D]'), unit='D'
+        ).astype(object),
+        'daily_revenue': np.where(day_priced[trend_days] > 0, day_revenue[trend_days], np.nan),
+        'daily_orders': day_orders[trend_days].astype(np.int64),
+    })
+
+
+def get_dashboard_panels(snapshot):
+    """
+    Get the dashboard panels of a snapshot, computing them once per day
+
+    Panels only change when a new snapshot version is published or the
+    trend window moves to a new day, so every other request reuses them.
+
+    Args:
+        snapshot (SalesSnapshot): The mapped snapshot
+
+    Returns:
+        dict: Panel name -> pd.DataFrame (copies, safe to modify)
+    """
+    key = (snapshot.version, utc_today())
+
+    with _panels_lock:
+        panels = _cached_panels.get(key)
+
+    if panels is None:
+        panels = compute_dashboard_panels(snapshot, key[1])
+        with _panels_lock:
+            _cached_panels.clear()
+            _cached_panels[key] = panels
+
+    return {name: frame.copy() for name, frame in panels.items()}
@@ -0,0 +1,307 @@
+# -------------------------------------------------------------------------
+# DATE RANGES FOR THE INSIGHT PAGES
+# -------------------------------------------------------------------------
+# The dashboard, sales insights and inventory insights pages accept a date
+# range and a comparison period as query parameters:
+#
+#   start=YYYY-MM-DD        first day of the range (inclusive)
+#   end=YYYY-MM-DD          last day of the range (inclusive, optional)
+#   compare=previous|year|none
+#                           previous: the equal-length period just before
+#                           year:     the same days one year earlier
+#   compare_start / compare_end
+#                           an explicit comparison period instead
+#
+# Without parameters every panel keeps its own default window (e.g. the
+# last 30 or 90 days). Ranges reach SQL as bound parameters of the form
+#
+#   day >= ? AND day < ?
+#
+# (an inclusive start and an exclusive end), so the statement text never
+# changes with the range, SQLite reuses the prepared statement, and every
+# window is an index range scan on the day columns of the derived tables.
+#
+# Days are the store-local order days of the derived tables. "Today" is
+# the UTC date, as DATE('now') used to be; a range without an end runs
+# through the latest synced day.
+#
+# Requested days must lie between MIN_DAY and MAX_DAY, which leaves room
+# for the comparison periods and the exclusive end of every range within
+# what datetime.date can represent.
+# -------------------------------------------------------------------------
+
+from datetime import date, datetime, timedelta, timezone
+
+# Exclusive upper bound of ranges without an end day
+OPEN_END = '9999-12-31'
+
+COMPARE_MODES = ('previous', 'year', 'none')
+
+# Earliest and latest day a request may name
+MIN_DAY = date(2, 1, 1)
+MAX_DAY = date(9998, 12, 31)
+
+
+def utc_today():
+    """
+    Today's date as SQLite's DATE('now') sees it (UTC)
+    """
+    return datetime.now(timezone.utc).date()
+
+
+def _parse_day(value, name):
+    """
+    Parse one YYYY-MM-DD query parameter
+
+    Raises:
+        ValueError: If the value is not a valid date between MIN_DAY and MAX_DAY
+    """
+    try:
+        day = date.fromisoformat(value.strip())
+    except ValueError:
+        raise ValueError(f"'{name}' must be a date in YYYY-MM-DD format, got '{value}'")
+    if not MIN_DAY <= day <= MAX_DAY:
+        raise ValueError(f"'{name}' must be between {MIN_DAY.isoformat()} and {MAX_DAY.isoformat()}, got '{value}'")
+    return day
+
+
+def _one_year_before(day):
+    """
+    The same calendar day one year earlier (29 February becomes the 28th)
+    """
+    try:
+        return day.replace(year=day.year - 1)
+    except ValueError:
+        return day.replace(year=day.year - 1, day=28)
+
+
+class DateRange:
+    """
+    A range of order days with an inclusive start and an optional inclusive end
+
+    Usage:
+        window = DateRange.last_days(30)
+        budget.read_sql('trend', "... WHERE day >= ? AND day < ?", window.bounds())
+    """
+
+    def __init__(self, start, end=None, label=None):
+        """
+        Args:
+            start (date): First day of the range
+            end (date): Last day of the range, or None to run through the
+                latest synced day
+            label (str): Text shown in chart titles and legends, defaults to
+                the dates of the range
+        """
+        self.start = start
+        self.end = end
+        self.label = label or (f"{start.isoformat()} to {end.isoformat()}" if end else f"Since {start.isoformat()}")
+
+    @classmethod
+    def last_days(cls, days, today=None):
+        """
+        The range DATE('now', '-<days> days') used to select: from that day on
+        """
+        today = today or utc_today()
+        return cls(today - timedelta(days=days), None, f"Last {days} Days")
+
+    def bounds(self):
+        """
+        Bound parameters of "day >= ? AND day < ?"
+
+        Returns:
+            tuple: (inclusive start, exclusive end) as YYYY-MM-DD strings
+        """
+        end = (self.end + timedelta(days=1)).isoformat() if self.end else OPEN_END
+        return (self.start.isoformat(), end)
+
+    def length_days(self):
+        """
+        Number of days in the range (a range without an end counts up to today)
+        """
+        if self.end is None:
+            return max((utc_today() - self.start).days, 1)
+        return (self.end - self.start).days + 1
+
+    def previous(self):
+        """
+        The equal-length period ending the day before this range starts
+        """
+        days = self.length_days()
+        return DateRange(
+            self.start - timedelta(days=days),
+            self.start - timedelta(days=1),
+            f"Previous {days} Days"
+        )
+
+    def year_before(self):
+        """
+        The same days one year earlier
+        """
+        end = self.end or utc_today()
+        return DateRange(_one_year_before(self.start), _one_year_before(end), "Same Period Last Year")
+
+    def trailing(self, days):
+        """
+        The last <days> days of this range
+        """
+        if self.end is None:
+            return DateRange(utc_today() - timedelta(days=days), None, f"Last {days} Days")
+        start = max(self.start, self.end - timedelta(days=days - 1))
+        return DateRange(start, self.end, f"{days} Days to {self.end.isoformat()}")
+
+    def __repr__(self):
+        return f"DateRange({self.start!r}, {self.end!r})"
+
+
+def covering_bounds(*ranges):
+    """
+    Bound parameters of "day >= ? AND day < ?" covering several ranges
+
+    Queries that aggregate a range and its comparison period with
+    CASE WHEN filter the rows of both with one index range scan.
+
+    Returns:
+        tuple: (inclusive start, exclusive end) as YYYY-MM-DD strings
+    """
+    bounds = [date_range.bounds() for date_range in ranges]
+    return (min(start for start, _ in bounds), max(end for _, end in bounds))
+
+
+class PageRange:
+    """
+    The date range and comparison period selected on an insight page
+
+    Usage:
+        page_range, error = parse_page_range(request.args)
+        window = page_range.window(90)
+        compare = page_range.comparison(window)
+    """
+
+    def __init__(self, selected=None, compare_mode=None, compare_range=None):
+        """
+        Args:
+            selected (DateRange): The requested range, or None for the
+                default window of each panel
+            compare_mode (str): One of COMPARE_MODES, or None if not requested
+            compare_range (DateRange): An explicit comparison period
+        """
+        self.selected = selected
+        self.compare_mode = compare_mode
+        self.compare_range = compare_range
+
+    @property
+    def is_default(self):
+        """True when the page was opened without a range"""
+        return self.selected is None
+
+    @property
+    def compare_requested(self):
+        """True when a comparison period was asked for explicitly"""
+        return self.compare_range is not None or self.compare_mode not in (None, 'none')
+
+    def window(self, default_days):
+        """
+        The range a panel covers
+
+        Args:
+            default_days (int): The panel's window when no range was selected
+
+        Returns:
+            DateRange: The selected range, or the panel's default window
+        """
+        return self.selected or DateRange.last_days(default_days)
+
+    def comparison(self, window):
+        """
+        The period a window is compared against
+
+        Args:
+            window (DateRange): The panel's window (see window())
+
+        Returns:
+            DateRange or None: The comparison period, or None with compare=none
+        """
+        if self.compare_range is not None:
+            return self.compare_range
+        if self.compare_mode == 'none':
+            return None
+        if self.compare_mode == 'year':
+            return window.year_before()
+        return window.previous()
+
+    def query_args(self):
+        """
+        The query parameters that reproduce this selection (for links and forms)
+        """
+        args = {}
+        if self.selected is not None:
+            args['start'] = self.selected.start.isoformat()
+            if self.selected.end is not None:
+                args['end'] = self.selected.end.isoformat()
+        if self.compare_range is not None:
+            args['compare_start'] = self.compare_range.start.isoformat()
+            args['compare_end'] = self.compare_range.end.isoformat()
+        elif self.compare_mode is not None:
+            args['compare'] = self.compare_mode
+        return args
+
+
+def parse_page_range(args):
+    """
+    Read the date range parameters of an insight page request
+
+    This function:
+    1. Parses start/end; an end without a start is rejected
+    2. Parses compare, or compare_start/compare_end (both required)
+    3. Rejects ranges that end before they start
+    4. Rejects ranges whose comparison periods (computed later by the
+       panels, see insight_panels.py) would start before the first day
+       datetime.date can represent
+
+    Invalid parameters come back as an error message together with the
+    default selection, so pages can fall back to their default windows
+    (and the data API can reject the request).
+
+    Args:
+        args (Mapping): The request query parameters (request.args)
+
+    Returns:
+        tuple: (PageRange, error message or None)
+    """
+    try:
+        selected = None
+        start, end = args.get('start'), args.get('end')
+        if start:
+            start_day = _parse_day(start, 'start')
+            end_day = _parse_day(end, 'end') if end else None
+            if end_day is not None and end_day < start_day:
+                raise ValueError("'end' must not be before 'start'")
+            selected = DateRange(start_day, end_day)
+            try:
+                selected.previous().bounds()
+                selected.year_before().bounds()
+            except OverflowError:
+                raise ValueError("the period before the range starts too early to compare against")
+        elif end:
+            raise ValueError("'end' requires a 'start' date")
+
+        compare_mode = args.get('compare') or None
+        if compare_mode is not None and compare_mode not in COMPARE_MODES:
+            raise ValueError(f"'compare' must be one of {', '.join(COMPARE_MODES)}, got '{compare_mode}'")
+
+        compare_range = None
+        compare_start, compare_end = args.get('compare_start'), args.get('compare_end')
+        if compare_start or compare_end:
+            if not (compare_start and compare_end):
+                raise ValueError("'compare_start' and 'compare_end' must be given together")
+            compare_range = DateRange(
+                _parse_day(compare_start, 'compare_start'),
+                _parse_day(compare_end, 'compare_end')
+            )
+            if compare_range.end < compare_range.start:
+                raise ValueError("'compare_end' must not be before 'compare_start'")
+
+        return PageRange(selected, compare_mode, compare_range), None
+    except ValueError as e:
+        return PageRange(), f"Invalid date range: {str(e)}"
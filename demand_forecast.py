@@ -0,0 +1,272 @@
+# -------------------------------------------------------------------------
+# DEMAND FORECASTS
+# -------------------------------------------------------------------------
+# Forecasts the demand of every SKU (variant) from its daily units sold
+# over the last HISTORY_DAYS days:
+#
+# - velocity:  smoothed units sold per day
+# - trend:     smoothed change of the velocity per day
+# - forecast:  units expected over the next HORIZON_DAYS days, with an
+#              INTERVAL_LEVEL prediction interval
+#
+# The model is damped-trend exponential smoothing (Holt's linear method
+# with the trend damped by DAMPING per day), which follows level shifts
+# and trends without extrapolating a trend indefinitely. A variant's
+# smoothing starts on its first day with sales, so a new SKU is not
+# averaged down by the days before it existed. The interval assumes the
+# one-step errors of the history are independent, so the standard error
+# of an HORIZON_DAYS total is the one-step RMSE x sqrt(HORIZON_DAYS).
+#
+# All variants are forecast at once over the day x variant matrix of units
+# sold. The matrix is streamed one day at a time (a bincount of the day's
+# sales, which are sorted by day), and the smoothing recursion steps
+# through the days with every update a vectorized operation across all
+# variants, so memory stays at a handful of per-variant arrays.
+#
+# The forecasts are computed after each sync while the columnar snapshot
+# is exported and stored with it (see columnar_snapshot.py), so the
+# inventory page and the AI prompts read them instead of computing them.
+# Without a snapshot (or once its day has passed) they are computed on
+# demand and cached per version and day.
+# -------------------------------------------------------------------------
+
+import threading  # For guarding the per-process forecast cache
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from date_ranges import utc_today
+from inventory_kpis import get_sku_kpis
+
+# Days of sales history the forecasts are fitted on
+HISTORY_DAYS = 365
+
+# Days ahead the forecasts cover
+HORIZON_DAYS = 14
+
+# Smoothing of the level and trend, and the daily damping of the trend
+LEVEL_SMOOTHING = 0.1
+TREND_SMOOTHING = 0.05
+DAMPING = 0.9
+
+# Prediction interval (80%, z = 1.2816)
+INTERVAL_LEVEL = 0.8
+INTERVAL_Z = 1.2816
+
+# Rows shown by the inventory page and the AI prompt
+FORECAST_PANEL_LIMIT = 15
+
+# Forecast arrays, one value per variant
+FORECAST_COLUMNS = ('velocity', 'trend', 'forecast_units', 'forecast_lower', 'forecast_upper')
+
+DAILY_VARIANT_UNITS_SQL = """
+    SELECT variant_id, day, SUM(units) as units
+    FROM shopify_daily_variant_sales
+    WHERE day >= ? AND day < ?
+    GROUP BY variant_id, day
+    """
+
+# Sum over h = 1..HORIZON_DAYS of the damped trend multiplier (phi + ... + phi^h)
+_TREND_WEIGHT = sum(sum(DAMPING ** i for i in range(1, h + 1)) for h in range(1, HORIZON_DAYS + 1))
+
+# Per-process cache of the forecasts of the current version and day
+_forecasts_lock = threading.Lock()
+_cached_forecasts = {}
+
+
+def _smooth(daily_units, size):
+    """
+    Run damped-trend exponential smoothing through the days
+
+    Args:
+        daily_units (iterable): Units sold per variant (an array of size
+            values) for every day, oldest first
+        size (int): Number of variants
+
+    Returns:
+        tuple: (level, trend, rmse) arrays, one value per variant; all zero
+            for variants without sales
+    """
+    level = np.zeros(size)
+    trend = np.zeros(size)
+    started = np.zeros(size, dtype=bool)
+    squared_errors = np.zeros(size)
+    error_days = np.zeros(size)
+    fitted = np.empty(size)
+    error = np.empty(size)
+    new_level = np.empty(size)
+
+    for units in daily_units:
+        # One-step forecast and its error, counted once a variant has started
+        np.multiply(trend, DAMPING, out=fitted)
+        fitted += level
+        np.subtract(units, fitted, out=error)
+        error *= started
+        squared_errors += error * error
+        error_days += started
+
+        # level = a*y + (1-a)*fitted; trend = b*(level change) + (1-b)*phi*trend
+        np.multiply(error, LEVEL_SMOOTHING, out=new_level)
+        new_level += fitted
+        trend *= (1 - TREND_SMOOTHING) * DAMPING
+        trend += TREND_SMOOTHING * (new_level - level)
+
+        # Variants that have not sold yet restart from the day's units
+        np.copyto(level, units, where=~started)
+        np.copyto(level, new_level, where=started)
+        trend *= started
+        started |= units > 0
+
+    rmse = np.sqrt(np.divide(squared_errors, error_days, out=np.zeros(size), where=error_days > 0))
+    return level, trend, rmse
+
+
+def forecast_demand(codes, days, units, size, today=None):
+    """
+    Forecast every variant from its sales
+
+    Args:
+        codes (np.ndarray): Variant code (0 to size - 1, or -1 to skip) of
+            every sale (line item or daily total)
+        days (np.ndarray): Day number (days since 1970-01-01) of every sale,
+            ideally sorted (unsorted sales are sorted first)
+        units (np.ndarray): Units of every sale
+        size (int): Number of variant codes
+        today (date): First forecast day, defaults to today (UTC); the
+            history is the HISTORY_DAYS days before it
+
+    Returns:
+        dict: Name in FORECAST_COLUMNS -> array indexed by variant code
+    """
+    today = today or utc_today()
+    last = int(np.datetime64(today, 'D').astype(np.int64))
+    first = last - HISTORY_DAYS
+
+    codes = np.asarray(codes)
+    days = np.asarray(days)
+    units = np.asarray(units, dtype=np.float64)
+    if len(days) and np.any(days[1:] < days[:-1]):
+        order = np.argsort(days, kind='stable')
+        codes, days, units = codes[order], days[order], units[order]
+
+    # Row boundaries of every history day, then one matrix row per day
+    bounds = np.searchsorted(days, np.arange(first, last + 1))
+
+    def daily_units():
+        for day in range(HISTORY_DAYS):
+            rows = slice(bounds[day], bounds[day + 1])
+            day_codes = codes[rows]
+            selling = day_codes >= 0
+            yield np.bincount(day_codes[selling], weights=units[rows][selling], minlength=size)
+
+    level, trend, rmse = _smooth(daily_units(), size)
+
+    forecast_units = np.maximum(HORIZON_DAYS * level + _TREND_WEIGHT * trend, 0)
+    margin = INTERVAL_Z * rmse * np.sqrt(HORIZON_DAYS)
+    return {
+        'velocity': np.maximum(level, 0),
+        'trend': trend,
+        'forecast_units': forecast_units,
+        'forecast_lower': np.maximum(forecast_units - margin, 0),
+        'forecast_upper': forecast_units + margin,
+    }
+
+
+def _snapshot_forecasts(snapshot, today):
+    """
+    Forecast arrays of a snapshot's catalog: the stored ones when they were
+    computed for today, otherwise computed from the snapshot's line items
+    """
+    if snapshot.forecast is not None and snapshot.forecast_day == today.isoformat():
+        return {name: np.asarray(values) for name, values in snapshot.forecast.items()}
+
+    keep = ~np.asarray(snapshot.columns['is_refunded'])
+    item_codes = snapshot.item_catalog_codes()
+    return forecast_demand(
+        item_codes[np.asarray(snapshot.columns['item_code'])[keep]],
+        np.asarray(snapshot.columns['day'])[keep],
+        np.asarray(snapshot.columns['quantity'])[keep],
+        len(snapshot.catalog['catalog_variant_id']),
+        today,
+    )
+
+
+def _query_forecasts(conn, variant_ids, today):
+    """
+    Forecast arrays of the given (sorted) variants from the daily rollups
+    """
+    start = (today - timedelta(days=HISTORY_DAYS)).isoformat()
+    sales = pd.read_sql(DAILY_VARIANT_UNITS_SQL, conn, params=(start, today.isoformat()))
+    sale_variants = sales['variant_id'].to_numpy(dtype=np.int64)
+    if len(variant_ids):
+        positions = np.minimum(np.searchsorted(variant_ids, sale_variants), len(variant_ids) - 1)
+        codes = np.where(variant_ids[positions] == sale_variants, positions, -1)
+    else:
+        codes = np.full(len(sales), -1)
+    days = pd.to_datetime(sales['day']).to_numpy().astype('datetime64[D]').astype(np.int64)
+    return forecast_demand(codes, days, sales['units'].to_numpy(dtype=np.float64), len(variant_ids), today)
+
+
+def get_demand_forecasts(conn, data_version, snapshot=None):
+    """
+    Get the demand forecast of every variant, with its current stock
+
+    Args:
+        conn (sqlite3.Connection): Read connection (used without a snapshot)
+        data_version (int): Data version of conn, or None to compute the
+            forecasts without caching them
+        snapshot (SalesSnapshot): The columnar snapshot, if one is published
+
+    Returns:
+        pd.DataFrame: One row per variant (sorted by id) with variant_id,
+            product_id, sku, product_name, product_type, stock_on_hand, the
+            FORECAST_COLUMNS and days_of_cover (stock / velocity, NaN
+            without sales); a copy, safe to modify
+    """
+    today = utc_today()
+    has_catalog = snapshot is not None and snapshot.catalog is not None
+    if has_catalog:
+        key = ('snapshot', snapshot.version, today)
+    elif data_version is not None:
+        key = ('database', data_version, today)
+    else:
+        key = None
+
+    with _forecasts_lock:
+        forecasts = _cached_forecasts.get(key) if key else None
+
+    if forecasts is None:
+        kpis = get_sku_kpis(conn, data_version, snapshot)
+        forecasts = kpis[['variant_id', 'product_id', 'sku', 'product_name', 'product_type', 'stock_on_hand']].copy()
+        if has_catalog:
+            arrays = _snapshot_forecasts(snapshot, today)
+        else:
+            arrays = _query_forecasts(conn, forecasts['variant_id'].to_numpy(dtype=np.int64), today)
+        for name in FORECAST_COLUMNS:
+            forecasts[name] = arrays[name]
+
+        velocity = forecasts['velocity'].to_numpy()
+        stock = pd.to_numeric(forecasts['stock_on_hand'], errors='coerce').to_numpy(dtype='float64').clip(min=0)
+        forecasts['days_of_cover'] = np.divide(stock, velocity, out=np.full(len(velocity), np.nan), where=velocity > 0)
+
+        if key:
+            with _forecasts_lock:
+                _cached_forecasts.clear()
+                _cached_forecasts[key] = forecasts
+
+    return forecasts.copy()
+
+
+def top_forecasts(forecasts, limit=FORECAST_PANEL_LIMIT):
+    """
+    Variants with the highest forecast demand
+
+    Ties are broken by velocity, then by variant id, so the order is stable.
+
+    Returns:
+        pd.DataFrame: The top rows of forecasts (variants forecast to sell)
+    """
+    selling = forecasts[forecasts['forecast_units'] > 0]
+    return selling.sort_values(['forecast_units', 'velocity', 'variant_id'],
+                               ascending=[False, False, True]).head(limit)
@@ -0,0 +1,1057 @@
+# -------------------------------------------------------------------------
+# INSIGHT PANELS
+# -------------------------------------------------------------------------
+# Every chart and table of the dashboard, sales insights and inventory
+# insights pages is a panel: a named query (or columnar computation) that
+# returns one DataFrame. This module is the single definition of each
+# panel, shared by:
+# - the HTML routes, which turn panels into tables and Plotly figures
+# - the JSON API (/api/v1/panels/<name>), which serves one panel at a time
+#
+# Panels of a page run within that page's time budget (query_budget.py) and
+# are read through the data-versioned result cache (query_cache.py).
+# Windowed panels take their days from the page's date range
+# (date_ranges.py), or use their own default window.
+#
+# load_panels_as_completed() runs the panels of a page concurrently on a
+# shared pool of worker threads (each with its own pooled read-only
+# connection) and hands each panel back as soon as it is ready, which lets
+# pages stream panels to the browser instead of waiting for the slowest
+# one; load_panels() waits for all of them. Either way a failing panel
+# only fails itself. A panel's time budget starts when a worker picks it
+# up, so panels queued behind those of concurrent requests are never
+# degraded for the time they spent waiting.
+#
+# Paged panels return one page of PANEL_PAGE_ROWS rows of a complete result
+# ordered by a unique sort key, read by keyset: a page is requested by a
+# cursor holding the key of the row it starts after (or ends before), so
+# reading it is a seek to that key instead of skipping the rows of every
+# earlier page, and deep pages cost the same as the first. The cursor of
+# each panel comes from the request (see page_requests()) and the frame's
+# attrs['page'] carries the cursors of its neighbouring pages.
+# -------------------------------------------------------------------------
+
+import base64     # For URL-safe page cursors
+import json       # For encoding the sort key of a page cursor
+import threading  # For creating the shared worker pool once
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from columnar_snapshot import load_sales_snapshot
+from dashboard_engine import DASHBOARD_QUERIES, TREND_DAYS, compute_trend_panel, dashboard_query_params, get_dashboard_panels
+from date_ranges import PageRange, covering_bounds
+from demand_forecast import get_demand_forecasts, top_forecasts
+from query_budget import RouteBudget
+from shopify_derived import ORDER_DAY_SQL
+from shopify_db import get_read_connection
+from shopify_partitions import partitioned_source
+from variant_scans import scan_count, scan_dead_stock, scan_low_performers, scan_top_performers
+
+# Panel name -> Panel, in page order
+PANELS = {}
+
+# Worker threads running panels concurrently (shared by all requests)
+PANEL_WORKERS = 4
+
+# Rows per page of the paged panels
+PANEL_PAGE_ROWS = 10
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class Panel:
+    """
+    One registered panel
+
+    Attributes:
+        name (str): Panel name, used in the API and the query counters
+        route (str): Page the panel belongs to (and whose budget it uses)
+        loader (callable): loader(context) -> pd.DataFrame
+        description (str): One-line description (the loader's docstring)
+        paged (bool): The loader returns one page of its rows
+        snapshot (bool): The loader reads the columnar snapshot when one is
+            published (see PanelContext.panel_version())
+    """
+
+    def __init__(self, name, route, loader, paged=False, snapshot=False):
+        self.name = name
+        self.route = route
+        self.loader = loader
+        self.paged = paged
+        self.snapshot = snapshot
+        self.description = (loader.__doc__ or '').strip().splitlines()[0] if loader.__doc__ else ''
+
+
+def panel(name, route, paged=False, snapshot=False):
+    """
+    Register a panel loader
+
+    Usage:
+        @panel('dead_stock', 'inventory_insights', paged=True, snapshot=True)
+        def load_dead_stock(context):
+            ...
+    """
+    def register(loader):
+        PANELS[name] = Panel(name, route, loader, paged, snapshot)
+        return loader
+    return register
+
+
+class PanelContext:
+    """
+    What the panels of one request share: connection, budget and date range
+
+    Usage:
+        context = PanelContext(conn, 'sales_insights', page_range)
+        growth = context.load('growth')
+        if context.budget.degraded:
+            flash(...)
+    """
+
+    def __init__(self, conn, route, page_range=None, seconds=None, pages=None):
+        """
+        Args:
+            conn (sqlite3.Connection): Read connection the panels query
+            route (str): Page the request is for
+            page_range (PageRange): Selected date range, defaults to none
+            seconds (float): Time budget override, defaults to the page's
+            pages (dict): Paged panel name -> requested page (as sent in
+                the request), defaults to the first page of every panel
+        """
+        self.conn = conn
+        self.route = route
+        self.page_range = page_range or PageRange()
+        self.pages = pages or {}
+        self.budget = RouteBudget(conn, route, seconds)
+        self._snapshot = None
+        self._snapshot_loaded = False
+
+    @property
+    def data_version(self):
+        """Data version of the connection (None if the database has none)"""
+        return self.budget.data_version
+
+    @property
+    def snapshot(self):
+        """The columnar sales snapshot, or None before the first export"""
+        if not self._snapshot_loaded:
+            self._snapshot = load_sales_snapshot()
+            self._snapshot_loaded = True
+        return self._snapshot
+
+    def panel_version(self, name):
+        """
+        The version of the data a panel's rows are read from
+
+        Snapshot panels read the columnar snapshot, which is exported and
+        versioned on its own (and withdrawn if an export fails), so their
+        rows depend on both versions.
+
+        Returns:
+            tuple or None: (data version, snapshot version or None), or
+                None if the database has no data version
+        """
+        if self.data_version is None:
+            return None
+        snapshot = self.snapshot if PANELS[name].snapshot else None
+        return (self.data_version, snapshot.version if snapshot is not None else None)
+
+    def load(self, name):
+        """
+        Load one panel
+
+        Returns:
+            pd.DataFrame: The panel rows
+        """
+        return PANELS[name].loader(self)
+
+    def page_cursor(self, name, key_length):
+        """
+        The requested page of a paged panel
+
+        Args:
+            name (str): Paged panel name
+            key_length (int): Number of columns of the panel's sort key
+
+        Returns:
+            tuple: (direction, key) of the page cursor (see decode_cursor()),
+                or (None, None) for the first page
+        """
+        return decode_cursor(self.pages.get(name), key_length)
+
+
+def page_requests(route, args, name=None):
+    """
+    Read the requested pages of a page's paged panels
+
+    Pages ask for <panel>_page=<cursor>; the data API, which serves one
+    panel, asks for page=<cursor>.
+
+    Args:
+        route (str): Page the request is for
+        args (Mapping): The request query parameters (request.args)
+        name (str): The panel of a data API request, or None for a page
+
+    Returns:
+        dict: Paged panel name -> requested cursor, for the pages requested
+    """
+    if name is not None:
+        return {name: args['page']} if PANELS[name].paged and args.get('page') else {}
+    return {
+        panel_name: args[f'{panel_name}_page']
+        for panel_name, registered in PANELS.items()
+        if registered.route == route and registered.paged and args.get(f'{panel_name}_page')
+    }
+
+
+# -------------------------------------------------------------------------
+# Keyset pages
+# -------------------------------------------------------------------------
+
+def encode_cursor(direction, key):
+    """
+    Build the cursor of a page
+
+    Args:
+        direction (str): 'after' (the page starts right after key) or
+            'before' (the page ends right before key)
+        key (list): Sort key of the row, one JSON value per column
+
+    Returns:
+        str: The cursor, safe to put in a URL
+    """
+    payload = json.dumps([direction, key], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, key_length):
+    """
+    Read a page cursor built by encode_cursor()
+
+    Returns:
+        tuple: (direction, key list), or (None, None) for a missing or
+            invalid cursor (the first page)
+    """
+    if not cursor:
+        return None, None
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, key = json.loads(payload)
+    except (ValueError, TypeError):
+        return None, None
+    if direction not in ('after', 'before') or not isinstance(key, list) or len(key) != key_length:
+        return None, None
+    if not all(isinstance(value, (int, float, str)) for value in key):
+        return None, None
+    return direction, key
+
+
+def keyset_sql(columns, descending, direction, key):
+    """
+    Build the seek condition and order of one keyset page query
+
+    The condition compares the sort key as a row value, which SQLite
+    answers by seeking an index on the key when there is one. Pages before
+    a key are read in reverse order (nearest row first).
+
+    Args:
+        columns (list): SQL expressions of the sort key, unique per row
+        descending (bool): The panel lists the highest keys first
+        direction (str): 'after' or 'before' key, or None from the start
+        key (list): The cursor's sort key
+
+    Returns:
+        tuple: (condition SQL, ORDER BY SQL, condition parameters)
+    """
+    downward = descending == (direction != 'before')
+    order = ', '.join(f"{column} {'DESC' if downward else 'ASC'}" for column in columns)
+    if key is None:
+        return '1', order, ()
+    condition = f"({', '.join(columns)}) {'<' if downward else '>'} ({', '.join('?' for _ in columns)})"
+    return condition, order, tuple(key)
+
+
+def _read_page(context, name, direction, build):
+    """
+    Run one keyset page query of a paged panel
+
+    Args:
+        context (PanelContext): The request's panel context
+        name (str): Query name (see RouteBudget.read_sql())
+        direction (str): 'after' or 'before' the cursor, or None
+        build (callable): build() -> (sql, params) of the page query
+
+    Returns:
+        pd.DataFrame: The rows, in page order
+    """
+    sql, params = build()
+    rows = context.budget.read_sql(name, sql, params)
+    if direction == 'before':
+        rows = rows.iloc[::-1].reset_index(drop=True)
+    return rows
+
+
+def _sort_key(row, key_columns):
+    """
+    The sort key of a frame row, as JSON values
+    """
+    return [value.item() if hasattr(value, 'item') else value for value in row[key_columns]]
+
+
+def keyset_page(fetch, direction, key, key_columns, count):
+    """
+    Read one page of a paged panel and the cursors of its neighbours
+
+    This function:
+    1. Reads one row more than a page after (or before) the cursor, to
+       know whether the page has a neighbour on that side
+    2. Falls back to the first page when a page before the cursor reaches
+       the start, so the first page always starts at the first row
+    3. Describes the page in attrs['page']: size, total_rows, and the
+       previous and next cursors (None at either end)
+
+    Args:
+        fetch (callable): fetch(direction, key, limit) -> up to limit rows
+            in page order, from the start (direction None) or right after
+            or before key
+        direction (str): 'after' or 'before' key, or None for the first page
+        key (list): The cursor's sort key
+        key_columns (list): Columns of the rows holding the sort key
+        count (callable): count() -> number of rows of all pages
+
+    Returns:
+        pd.DataFrame: The page's rows (a new frame)
+    """
+    rows = fetch(direction, key, PANEL_PAGE_ROWS + 1)
+    if direction == 'before' and len(rows) <= PANEL_PAGE_ROWS:
+        direction, key = None, None
+        rows = fetch(None, None, PANEL_PAGE_ROWS + 1)
+
+    if direction == 'before':
+        # The extra row is the one before the page
+        rows = rows.iloc[1:]
+        has_previous, has_next = True, True
+    else:
+        has_previous, has_next = key is not None, len(rows) > PANEL_PAGE_ROWS
+        rows = rows.iloc[:PANEL_PAGE_ROWS]
+
+    rows = rows.reset_index(drop=True)
+    if len(rows):
+        previous = encode_cursor('before', _sort_key(rows.iloc[0], key_columns)) if has_previous else None
+        following = encode_cursor('after', _sort_key(rows.iloc[-1], key_columns)) if has_next else None
+    else:
+        # Past the last row: back to the rows before the cursor
+        previous = encode_cursor('before', key) if key is not None else None
+        following = None
+
+    rows.attrs['page'] = {
+        'size': PANEL_PAGE_ROWS,
+        'total_rows': int(count()),
+        'previous': previous,
+        'next': following,
+    }
+    return rows
+
+
+# -------------------------------------------------------------------------
+# Windows of each page
+# -------------------------------------------------------------------------
+
+def dashboard_windows(page_range):
+    """
+    Windows of the dashboard panels
+
+    Returns:
+        dict: trend (DateRange) and compare (DateRange, or None when no
+            comparison was requested)
+    """
+    trend = page_range.window(TREND_DAYS)
+    return {
+        'trend': trend,
+        'compare': page_range.comparison(trend) if page_range.compare_requested else None,
+    }
+
+
+def inventory_windows(page_range):
+    """
+    Windows of the inventory insights panels
+
+    Returns:
+        dict: performance (90 days), recent (30 days) and velocity_compare
+    """
+    recent = page_range.window(30)
+    return {
+        'performance': page_range.window(90),
+        'recent': recent,
+        'velocity_compare': page_range.comparison(recent) or recent.previous(),
+    }
+
+
+def sales_windows(page_range):
+    """
+    Windows of the sales insights panels
+
+    Returns:
+        dict: window (30 days), growth_compare, last_week and previous_week
+    """
+    window = page_range.window(30)
+    last_week = window.trailing(7)
+    return {
+        'window': window,
+        'growth_compare': page_range.comparison(window) or window.previous(),
+        'last_week': last_week,
+        'previous_week': last_week.previous(),
+    }
+
+
+# -------------------------------------------------------------------------
+# Dashboard
+# -------------------------------------------------------------------------
+
+def _dashboard_panel(context, name, placeholder=None):
+    """
+    One of the six dashboard panels
+
+    All panels come from one vectorized pass over the snapshot (see
+    dashboard_engine.py); without a snapshot each panel runs its SQL query.
+    """
+    if context.snapshot is not None:
+        return get_dashboard_panels(context.snapshot)[name]
+    params = dashboard_query_params(dashboard_windows(context.page_range)['trend'])
+    return context.budget.read_sql(name, DASHBOARD_QUERIES[name], params[name], placeholder=placeholder)
+
+
+def _trend(context, name, window):
+    """
+    The sales trend of any window (computed on demand for selected ranges)
+    """
+    if context.snapshot is not None:
+        return compute_trend_panel(context.snapshot, window)
+    return context.budget.read_sql(name, DASHBOARD_QUERIES['trend'], window.bounds())
+
+
+@panel('metrics', 'dashboard', snapshot=True)
+def load_metrics(context):
+    """Total sales, orders, units and average order value"""
+    return _dashboard_panel(context, 'metrics', placeholder={
+        'total_sales_value': 0, 'total_orders': 0, 'total_units_sold': 0, 'avg_order_value': 0
+    })
+
+
+@panel('product_count', 'dashboard', snapshot=True)
+def load_product_count(context):
+    """Number of active products"""
+    return _dashboard_panel(context, 'product_count', placeholder={'product_count': 0})
+
+
+@panel('top_revenue', 'dashboard', snapshot=True)
+def load_top_revenue(context):
+    """Top 5 products by revenue"""
+    return _dashboard_panel(context, 'top_revenue')
+
+
+@panel('top_quantity', 'dashboard', snapshot=True)
+def load_top_quantity(context):
+    """Top 5 products by quantity sold"""
+    return _dashboard_panel(context, 'top_quantity')
+
+
+@panel('category', 'dashboard', snapshot=True)
+def load_category(context):
+    """Revenue by product category"""
+    return _dashboard_panel(context, 'category')
+
+
+@panel('trend', 'dashboard', snapshot=True)
+def load_trend(context):
+    """Daily revenue and orders (last 30 days or the selected range)"""
+    if context.page_range.is_default:
+        return _dashboard_panel(context, 'trend')
+    return _trend(context, 'trend', dashboard_windows(context.page_range)['trend'])
+
+
+@panel('trend_compare', 'dashboard', snapshot=True)
+def load_trend_compare(context):
+    """Daily revenue and orders of the comparison period"""
+    windows = dashboard_windows(context.page_range)
+    return _trend(context, 'trend_compare', windows['compare'] or windows['trend'].previous())
+
+
+# -------------------------------------------------------------------------
+# Inventory insights
+# -------------------------------------------------------------------------
+
+# Active variants without a sale in the window (see the SQL fallback of
+# load_dead_stock())
+DEAD_STOCK_SOURCE_SQL = """
+    FROM shopify_variants v
+    JOIN shopify_products p ON p.id = v.product_id
+    WHERE p.status = 'active'
+    AND NOT EXISTS (
+        SELECT 1 FROM shopify_daily_variant_sales r
+        WHERE r.variant_id = v.id AND r.day >= ? AND r.day < ?
+    )
+    """
+
+# Same title as the snapshot catalog (see columnar_snapshot.py)
+VARIANT_TITLE_SQL = """
+        CASE
+            WHEN p.title IS NOT NULL THEN p.title || CASE WHEN v.title != 'Default Title' THEN ' - ' || v.title ELSE '' END
+            ELSE 'Unknown Product'
+        END"""
+
+
+def _has_catalog(context):
+    """True when the panels can scan the snapshot catalog (see variant_scans.py)"""
+    return context.snapshot is not None and context.snapshot.catalog is not None
+
+
+@panel('dead_stock', 'inventory_insights', paged=True, snapshot=True)
+def load_dead_stock(context):
+    """Active variants without sales in the last 90 days (or the selected range), newest first"""
+    window = inventory_windows(context.page_range)['performance']
+    key_columns = ['created_at', 'variant_id']
+    direction, key = context.page_cursor('dead_stock', len(key_columns))
+
+    # One bitmap anti-join over the snapshot catalog (see variant_scans.py)
+    if _has_catalog(context):
+        return keyset_page(
+            lambda direction, key, limit: scan_dead_stock(context.snapshot, window, direction, key, limit),
+            direction, key, key_columns, lambda: scan_count(context.snapshot, window, 'dead_stock'))
+
+    # Without a snapshot: an indexed NOT EXISTS probe of the daily rollup per variant
+    def fetch(direction, key, limit):
+        seek, order, seek_params = keyset_sql(["COALESCE(p.created_at, '')", 'v.id'], True, direction, key)
+        dead_stock_query = f"""
+        SELECT
+            v.id as variant_id,{VARIANT_TITLE_SQL} as title,
+            v.sku,
+            p.product_type,
+            v.price,
+            COALESCE(p.created_at, '') as created_at
+        {DEAD_STOCK_SOURCE_SQL}
+        AND {seek}
+        ORDER BY {order}
+        LIMIT ?
+        """
+        return _read_page(context, 'dead_stock', direction,
+                          lambda: (dead_stock_query, window.bounds() + seek_params + (limit,)))
+
+    def count():
+        dead_stock_count_query = f"SELECT COUNT(*) as total_rows {DEAD_STOCK_SOURCE_SQL}"
+        return context.budget.read_sql('dead_stock_count', dead_stock_count_query, window.bounds(),
+                                       placeholder={'total_rows': 0})['total_rows'].iloc[0]
+
+    return keyset_page(fetch, direction, key, key_columns, count)
+
+
+@panel('top_performers', 'inventory_insights', paged=True, snapshot=True)
+def load_top_performers(context):
+    """Variants by revenue (last 90 days or the selected range), highest first"""
+    window = inventory_windows(context.page_range)['performance']
+    key_columns = ['total_revenue', 'variant_id']
+    direction, key = context.page_cursor('top_performers', len(key_columns))
+
+    # Window totals over the snapshot catalog (see variant_scans.py)
+    if _has_catalog(context):
+        return keyset_page(
+            lambda direction, key, limit: scan_top_performers(context.snapshot, window, direction, key, limit),
+            direction, key, key_columns, lambda: scan_count(context.snapshot, window, 'top_performers'))
+
+    top_performers_source = """
+    FROM shopify_products p
+    JOIN shopify_variants v ON p.id = v.product_id
+    JOIN shopify_daily_variant_sales r ON v.id = r.variant_id
+    WHERE r.day >= ? AND r.day < ?
+    GROUP BY p.id, v.id
+    """
+
+    def fetch(direction, key, limit):
+        seek, order, seek_params = keyset_sql(['total_revenue', 'variant_id'], True, direction, key)
+        top_performers_query = f"""
+        SELECT
+            v.id as variant_id,{VARIANT_TITLE_SQL} as title,
+            v.sku,
+            p.product_type,
+            v.price,
+            SUM(r.units) as total_sold,
+            SUM(r.revenue) as total_revenue
+        {top_performers_source}
+        HAVING {seek}
+        ORDER BY {order}
+        LIMIT ?
+        """
+        return _read_page(context, 'top_performers', direction,
+                          lambda: (top_performers_query, window.bounds() + seek_params + (limit,)))
+
+    def count():
+        top_performers_count_query = f"SELECT COUNT(*) as total_rows FROM (SELECT v.id {top_performers_source})"
+        return context.budget.read_sql('top_performers_count', top_performers_count_query, window.bounds(),
+                                       placeholder={'total_rows': 0})['total_rows'].iloc[0]
+
+    return keyset_page(fetch, direction, key, key_columns, count)
+
+
+@panel('variant_analysis', 'inventory_insights')
+def load_variant_analysis(context):
+    """Active products by number of variants, with units sold"""
+    variant_analysis_query = """
+    SELECT
+        p.title,
+        p.product_type,
+        COUNT(v.id) as variant_count,
+        SUM(COALESCE(f.quantity, 0)) as total_sold
+    FROM shopify_products p
+    LEFT JOIN shopify_variants v ON p.id = v.product_id
+    LEFT JOIN shopify_sales_facts f ON v.id = f.variant_id
+    WHERE p.status = 'active'
+    GROUP BY p.id
+    ORDER BY variant_count DESC
+    LIMIT 15
+    """
+    return context.budget.read_sql('variant_analysis', variant_analysis_query)
+
+
+@panel('new_products', 'inventory_insights')
+def load_new_products(context):
+    """Products added in the last 30 days (or the selected range), with sales"""
+    new_products_query = """
+    SELECT
+        p.title,
+        v.sku,
+        p.product_type,
+        v.price,
+        p.created_at,
+        COALESCE(SUM(f.quantity), 0) as sales_since_launch
+    FROM shopify_products p
+    LEFT JOIN shopify_variants v ON p.id = v.product_id
+    LEFT JOIN shopify_sales_facts f ON v.id = f.variant_id
+    WHERE p.created_at >= ? AND p.created_at < ?
+    GROUP BY p.id, v.id
+    ORDER BY p.created_at DESC
+    LIMIT 10
+    """
+    window = inventory_windows(context.page_range)['recent']
+    return context.budget.read_sql('new_products', new_products_query, window.bounds())
+
+
+@panel('status', 'inventory_insights')
+def load_status(context):
+    """Number of products per status"""
+    status_query = """
+    SELECT
+        status,
+        COUNT(*) as count
+    FROM shopify_products
+    GROUP BY status
+    """
+    return context.budget.read_sql('status', status_query)
+
+
+@panel('category_performance', 'inventory_insights')
+def load_category_performance(context):
+    """Products, units and revenue per category (last 90 days or the selected range)"""
+    category_performance_query = """
+    SELECT
+        COALESCE(p.product_type, 'Uncategorized') as category,
+        COUNT(DISTINCT p.id) as product_count,
+        SUM(COALESCE(r.units, 0)) as total_sold,
+        SUM(COALESCE(r.revenue, 0)) as total_revenue
+    FROM shopify_products p
+    LEFT JOIN shopify_daily_variant_sales r ON p.id = r.product_id AND r.day >= ? AND r.day < ?
+    WHERE p.status = 'active'
+    GROUP BY p.product_type
+    ORDER BY total_revenue DESC
+    LIMIT 8
+    """
+    window = inventory_windows(context.page_range)['performance']
+    return context.budget.read_sql('category_performance', category_performance_query, window.bounds())
+
+
+@panel('velocity', 'inventory_insights')
+def load_velocity(context):
+    """Units per product in the recent vs the comparison period"""
+    velocity_query = """
+    SELECT
+        p.title,
+        SUM(CASE WHEN r.day >= ? AND r.day < ? THEN r.units ELSE 0 END) as last_30_days,
+        SUM(CASE WHEN r.day >= ? AND r.day < ? THEN r.units ELSE 0 END) as prev_30_days
+    FROM shopify_products p
+    JOIN shopify_daily_variant_sales r ON p.id = r.product_id
+    WHERE r.day >= ? AND r.day < ?
+    GROUP BY p.id
+    HAVING (last_30_days + prev_30_days) > 5
+    ORDER BY (last_30_days + prev_30_days) DESC
+    LIMIT 10
+    """
+    windows = inventory_windows(context.page_range)
+    recent, compare = windows['recent'], windows['velocity_compare']
+    params = recent.bounds() + compare.bounds() + covering_bounds(recent, compare)
+    return context.budget.read_sql('velocity', velocity_query, params)
+
+
+@panel('demand_forecast', 'inventory_insights', snapshot=True)
+def load_demand_forecast(context):
+    """Variants with the highest forecast demand over the next 14 days"""
+    forecasts = top_forecasts(get_demand_forecasts(context.conn, context.data_version, context.snapshot))
+    return forecasts.rename(columns={'product_name': 'title'})[[
+        'title', 'sku', 'stock_on_hand', 'velocity', 'trend',
+        'forecast_units', 'forecast_lower', 'forecast_upper', 'days_of_cover'
+    ]].reset_index(drop=True)
+
+
+# -------------------------------------------------------------------------
+# Sales insights
+# -------------------------------------------------------------------------
+
+@panel('growth', 'sales_insights')
+def load_growth(context):
+    """Variants with the largest revenue growth vs the comparison period"""
+    growth_query = """
+    SELECT
+        p.title,
+        v.sku,
+        p.product_type,
+        SUM(CASE WHEN r.day >= ? AND r.day < ? THEN r.revenue ELSE 0 END) as recent_revenue,
+        SUM(CASE WHEN r.day >= ? AND r.day < ? THEN r.revenue ELSE 0 END) as prev_revenue
+    FROM shopify_products p
+    JOIN shopify_variants v ON p.id = v.product_id
+    JOIN shopify_daily_variant_sales r ON v.id = r.variant_id
+    WHERE r.day >= ? AND r.day < ?
+    GROUP BY p.id, v.id
+    HAVING prev_revenue > 0
+    ORDER BY (recent_revenue - prev_revenue) DESC
+    LIMIT 10
+    """
+    windows = sales_windows(context.page_range)
+    window, compare = windows['window'], windows['growth_compare']
+    params = window.bounds() + compare.bounds() + covering_bounds(window, compare)
+    growth_analysis = context.budget.read_sql('growth', growth_query, params)
+
+    # Calculate growth rate
+    if not growth_analysis.empty:
+        growth_analysis['growth_rate'] = ((growth_analysis['recent_revenue'] - growth_analysis['prev_revenue']) / growth_analysis['prev_revenue'] * 100).round(2)
+    return growth_analysis
+
+
+@panel('low_performers', 'sales_insights', paged=True, snapshot=True)
+def load_low_performers(context):
+    """Active variants with the lowest revenue in the period (launched before it)"""
+    window = sales_windows(context.page_range)['window']
+    key_columns = ['total_revenue', 'total_sold', 'variant_id']
+    direction, key = context.page_cursor('low_performers', len(key_columns))
+
+    # Window totals over the snapshot catalog (see variant_scans.py)
+    if _has_catalog(context):
+        return keyset_page(
+            lambda direction, key, limit: scan_low_performers(context.snapshot, window, direction, key, limit),
+            direction, key, key_columns, lambda: scan_count(context.snapshot, window, 'low_performers'))
+
+    start = window.bounds()[0]
+
+    def fetch(direction, key, limit):
+        seek, order, seek_params = keyset_sql(['COALESCE(s.revenue, 0.0)', 'COALESCE(s.units, 0)', 'v.id'],
+                                              False, direction, key)
+        low_performers_query = f"""
+        SELECT
+            v.id as variant_id,{VARIANT_TITLE_SQL} as title,
+            v.sku,
+            p.product_type,
+            v.price,
+            COALESCE(s.units, 0) as total_sold,
+            COALESCE(s.revenue, 0.0) as total_revenue,
+            p.created_at
+        FROM shopify_variants v
+        JOIN shopify_products p ON p.id = v.product_id
+        LEFT JOIN (
+            SELECT variant_id, SUM(units) as units, SUM(revenue) as revenue
+            FROM shopify_daily_variant_sales
+            WHERE day >= ? AND day < ?
+            GROUP BY variant_id
+        ) s ON s.variant_id = v.id
+        WHERE p.status = 'active'
+        AND p.created_at <= ?  -- Exclude products launched during the period
+        AND {seek}
+        ORDER BY {order}
+        LIMIT ?
+        """
+        return _read_page(context, 'low_performers', direction,
+                          lambda: (low_performers_query, window.bounds() + (start,) + seek_params + (limit,)))
+
+    def count():
+        low_performers_count_query = """
+        SELECT COUNT(*) as total_rows
+        FROM shopify_variants v
+        JOIN shopify_products p ON p.id = v.product_id
+        WHERE p.status = 'active'
+        AND p.created_at <= ?
+        """
+        return context.budget.read_sql('low_performers_count', low_performers_count_query, (start,),
+                                       placeholder={'total_rows': 0})['total_rows'].iloc[0]
+
+    return keyset_page(fetch, direction, key, key_columns, count)
+
+
+@panel('high_value_orders', 'sales_insights', paged=True)
+def load_high_value_orders(context):
+    """Non-refunded orders by value (last 30 days or the selected range), highest first"""
+    window = sales_windows(context.page_range)['window']
+    key_columns = ['total_price', 'order_id']
+    direction, key = context.page_cursor('high_value_orders', len(key_columns))
+
+    # Only the monthly order partitions of the window are read, and the day
+    # bounds are an index range scan on each of them
+    order_source = partitioned_source(context.conn.cursor(), 'shopify_orders', *window.bounds())
+    orders_filter = f"""
+    WHERE o.financial_status != 'refunded'
+    AND o.total_price IS NOT NULL
+    AND {ORDER_DAY_SQL} >= ? AND {ORDER_DAY_SQL} < ?
+    """
+
+    def fetch(direction, key, limit):
+        seek, order, seek_params = keyset_sql(['o.total_price', 'o.id'], True, direction, key)
+        high_value_orders_query = f"""
+        SELECT
+            o.id as order_id,
+            o.total_price,
+            o.created_at,
+            COUNT(f.line_item_id) as item_count,
+            o.email
+        FROM {order_source} o
+        JOIN shopify_sales_facts f ON o.id = f.order_id
+        {orders_filter}
+        AND {seek}
+        GROUP BY o.id
+        ORDER BY {order}
+        LIMIT ?
+        """
+        return _read_page(context, 'high_value_orders', direction,
+                          lambda: (high_value_orders_query, window.bounds() + seek_params + (limit,)))
+
+    def count():
+        high_value_orders_count_query = f"""
+        SELECT COUNT(*) as total_rows
+        FROM {order_source} o
+        {orders_filter}
+        AND EXISTS (SELECT 1 FROM shopify_sales_facts f WHERE f.order_id = o.id)
+        """
+        return context.budget.read_sql('high_value_orders_count', high_value_orders_count_query, window.bounds(),
+                                       placeholder={'total_rows': 0})['total_rows'].iloc[0]
+
+    return keyset_page(fetch, direction, key, key_columns, count)
+
+
+@panel('customer_patterns', 'sales_insights', paged=True)
+def load_customer_patterns(context):
+    """Repeat customers by total spent, highest first"""
+    key_columns = ['total_spent', 'customer_id']
+    direction, key = context.page_cursor('customer_patterns', len(key_columns))
+
+    def fetch(direction, key, limit):
+        # A seek into the repeat-customer index on the customer dimension
+        seek, order, seek_params = keyset_sql(['c.total_spent', 'c.customer_id'], True, direction, key)
+        customer_patterns_query = f"""
+        SELECT
+            c.customer_id,
+            c.email,
+            c.order_count,
+            c.total_spent,
+            c.total_spent / c.order_count as avg_order_value,
+            c.first_order,
+            c.last_order
+        FROM shopify_customers c
+        WHERE c.order_count > 1
+        AND {seek}
+        ORDER BY {order}
+        LIMIT ?
+        """
+        return _read_page(context, 'customer_patterns', direction,
+                          lambda: (customer_patterns_query, seek_params + (limit,)))
+
+    def count():
+        customer_patterns_count_query = """
+        SELECT COUNT(*) as total_rows FROM shopify_customers WHERE order_count > 1
+        """
+        return context.budget.read_sql('customer_patterns_count', customer_patterns_count_query,
+                                       placeholder={'total_rows': 0})['total_rows'].iloc[0]
+
+    return keyset_page(fetch, direction, key, key_columns, count)
+
+
+@panel('category_trends', 'sales_insights')
+def load_category_trends(context):
+    """Category revenue of the last week, the week before and the whole period"""
+    category_trends_query = """
+    SELECT
+        COALESCE(p.product_type, 'Uncategorized') as category,
+        SUM(CASE WHEN r.day >= ? AND r.day < ? THEN r.revenue ELSE 0 END) as last_7_days,
+        SUM(CASE WHEN r.day >= ? AND r.day < ? THEN r.revenue ELSE 0 END) as prev_7_days,
+        SUM(CASE WHEN r.day >= ? AND r.day < ? THEN r.revenue ELSE 0 END) as last_30_days
+    FROM shopify_products p
+    JOIN shopify_daily_variant_sales r ON p.id = r.product_id
+    WHERE r.day >= ? AND r.day < ?
+    GROUP BY p.product_type
+    ORDER BY last_30_days DESC
+    """
+    windows = sales_windows(context.page_range)
+    params = (windows['last_week'].bounds() + windows['previous_week'].bounds() + windows['window'].bounds()
+              + covering_bounds(windows['window'], windows['previous_week']))
+    return context.budget.read_sql('category_trends', category_trends_query, params)
+
+
+@panel('hourly_sales', 'sales_insights')
+def load_hourly_sales(context):
+    """Orders and revenue per hour of day (last 30 days or the selected range)"""
+    hourly_sales_query = """
+    SELECT
+        hour,
+        SUM(order_count) as order_count,
+        SUM(revenue) as revenue
+    FROM shopify_daily_order_stats
+    WHERE day >= ? AND day < ?
+    GROUP BY hour
+    ORDER BY hour
+    """
+    window = sales_windows(context.page_range)['window']
+    return context.budget.read_sql('hourly_sales', hourly_sales_query, window.bounds())
+
+
+# -------------------------------------------------------------------------
+# Concurrent loading
+# -------------------------------------------------------------------------
+
+def page_panels(route):
+    """
+    Names of the panels of a page, in page order
+    """
+    return [name for name, registered in PANELS.items() if registered.route == route]
+
+
+def _get_executor():
+    """
+    Get the shared worker pool, creating it on first use
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PANEL_WORKERS, thread_name_prefix='panel')
+        return _executor
+
+
+def _load_in_worker(route, name, page_range, pages):
+    """
+    Load one panel on a worker thread
+
+    Each worker uses its own pooled read connection. The page's time budget
+    starts here, when the panel starts running, rather than when the request
+    submitted it: the pool is shared by every request, and time spent queued
+    behind other requests' panels is not the panel's query being slow.
+
+    Returns:
+        tuple: (pd.DataFrame, True if the panel was served degraded,
+            version the panel was read at, see PanelContext.panel_version())
+    """
+    conn = get_read_connection()
+    try:
+        context = PanelContext(conn, route, page_range, pages=pages)
+        frame = context.load(name)
+        return frame, bool(context.budget.degraded), context.panel_version(name)
+    finally:
+        conn.close()
+
+
+def load_panels_as_completed(route, names, page_range=None, pages=None):
+    """
+    Load several panels of a page concurrently, in completion order
+
+    A panel that fails does not fail the others: its error is handed back
+    in place of its rows. If the caller stops early (e.g. the browser left
+    a streamed page), the panels that have not started yet are cancelled,
+    so they do not hold up the pool shared with other requests.
+
+    Args:
+        route (str): Page the panels belong to (sets each panel's time budget)
+        names (list): Panel names
+        page_range (PageRange): Selected date range
+        pages (dict): Requested pages of the paged panels (see page_requests())
+
+    Yields:
+        tuple: (name, pd.DataFrame or None, degraded flag, error message or
+            None, panel version or None)
+    """
+    executor = _get_executor()
+    futures = {
+        executor.submit(_load_in_worker, route, name, page_range, pages): name
+        for name in names
+    }
+
+    try:
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                frame, degraded, version = future.result()
+            except Exception as e:
+                print(f"WARNING: Panel {route}.{name} failed: {e}")
+                yield name, None, False, str(e), None
+                continue
+            yield name, frame, degraded, None, version
+    finally:
+        # Running and finished panels ignore this
+        for future in futures:
+            future.cancel()
+
+
+class PanelResults:
+    """
+    The panels of one page, loaded concurrently (see load_panels())
+
+    Attributes:
+        frames (dict): Panel name -> pd.DataFrame, for every panel that loaded
+        degraded (list): Panels served stale or placeholder data
+        errors (dict): Panel name -> error message, for every panel that failed
+        versions (dict): Panel name -> version the panel was read at (see
+            PanelContext.panel_version()), for every panel that loaded
+    """
+
+    def __init__(self):
+        self.frames = {}
+        self.degraded = []
+        self.errors = {}
+        self.versions = {}
+
+    def frame(self, name):
+        """
+        The rows of a panel, or an empty DataFrame if the panel failed
+        """
+        return self.frames.get(name, pd.DataFrame())
+
+
+def load_panels(route, names, page_range=None, pages=None):
+    """
+    Load several panels of a page concurrently and wait for all of them
+
+    The page takes about as long as its slowest panel instead of the sum
+    of all of them: SQLite releases the GIL while a statement runs, so the
+    workers' queries overlap.
+
+    Args:
+        route (str): Page the panels belong to (sets each panel's time budget)
+        names (list): Panel names
+        page_range (PageRange): Selected date range
+        pages (dict): Requested pages of the paged panels (see page_requests())
+
+    Returns:
+        PanelResults: The loaded panels, and which ones degraded or failed
+    """
+    results = PanelResults()
+    for name, frame, degraded, error, version in load_panels_as_completed(route, names, page_range, pages):
+        if error is not None:
+            results.errors[name] = error
+            continue
+        results.frames[name] = frame
+        if degraded:
+            results.degraded.append(name)
+        results.versions[name] = version
+    return results
@@ -0,0 +1,294 @@
+# -------------------------------------------------------------------------
+# INVENTORY KPI ENGINE
+# -------------------------------------------------------------------------
+# Computes the inventory KPIs of every SKU (variant) over the last
+# KPI_WINDOW_DAYS days:
+#
+# - sell-through:  units sold / (units sold + units on hand), in percent
+# - turnover:      units sold / average units on hand over the window
+# - days on hand:  units on hand / average units sold per day
+#
+# Inputs, each at most one value per variant:
+# - units and revenue sold in the window (non-refunded lines)
+# - the current stock (inventory_quantity)
+# - the time-weighted average stock over the window from the inventory
+#   history (see average_levels() in shopify_inventory.py); variants
+#   without history use the average of their opening and closing stock,
+#   taking the opening stock as today's stock plus the units sold since
+#
+# compute_sku_kpis() takes all of them from the columnar snapshot (see
+# columnar_snapshot.py), whose catalog and stock columns are exported after
+# each sync: sales are a bincount over the window's line items, the average
+# stock one pass over the resolved stock levels, and the KPIs array
+# expressions over all variants at once. query_sku_kpis() computes the same
+# frame from SQL (shopify_daily_variant_sales and the inventory history
+# tables) when no snapshot with a catalog exists yet.
+#
+# Results only change when new data is published or the window moves to a
+# new day, so they are computed once per (version, day) and shared by every
+# request of the process.
+# -------------------------------------------------------------------------
+
+import threading  # For guarding the per-process KPI cache
+
+import numpy as np
+import pandas as pd
+
+from date_ranges import DateRange, utc_today
+from shopify_inventory import average_levels, get_average_stock
+
+# Days of sales and stock the KPIs cover
+KPI_WINDOW_DAYS = 90
+
+# Rows shown by the dashboard's top sell-through list
+TOP_SELL_THROUGH_LIMIT = 5
+
+SKU_SALES_SQL = """
+    SELECT variant_id, SUM(units) as units_sold, SUM(revenue) as revenue
+    FROM shopify_daily_variant_sales
+    WHERE day >= ? AND day < ?
+    GROUP BY variant_id
+    """
+
+SKU_STOCK_SQL = """
+    SELECT
+        v.id as variant_id,
+        v.product_id,
+        v.sku,
+        CASE
+            WHEN p.title IS NOT NULL THEN p.title || CASE WHEN v.title != 'Default Title' THEN ' - ' || v.title ELSE '' END
+            ELSE 'Unknown Product'
+        END as product_name,
+        p.product_type,
+        v.inventory_quantity as stock_on_hand
+    FROM shopify_variants v
+    LEFT JOIN shopify_products p ON v.product_id = p.id
+    ORDER BY v.id
+    """
+
+# Per-process cache of the KPIs of the current version and day
+_kpis_lock = threading.Lock()
+_cached_kpis = {}
+
+
+def _ratio(numerator, denominator):
+    """
+    Element-wise numerator / denominator, NaN where the denominator is not positive
+    """
+    result = np.full(len(numerator), np.nan)
+    np.divide(numerator, denominator, out=result, where=denominator > 0)
+    return result
+
+
+def _positions(sorted_ids, ids):
+    """
+    Positions of ids in a sorted id array
+
+    Returns:
+        tuple: (positions, found) where found is False for ids not present
+    """
+    if not len(sorted_ids):
+        return np.zeros(len(ids), dtype=np.int64), np.zeros(len(ids), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+    return positions, sorted_ids[positions] == ids
+
+
+def _kpi_frame(kpis, units_sold, revenue, avg_stock):
+    """
+    Add the sales, average stock and KPI columns to the variant rows
+
+    Args:
+        kpis (pd.DataFrame): One row per variant, with stock_on_hand
+        units_sold, revenue (np.ndarray): Window totals per variant row
+        avg_stock (np.ndarray): Average stock per variant row (NaN without history)
+
+    Returns:
+        pd.DataFrame: kpis with the columns added
+    """
+    stock = pd.to_numeric(kpis['stock_on_hand'], errors='coerce').to_numpy(dtype='float64').clip(min=0)
+    tracked = ~np.isnan(stock)
+    on_hand = np.nan_to_num(stock)
+
+    # Without history, average the closing stock and the opening stock
+    # (closing stock plus the units sold since)
+    avg_stock = avg_stock.clip(min=0)
+    avg_stock = np.where(np.isnan(avg_stock), stock + units_sold / 2, avg_stock)
+
+    kpis['units_sold'] = units_sold.astype(np.int64)
+    kpis['revenue'] = revenue
+    kpis['avg_stock'] = avg_stock
+    kpis['sell_through'] = np.where(tracked, _ratio(units_sold * 100, units_sold + on_hand), np.nan)
+    kpis['turnover'] = np.where(tracked, _ratio(units_sold, avg_stock), np.nan)
+    kpis['days_on_hand'] = np.where(tracked, _ratio(on_hand, units_sold / KPI_WINDOW_DAYS), np.nan)
+    return kpis
+
+
+def compute_sku_kpis(snapshot, today=None):
+    """
+    Compute sell-through, turnover and days on hand for every variant from a snapshot
+
+    This function:
+    1. Totals the non-refunded units and revenue of the window's line items
+       per item, then per catalog variant
+    2. Averages the stock levels over the window per catalog variant
+    3. Computes the three KPIs as array expressions over all variants
+
+    Variants without a tracked stock level have no KPIs (NaN). Negative
+    stock (oversold variants) counts as none on hand.
+
+    Args:
+        snapshot (SalesSnapshot): A mapped snapshot with catalog columns
+        today (date): Last day of the window, defaults to today (UTC)
+
+    Returns:
+        pd.DataFrame: One row per variant (sorted by id) with variant_id,
+            product_id, sku, product_name, product_type, stock_on_hand,
+            units_sold, revenue, avg_stock, sell_through, turnover and
+            days_on_hand
+    """
+    today = today or utc_today()
+    window = DateRange.last_days(KPI_WINDOW_DAYS, today)
+    catalog = snapshot.catalog
+    variant_ids = np.asarray(catalog['catalog_variant_id'])
+    size = len(variant_ids)
+
+    # Units and revenue per item, then per variant (items of variants no
+    # longer in the catalog are left out)
+    rows = snapshot.day_range(*window.bounds())
+    keep = ~snapshot.columns['is_refunded'][rows]
+    codes = snapshot.columns['item_code'][rows][keep]
+    item_count = len(snapshot.item_names)
+    item_units = np.bincount(codes, weights=snapshot.columns['quantity'][rows][keep], minlength=item_count)
+    item_revenue = np.bincount(codes, weights=snapshot.columns['revenue'][rows][keep], minlength=item_count)
+    item_catalog_codes = snapshot.item_catalog_codes()
+    in_catalog = item_catalog_codes >= 0
+    units_sold = np.bincount(item_catalog_codes[in_catalog], weights=item_units[in_catalog], minlength=size)
+    revenue = np.bincount(item_catalog_codes[in_catalog], weights=item_revenue[in_catalog], minlength=size)
+
+    # Average stock over the window's days
+    _, avg_stock = average_levels(
+        np.asarray(snapshot.stock['stock_catalog_code']),
+        np.asarray(snapshot.stock['stock_day']),
+        np.asarray(snapshot.stock['stock_level']),
+        int(np.datetime64(window.start, 'D').astype(np.int64)),
+        int(np.datetime64(today, 'D').astype(np.int64)),
+        size,
+    )
+
+    type_codes = np.asarray(catalog['catalog_type_code'])
+    product_types = np.array(snapshot.product_types + [None], dtype=object)
+    kpis = pd.DataFrame({
+        'variant_id': variant_ids,
+        'product_id': np.asarray(catalog['catalog_product_id']),
+        'sku': snapshot.catalog_skus,
+        'product_name': snapshot.catalog_names,
+        'product_type': product_types[type_codes],
+        'stock_on_hand': np.asarray(catalog['catalog_stock']),
+    })
+    return _kpi_frame(kpis, units_sold, revenue, avg_stock)
+
+
+def query_sku_kpis(conn, today=None):
+    """
+    Compute the KPIs of every variant from SQL (no snapshot catalog yet)
+
+    Args:
+        conn (sqlite3.Connection): Read connection
+        today (date): Last day of the window, defaults to today (UTC)
+
+    Returns:
+        pd.DataFrame: As compute_sku_kpis()
+    """
+    today = today or utc_today()
+    window = DateRange.last_days(KPI_WINDOW_DAYS, today)
+
+    kpis = pd.read_sql(SKU_STOCK_SQL, conn)
+    sales = pd.read_sql(SKU_SALES_SQL, conn, params=window.bounds())
+    average_stock = get_average_stock(window.start.isoformat(), today.isoformat(), conn=conn)
+
+    # Align sales and average stock to the (sorted) variant rows
+    variant_ids = kpis['variant_id'].to_numpy()
+
+    def aligned(frame, column):
+        values = np.full(len(variant_ids), np.nan)
+        positions, found = _positions(variant_ids, frame['variant_id'].to_numpy(dtype=np.int64))
+        values[positions[found]] = frame[column].to_numpy(dtype='float64')[found]
+        return values
+
+    return _kpi_frame(kpis, np.nan_to_num(aligned(sales, 'units_sold')),
+                      np.nan_to_num(aligned(sales, 'revenue')), aligned(average_stock, 'avg_quantity'))
+
+
+def get_sku_kpis(conn, data_version, snapshot=None):
+    """
+    Get the KPIs of every variant, computing them once per version and day
+
+    Args:
+        conn (sqlite3.Connection): Read connection (used without a snapshot)
+        data_version (int): Data version of conn, or None to compute the
+            SQL KPIs without caching them
+        snapshot (SalesSnapshot): The columnar snapshot, if one is published
+
+    Returns:
+        pd.DataFrame: As compute_sku_kpis() (a copy, safe to modify)
+    """
+    today = utc_today()
+    if snapshot is not None and snapshot.catalog is not None:
+        key = ('snapshot', snapshot.version, today)
+        compute = lambda: compute_sku_kpis(snapshot, today)
+    elif data_version is not None:
+        key = ('database', data_version, today)
+        compute = lambda: query_sku_kpis(conn, today)
+    else:
+        return query_sku_kpis(conn, today)
+
+    with _kpis_lock:
+        kpis = _cached_kpis.get(key)
+
+    if kpis is None:
+        kpis = compute()
+        with _kpis_lock:
+            _cached_kpis.clear()
+            _cached_kpis[key] = kpis
+
+    return kpis.copy()
+
+
+def summarize_kpis(kpis):
+    """
+    Catalog averages of the KPIs for the dashboard cards
+
+    Each average is over the variants the KPI is defined for: sell-through
+    over variants with stock or sales, turnover over variants that held
+    stock, days on hand over variants that sold.
+
+    Args:
+        kpis (pd.DataFrame): As returned by get_sku_kpis()
+
+    Returns:
+        dict: avg_sell_through (percent), avg_turnover_ratio and
+            avg_days_on_hand, rounded to one decimal (0 when undefined)
+    """
+    def mean(column):
+        values = kpis[column].dropna()
+        return round(float(values.mean()), 1) if len(values) else 0
+
+    return {
+        'avg_sell_through': mean('sell_through'),
+        'avg_turnover_ratio': mean('turnover'),
+        'avg_days_on_hand': mean('days_on_hand'),
+    }
+
+
+def top_sell_through(kpis, limit=TOP_SELL_THROUGH_LIMIT):
+    """
+    Variants with the highest sell-through that sold in the window
+
+    Ties are broken by units sold, then by variant id, so the order is stable.
+
+    Returns:
+        pd.DataFrame: The top rows of kpis
+    """
+    sold = kpis[(kpis['units_sold'] > 0) & kpis['sell_through'].notna()]
+    return sold.sort_values(['sell_through', 'units_sold', 'variant_id'],
+                            ascending=[False, False, True]).head(limit)
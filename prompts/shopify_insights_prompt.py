@@ -51,6 +51,9 @@ Inventory Status:
 Product Performance:
 {product_performance}
 
+Demand Forecast (units per day, trend and units expected over the next 14 days with an 80% interval):
+{demand_forecast}
+
 Generate 5 INVENTORY INTELLIGENCE insight cards with the following format:
 
 ### **🔹 INVENTORY INTELLIGENCE**
@@ -69,5 +72,5 @@ Generate 5 INVENTORY INTELLIGENCE insight cards with the following format:
 3. [Marketing or display change]
 4. [Performance tracking metric]
 
-Focus on stock levels, sales velocity, product variants, and revenue optimization. Every insight must have specific numbers and detailed reasoning behind the recommendation.
+Focus on stock levels, sales velocity, product variants, and revenue optimization. Use the demand forecast to size reorders and flag products whose stock will not cover the forecast. Every insight must have specific numbers and detailed reasoning behind the recommendation.
 """
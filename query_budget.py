@@ -0,0 +1,190 @@
+# -------------------------------------------------------------------------
+# QUERY TIME BUDGETS
+# -------------------------------------------------------------------------
+# Analytics routes run a series of independent queries (one per dashboard
+# panel). This module gives each route a total time budget and enforces it
+# inside SQLite: a progress handler aborts the running statement as soon as
+# the route's deadline has passed, so a slow query no longer holds a worker
+# thread until it finishes.
+#
+# A panel whose query was aborted degrades gracefully:
+# - If the same query (same SQL and parameters, so the same date range and
+#   page) succeeded before in this process, its last result is served
+#   (stale but meaningful data)
+# - Otherwise a placeholder (no rows, or caller-provided default values) is
+#   served so the page still renders
+#
+# Per-query counters record runs, timeouts and how each timeout was served.
+# Queries are read through the data-versioned result cache (query_cache.py),
+# so only cache misses spend any of the budget.
+# -------------------------------------------------------------------------
+
+import sqlite3    # For catching interrupted statements
+import threading  # For guarding the shared counters
+import time       # For measuring the route deadline
+
+import pandas as pd
+
+from query_cache import QueryCache, cached_read_sql, get_data_version, params_key
+
+# Total query time allowed per route, in seconds
+ROUTE_BUDGETS = {
+    'dashboard': 5.0,
+    'inventory_insights': 8.0,
+    'sales_insights': 8.0,
+}
+DEFAULT_BUDGET = 5.0
+
+# SQLite virtual machine instructions between deadline checks
+PROGRESS_HANDLER_INTERVAL = 10000
+
+# Memory kept for the last good results served after a timeout
+MAX_STALE_BYTES = 16 * 1024 * 1024
+
+_lock = threading.Lock()
+
+# (route, query name) -> counters
+_query_stats = {}
+
+# (route, query name, sql, params) -> last successful result, served when
+# the same query times out
+_last_results = QueryCache(max_bytes=MAX_STALE_BYTES)
+
+
+def _record(route, name, field):
+    """
+    Increment one counter of a query
+    """
+    with _lock:
+        stats = _query_stats.setdefault(
+            (route, name),
+            {'runs': 0, 'timeouts': 0, 'served_stale': 0, 'served_placeholder': 0}
+        )
+        stats[field] += 1
+
+
+def get_query_stats():
+    """
+    Get the counters of every query that has run in this process
+
+    Returns:
+        dict: "route.query" -> {'runs', 'timeouts', 'served_stale', 'served_placeholder'}
+    """
+    with _lock:
+        return {f"{route}.{name}": dict(stats) for (route, name), stats in _query_stats.items()}
+
+
+class QueryTimeout(Exception):
+    """Raised when a statement is aborted because its route ran out of time"""
+
+
+class RouteBudget:
+    """
+    Time budget shared by all queries of one request to an analytics route
+
+    Usage:
+        budget = RouteBudget(conn, 'dashboard')
+        df = budget.read_sql('top_revenue', query)
+        if budget.degraded:
+            flash(...)
+    """
+
+    def __init__(self, conn, route, seconds=None):
+        """
+        Args:
+            conn (sqlite3.Connection): Connection the queries run on
+            route (str): Route name, used for the budget and the counters
+            seconds (float): Budget override, defaults to ROUTE_BUDGETS[route]
+        """
+        self.conn = conn
+        self.route = route
+        self.seconds = seconds if seconds is not None else ROUTE_BUDGETS.get(route, DEFAULT_BUDGET)
+        self.deadline = time.monotonic() + self.seconds
+        self.degraded = []
+
+        # Results are cached per data version (see query_cache.py)
+        self.data_version = get_data_version(conn)
+
+    def remaining(self):
+        """Seconds left before the deadline (never negative)"""
+        return max(0.0, self.deadline - time.monotonic())
+
+    def _run(self, sql, params):
+        """
+        Run one query with the progress handler armed for the route deadline
+
+        Raises:
+            QueryTimeout: If the deadline passed before the query finished
+        """
+        if self.remaining() == 0:
+            raise QueryTimeout()
+
+        deadline = self.deadline
+        timed_out = []
+
+        def check_deadline():
+            # A non-zero return value makes SQLite interrupt the statement
+            if time.monotonic() > deadline:
+                timed_out.append(True)
+                return 1
+            return 0
+
+        self.conn.set_progress_handler(check_deadline, PROGRESS_HANDLER_INTERVAL)
+        try:
+            return pd.read_sql(sql, self.conn, params=params)
+        except (sqlite3.OperationalError, pd.errors.DatabaseError):
+            if timed_out:
+                raise QueryTimeout()
+            raise
+        finally:
+            self.conn.set_progress_handler(None, 0)
+
+    def read_sql(self, name, sql, params=None, placeholder=None):
+        """
+        Run a panel query within the route budget
+
+        Args:
+            name (str): Query name, used for the counters
+            sql (str): SQL query
+            params (tuple): Optional query parameters
+            placeholder (dict): Values for a one-row placeholder, for queries
+                whose single result row is always read (e.g. totals). Other
+                queries get a placeholder with their columns and no rows.
+
+        Returns:
+            pd.DataFrame: The query result, the last good result, or a placeholder
+        """
+        # Only a result of the same query with the same parameters may stand in for it
+        key = (self.route, name, sql, params_key(params))
+        _record(self.route, name, 'runs')
+
+        try:
+            # Repeat views of unchanged data are served from the cache
+            result = cached_read_sql(self.conn, sql, params, self.data_version, run=self._run)
+        except QueryTimeout:
+            _record(self.route, name, 'timeouts')
+            self.degraded.append(name)
+            print(f"WARNING: Query {self.route}.{name} exceeded the {self.seconds}s route budget")
+            return self._fallback(key, sql, params, placeholder)
+
+        _last_results.put(key, result)
+        return result
+
+    def _fallback(self, key, sql, params, placeholder):
+        """
+        Serve the last good result of a query, or a placeholder
+        """
+        stale = _last_results.get(key)
+        if stale is not None:
+            _record(self.route, key[1], 'served_stale')
+            return stale
+
+        _record(self.route, key[1], 'served_placeholder')
+        if placeholder is not None:
+            return pd.DataFrame([placeholder])
+
+        # WHERE 0 makes SQLite return the column names without running the query
+        try:
+            return pd.read_sql(f"SELECT * FROM ({sql}) WHERE 0", self.conn, params=params)
+        except (sqlite3.Error, pd.errors.DatabaseError):
+            return pd.DataFrame()
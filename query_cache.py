@@ -0,0 +1,193 @@
+# -------------------------------------------------------------------------
+# DATA-VERSIONED QUERY RESULT CACHE
+# -------------------------------------------------------------------------
+# The analytics data only changes when a sync runs, yet every page view
+# re-runs all of its queries. This module caches query results in process
+# memory, keyed by:
+# - the data version, which every successful sync bumps in shopify_metadata
+#   (so a sync makes every older entry unreachable without any invalidation)
+# - the current UTC date (utc_today()), because many queries are relative
+#   to DATE('now'), which SQLite evaluates in UTC, and the default date
+#   windows are computed from the same day
+# - the SQL text and its parameters
+#
+# Entries are evicted least-recently-used first once the cached DataFrames
+# exceed MAX_CACHE_BYTES. Hit, miss and eviction counters are kept per
+# process.
+# -------------------------------------------------------------------------
+
+import sqlite3    # For catching databases without a data version
+import threading  # For guarding the shared cache
+from collections import OrderedDict
+import pandas as pd
+
+from date_ranges import utc_today
+
+# Memory allowed for cached results per process
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+# Results larger than this are never cached (they would evict everything else)
+MAX_ENTRY_BYTES = 8 * 1024 * 1024
+
+
+def get_data_version(conn):
+    """
+    Get the data version of the database a connection reads
+
+    Args:
+        conn (sqlite3.Connection): Connection to the live database or a snapshot
+
+    Returns:
+        int or None: The version, or None if the database has none yet
+    """
+    try:
+        row = conn.execute(
+            "SELECT data_version FROM shopify_metadata ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
+
+def params_key(params):
+    """
+    Turn query parameters into a hashable key
+    """
+    if params is None:
+        return ()
+    if isinstance(params, dict):
+        return tuple(sorted(params.items()))
+    return tuple(params)
+
+
+class QueryCache:
+    """
+    LRU cache of query results (DataFrames) with a memory cap
+
+    Callers always get a copy, so modifying a returned DataFrame (e.g.
+    adding a computed column) never changes the cached result.
+    """
+
+    def __init__(self, max_bytes=MAX_CACHE_BYTES, max_entry_bytes=MAX_ENTRY_BYTES):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries = OrderedDict()  # key -> (DataFrame, size in bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'uncacheable': 0}
+
+    def get(self, key):
+        """
+        Get a copy of a cached result
+
+        Returns:
+            pd.DataFrame or None: The cached result, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            result = entry[0]
+        return result.copy()
+
+    def put(self, key, result):
+        """
+        Cache a result, evicting least recently used entries to stay under the cap
+        """
+        size = int(result.memory_usage(index=True, deep=True).sum())
+
+        with self._lock:
+            if size > self.max_entry_bytes:
+                self._stats['uncacheable'] += 1
+                return
+
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+
+            self._entries[key] = (result.copy(), size)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        """
+        Remove every entry (counters are kept)
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self):
+        """
+        Get the cache counters and current size
+
+        Returns:
+            dict: hits, misses, evictions, uncacheable, hit_rate, entries,
+                bytes and max_bytes
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['max_bytes'] = self.max_bytes
+        return stats
+
+
+# Cache shared by every request handled by this process
+query_cache = QueryCache()
+
+
+def cache_key(data_version, sql, params=None):
+    """
+    Build the cache key of a query against one data version
+    """
+    return (data_version, utc_today().isoformat(), sql, params_key(params))
+
+
+def cached_read_sql(conn, sql, params=None, data_version=None, run=None):
+    """
+    Read a query through the cache
+
+    Args:
+        conn (sqlite3.Connection): Connection the query runs on
+        sql (str): SQL query
+        params (tuple or dict): Optional query parameters
+        data_version (int): Data version of conn, looked up if not given
+        run (callable): Runs the query on a miss as run(sql, params),
+            defaults to pd.read_sql on conn
+
+    Returns:
+        pd.DataFrame: The query result
+    """
+    if data_version is None:
+        data_version = get_data_version(conn)
+    run = run or (lambda sql, params: pd.read_sql(sql, conn, params=params))
+
+    # Without a data version there is no way to tell when results go stale
+    if data_version is None:
+        return run(sql, params)
+
+    key = cache_key(data_version, sql, params)
+    result = query_cache.get(key)
+    if result is not None:
+        return result
+
+    result = run(sql, params)
+    query_cache.put(key, result)
+    return result
+
+
+def get_cache_stats():
+    """
+    Get the counters of the shared query cache
+    """
+    return query_cache.get_stats()
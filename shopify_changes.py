@@ -0,0 +1,457 @@
+# -------------------------------------------------------------------------
+# CHANGE DATA CAPTURE LOG
+# -------------------------------------------------------------------------
+# Every sync reloads the raw tables, so on its own nothing tells a cache or
+# aggregate which rows actually changed. This module records a change log
+# during ingest so downstream consumers can update only what changed.
+#
+# It handles:
+# - A sync id for every sync (shopify_syncs)
+# - The change log itself: one row per inserted, updated or deleted row of
+#   the tracked tables, with the row's day key and the sync it came from
+# - Capturing changes by comparing each row's version before and after the
+#   reload (see ChangeCapture)
+# - Logging rows removed by the retention policies
+# - Named consumers that read the log from their last committed offset
+#
+# The log is written in the same transaction as the rows it describes, so
+# a consumer never sees a change before its data is committed. A consumer
+# reads its offset and the log through one connection: inside a sync, the
+# sync's own write connection, so the update and the new offset commit
+# together (exactly once); otherwise a read-only connection to the live
+# database, which sees the offsets committed by earlier polls. The sync's
+# derived tables (facts and rollups) are such a consumer (see
+# shopify_setup.py).
+# -------------------------------------------------------------------------
+
+from datetime import datetime
+
+from shopify_db import live_read_connection, write_connection
+
+# Tables whose changes are logged:
+# - day_sql: SQL expression giving the YYYY-MM-DD day key of a row
+# - version_sql: SQL expression that changes whenever the row changes
+#   (including every column the derived tables read, see shopify_derived.py)
+CHANGE_TRACKED_TABLES = {
+    'shopify_orders': {
+        'day_sql': 'substr(created_at, 1, 10)',
+        'version_sql': "COALESCE(created_at, '') || '|' || COALESCE(updated_at, '') || '|' || "
+                       "COALESCE(financial_status, '') || '|' || COALESCE(total_price, '')",
+    },
+    'shopify_order_line_items': {
+        'day_sql': 'substr(created_at, 1, 10)',
+        'version_sql': "COALESCE(product_id, '') || '|' || COALESCE(variant_id, '') || '|' || "
+                       "COALESCE(quantity, '') || '|' || COALESCE(price, '') || '|' || "
+                       "COALESCE(total_discount, '')",
+    },
+    'shopify_products': {
+        'day_sql': 'substr(updated_at, 1, 10)',
+        'version_sql': "COALESCE(updated_at, '') || '|' || COALESCE(status, '') || '|' || "
+                       "COALESCE(title, '') || '|' || COALESCE(product_type, '')",
+    },
+    'shopify_variants': {
+        'day_sql': 'substr(updated_at, 1, 10)',
+        'version_sql': "COALESCE(updated_at, '') || '|' || COALESCE(price, '') || '|' || "
+                       "COALESCE(title, '') || '|' || COALESCE(sku, '')",
+    },
+}
+
+# Change operations
+OP_INSERT = 'insert'
+OP_UPDATE = 'update'
+OP_DELETE = 'delete'
+
+# Syncs whose changes are kept in the log. Consumers that fall further
+# behind are told to rebuild from scratch.
+CHANGE_LOG_KEEP_SYNCS = 30
+
+
+def setup_change_log(cursor):
+    """
+    Create the sync, change log and consumer offset tables
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS shopify_syncs (
+        sync_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        started_at TEXT,
+        change_count INTEGER DEFAULT 0
+    )
+    ''')
+
+    # AUTOINCREMENT so sequence numbers are never reused after pruning
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS shopify_change_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        sync_id INTEGER NOT NULL,
+        table_name TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        op TEXT NOT NULL,
+        day TEXT
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_change_log_sync
+    ON shopify_change_log (sync_id)
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS shopify_change_offsets (
+        consumer TEXT PRIMARY KEY,
+        last_seq INTEGER NOT NULL,
+        updated_at TEXT
+    )
+    ''')
+
+
+def current_sync_id(cursor):
+    """
+    Get the id of the most recent sync (0 if there has been none)
+    """
+    cursor.execute("SELECT COALESCE(MAX(sync_id), 0) FROM shopify_syncs")
+    return cursor.fetchone()[0]
+
+
+def _row_versions_sql(table):
+    """
+    SELECT returning (table_name, row_id, version, day) for a tracked table
+    """
+    spec = CHANGE_TRACKED_TABLES[table]
+    return f'''
+    SELECT '{table}' AS table_name, id AS row_id,
+        {spec['version_sql']} AS version, {spec['day_sql']} AS day
+    FROM {table}
+    '''
+
+
+class ChangeCapture:
+    """
+    Records the changes made by one sync to the tracked tables
+
+    Usage (inside the sync's transaction):
+        capture = ChangeCapture(cursor)   # before the tables are cleared
+        ... reload the tables ...
+        capture.record()                  # after the new rows are loaded
+
+    The row versions from before the reload are kept in a temporary table,
+    and record() logs the difference with the reloaded rows in one pass per
+    table, so the log contains real changes rather than the reload itself.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+        cursor.execute(
+            "INSERT INTO shopify_syncs (started_at) VALUES (?)",
+            (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),)
+        )
+        self.sync_id = cursor.lastrowid
+
+        cursor.execute("DROP TABLE IF EXISTS temp.cdc_before")
+        cursor.execute('''
+        CREATE TEMP TABLE cdc_before (
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            version TEXT,
+            day TEXT,
+            PRIMARY KEY (table_name, row_id)
+        ) WITHOUT ROWID
+        ''')
+        for table in CHANGE_TRACKED_TABLES:
+            cursor.execute(f"INSERT OR REPLACE INTO temp.cdc_before {_row_versions_sql(table)}")
+
+    def record(self):
+        """
+        Log every inserted, updated and deleted row since the capture began
+
+        A row whose day key changed is logged as a delete from its old day
+        and an insert on its new day, so day-keyed consumers see both days.
+
+        Returns:
+            int: Number of changes logged
+        """
+        cursor = self.cursor
+        logged = 0
+
+        for table in CHANGE_TRACKED_TABLES:
+            cursor.execute("DROP TABLE IF EXISTS temp.cdc_after")
+            cursor.execute('''
+            CREATE TEMP TABLE cdc_after (
+                row_id INTEGER PRIMARY KEY,
+                version TEXT,
+                day TEXT
+            )
+            ''')
+            cursor.execute(f'''
+            INSERT OR REPLACE INTO temp.cdc_after
+            SELECT row_id, version, day FROM ({_row_versions_sql(table)})
+            ''')
+
+            cursor.execute('''
+            INSERT INTO shopify_change_log (sync_id, table_name, row_id, op, day)
+            SELECT ?, ?, row_id, op, day FROM (
+                -- New rows, and moved rows on their new day
+                SELECT a.row_id, ? AS op, a.day, 1 AS step
+                FROM temp.cdc_after a
+                LEFT JOIN temp.cdc_before b ON b.table_name = ? AND b.row_id = a.row_id
+                WHERE b.row_id IS NULL OR b.day IS NOT a.day
+                UNION ALL
+                -- Removed rows, and moved rows on their old day
+                SELECT b.row_id, ?, b.day, 0
+                FROM temp.cdc_before b
+                LEFT JOIN temp.cdc_after a ON a.row_id = b.row_id
+                WHERE b.table_name = ? AND (a.row_id IS NULL OR a.day IS NOT b.day)
+                UNION ALL
+                -- Rows that changed in place
+                SELECT a.row_id, ?, a.day, 1
+                FROM temp.cdc_after a
+                JOIN temp.cdc_before b ON b.table_name = ? AND b.row_id = a.row_id
+                WHERE b.day IS a.day AND b.version IS NOT a.version
+            )
+            ORDER BY row_id, step
+            ''', (self.sync_id, table, OP_INSERT, table, OP_DELETE, table, OP_UPDATE, table))
+            logged += cursor.rowcount
+
+        cursor.execute("DROP TABLE IF EXISTS temp.cdc_after")
+        cursor.execute("DROP TABLE IF EXISTS temp.cdc_before")
+        cursor.execute(
+            "UPDATE shopify_syncs SET change_count = ? WHERE sync_id = ?",
+            (logged, self.sync_id)
+        )
+        return logged
+
+
+def log_deletes(cursor, table, source, where_sql=None, params=()):
+    """
+    Log the rows about to be removed from a tracked table
+
+    Used by the retention policies, which remove rows outside of a sync;
+    the deletes are attributed to the most recent sync.
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+        table (str): Logical table name (a key of CHANGE_TRACKED_TABLES)
+        source (str): Physical table the rows are read from
+        where_sql (str): Optional condition selecting the removed rows
+        params (tuple): Parameters of where_sql
+
+    Returns:
+        int: Number of changes logged
+    """
+    if table not in CHANGE_TRACKED_TABLES:
+        return 0
+
+    sql = f'''
+    INSERT INTO shopify_change_log (sync_id, table_name, row_id, op, day)
+    SELECT ?, ?, id, ?, {CHANGE_TRACKED_TABLES[table]['day_sql']}
+    FROM {source}
+    '''
+    if where_sql:
+        sql += f" WHERE {where_sql}"
+    cursor.execute(sql, (current_sync_id(cursor), table, OP_DELETE) + tuple(params))
+    return cursor.rowcount
+
+
+def prune_change_log(cursor, keep_syncs=CHANGE_LOG_KEEP_SYNCS):
+    """
+    Delete the changes of all but the last keep_syncs syncs
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+        keep_syncs (int): Number of recent syncs whose changes are kept
+
+    Returns:
+        int: Number of log rows deleted
+    """
+    cutoff = current_sync_id(cursor) - keep_syncs
+    cursor.execute("DELETE FROM shopify_change_log WHERE sync_id <= ?", (cutoff,))
+    deleted = cursor.rowcount
+    cursor.execute("DELETE FROM shopify_syncs WHERE sync_id <= ?", (cutoff,))
+    return deleted
+
+
+class ChangeBatch:
+    """
+    Changes read by a consumer, in log order
+
+    Attributes:
+        changes (list): (seq, sync_id, table_name, row_id, op, day) tuples
+        last_seq (int): Offset to commit once the batch has been applied
+        full_refresh (bool): True if the consumer has no usable offset (it is
+            new, or the changes it missed were pruned) and must rebuild
+            everything; changes is empty in that case
+    """
+
+    def __init__(self, changes, last_seq, full_refresh=False):
+        self.changes = changes
+        self.last_seq = last_seq
+        self.full_refresh = full_refresh
+
+    def __len__(self):
+        return len(self.changes)
+
+    def days(self, table=None):
+        """
+        Day keys touched by the batch, optionally for one table only
+        """
+        return {day for _, _, name, _, _, day in self.changes
+                if day and (table is None or name == table)}
+
+    def ids(self, table):
+        """
+        Row ids of one table touched by the batch
+        """
+        return {row_id for _, _, name, row_id, _, _ in self.changes if name == table}
+
+    def deleted_ids(self, table):
+        """
+        Row ids of one table whose last change in the batch is a delete
+        """
+        last_op = {}
+        for _, _, name, row_id, op, _ in self.changes:
+            if name == table:
+                last_op[row_id] = op
+        return {row_id for row_id, op in last_op.items() if op == OP_DELETE}
+
+
+class ChangeConsumer:
+    """
+    A named reader of the change log with a persistent offset
+
+    Usage:
+        consumer = ChangeConsumer('sales_summary_cache', tables=['shopify_orders'])
+        batch = consumer.poll()
+        if batch.full_refresh:
+            ... rebuild everything ...
+        else:
+            ... update batch.days() / batch.ids('shopify_orders') ...
+        consumer.commit(batch)
+
+    Committing after the update has been applied gives at-least-once
+    delivery: a consumer that fails before committing sees the same changes
+    again on its next poll. A consumer that polls, applies and commits
+    through one write connection (poll(conn=conn) ... commit(batch,
+    conn=conn)) gets exactly-once delivery, since the update and the new
+    offset commit or roll back together.
+    """
+
+    def __init__(self, name, tables=None):
+        """
+        Args:
+            name (str): Unique consumer name, the key of its stored offset
+            tables (list): Tracked tables to read (None for all)
+        """
+        self.name = name
+        self.tables = list(tables) if tables else None
+
+    def get_offset(self, conn=None):
+        """
+        Get the last committed sequence number (None if never committed)
+
+        Args:
+            conn (sqlite3.Connection): Connection to read through (defaults to
+                a read-only connection to the live database)
+        """
+        if conn is None:
+            with live_read_connection() as conn:
+                return self.get_offset(conn)
+
+        row = conn.execute(
+            "SELECT last_seq FROM shopify_change_offsets WHERE consumer = ?",
+            (self.name,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def poll(self, limit=None, conn=None):
+        """
+        Read the changes logged after the consumer's offset
+
+        The offset and the log are read through the same connection, so they
+        always agree.
+
+        Args:
+            limit (int): Maximum number of changes to return (None for all)
+            conn (sqlite3.Connection): Connection to read through, e.g. the
+                sync's write connection (defaults to a read-only connection
+                to the live database)
+
+        Returns:
+            ChangeBatch: The changes, and the offset to commit after them
+        """
+        if conn is None:
+            with live_read_connection() as conn:
+                return self.poll(limit, conn)
+
+        offset = self.get_offset(conn)
+        cursor = conn.cursor()
+
+        # sqlite_sequence still holds the newest number if the log was pruned empty
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'shopify_change_log'")
+        row = cursor.fetchone()
+        newest = row[0] if row else 0
+
+        if offset is None:
+            return ChangeBatch([], newest, full_refresh=True)
+
+        # Changes right after the offset were pruned if the oldest kept change is later
+        cursor.execute("SELECT MIN(seq) FROM shopify_change_log")
+        oldest = cursor.fetchone()[0]
+        if offset < newest and (oldest is None or oldest > offset + 1):
+            return ChangeBatch([], newest, full_refresh=True)
+
+        sql = '''
+        SELECT seq, sync_id, table_name, row_id, op, day
+        FROM shopify_change_log
+        WHERE seq > ?
+        '''
+        params = [offset]
+        if self.tables:
+            sql += f" AND table_name IN ({', '.join('?' for _ in self.tables)})"
+            params.extend(self.tables)
+        sql += " ORDER BY seq"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        cursor.execute(sql, params)
+        changes = [tuple(row) for row in cursor.fetchall()]
+
+        # Without a limit the consumer is caught up even if the other tables'
+        # changes were filtered out; with one it resumes after the last row read
+        if limit and len(changes) == limit:
+            last_seq = changes[-1][0]
+        else:
+            last_seq = max(newest, offset)
+        return ChangeBatch(changes, last_seq)
+
+    def commit(self, batch_or_seq, conn=None):
+        """
+        Store the consumer's offset
+
+        Args:
+            batch_or_seq (ChangeBatch or int): The applied batch, or a sequence number
+            conn (sqlite3.Connection): Write connection whose transaction the
+                offset joins, e.g. the one that applied the batch (defaults to
+                a new write connection, committed right away)
+        """
+        if conn is None:
+            with write_connection() as conn:
+                return self.commit(batch_or_seq, conn)
+
+        last_seq = batch_or_seq.last_seq if isinstance(batch_or_seq, ChangeBatch) else batch_or_seq
+        conn.execute('''
+        INSERT INTO shopify_change_offsets (consumer, last_seq, updated_at)
+        VALUES (?, ?, ?)
+        ON CONFLICT(consumer) DO UPDATE SET
+            last_seq = excluded.last_seq,
+            updated_at = excluded.updated_at
+        ''', (self.name, last_seq, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+    def reset(self):
+        """
+        Forget the consumer's offset, forcing a full refresh on the next poll
+        """
+        with write_connection() as conn:
+            conn.execute("DELETE FROM shopify_change_offsets WHERE consumer = ?", (self.name,))
@@ -0,0 +1,318 @@
+# -------------------------------------------------------------------------
+# SHOPIFY DATABASE CONNECTION LAYER
+# -------------------------------------------------------------------------
+# This module owns every connection to the local Shopify SQLite database.
+# Both the web application (app.py) and the data fetcher (shopify_setup.py)
+# go through it so that the database is always opened with the same settings.
+#
+# It handles:
+# - Write-ahead logging (WAL) so a running sync never blocks dashboard readers
+# - Connection tuning (page cache, memory mapping, temp storage, busy timeout)
+# - A per-thread pool of read-only connections with a warm statement cache
+# - Short-lived write connections with commit/rollback handling
+# - Short-lived read-only connections to the live database, for readers that
+#   must see the latest commit without taking the write lock
+# - Immutable read snapshots: after each successful sync the database is
+#   copied with the online backup API into a versioned file that readers open
+#   with immutable=1, so they skip locking and never see a half-applied sync
+# -------------------------------------------------------------------------
+
+import os         # For checking the database file identity
+import sqlite3    # For local database operations
+import threading  # For the per-thread read connection pool
+from contextlib import contextmanager
+from datetime import datetime
+
+# Define database path - SQLite database file location
+DB_PATH = 'database/shopify_data.db'
+
+# Connection tuning shared by readers and writers
+BUSY_TIMEOUT_MS = 20000               # Wait up to 20s for a lock instead of failing
+CACHE_SIZE_KIB = 64 * 1024            # 64 MiB page cache per connection
+MMAP_SIZE = 256 * 1024 * 1024         # Memory-map up to 256 MiB of the database file
+STATEMENT_CACHE_SIZE = 256            # Prepared statements kept per connection
+
+# Immutable read snapshots published after each sync
+SNAPSHOT_DIR = os.path.join(os.path.dirname(DB_PATH), 'snapshots')
+SNAPSHOT_POINTER = os.path.join(SNAPSHOT_DIR, 'CURRENT')
+SNAPSHOT_MMAP_SIZE = 1024 * 1024 * 1024  # Snapshots never change, so map up to 1 GiB
+KEEP_SNAPSHOTS = 2                       # Older snapshots may still be open in other workers
+
+# Per-thread storage for pooled read-only connections
+_read_pool = threading.local()
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    SQLite connection that stays open when callers close it
+
+    Route handlers and AI data preparation functions call conn.close() when
+    they are done. For pooled connections this only ends any open transaction
+    so the connection (and its prepared statement cache) can be reused by the
+    next request on the same thread.
+    """
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def release(self):
+        """Really close the underlying SQLite connection"""
+        super().close()
+
+
+def apply_pragmas(conn):
+    """
+    Apply the shared performance settings to a connection
+
+    Args:
+        conn (sqlite3.Connection): Connection to configure
+    """
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+
+def _database_identity(path):
+    """
+    Identify the database file on disk
+
+    The data fetcher may delete and recreate the database file. Comparing the
+    device/inode pair lets pooled connections notice that and reconnect.
+
+    Returns:
+        tuple or None: (device, inode) of the file, or None if it is missing
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_dev, stat.st_ino)
+
+
+def get_current_snapshot_path():
+    """
+    Get the path of the published read snapshot
+
+    Returns:
+        str or None: Path of the current snapshot file, or None if no snapshot
+            has been published (readers then use the live database)
+    """
+    try:
+        with open(SNAPSHOT_POINTER, 'r', encoding='utf-8') as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+
+    path = os.path.join(SNAPSHOT_DIR, name)
+    return path if name and os.path.exists(path) else None
+
+
+def get_read_connection():
+    """
+    Get the pooled read-only connection for the current thread
+
+    This function:
+    1. Picks the current immutable snapshot, or the live database if no
+       snapshot has been published yet
+    2. Reuses the connection already opened by this thread if it still points
+       at that same file
+    3. Otherwise opens a new read-only connection with the shared settings
+       (snapshots are opened with immutable=1 and a larger memory map)
+    4. Sets the row factory so columns can be accessed by name
+
+    Returns:
+        PooledConnection: A read-only connection to the SQLite database
+    """
+    snapshot_path = get_current_snapshot_path()
+    path = snapshot_path or DB_PATH
+    identity = (path, _database_identity(path))
+    conn = getattr(_read_pool, 'conn', None)
+
+    if conn is not None and _read_pool.identity == identity:
+        return conn
+
+    if conn is not None:
+        conn.release()
+
+    uri = f"file:{path}?mode=ro&immutable=1" if snapshot_path else f"file:{path}?mode=ro"
+    conn = sqlite3.connect(
+        uri,
+        uri=True,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        factory=PooledConnection
+    )
+    conn.row_factory = sqlite3.Row
+    apply_pragmas(conn)
+    if snapshot_path:
+        conn.execute(f"PRAGMA mmap_size = {SNAPSHOT_MMAP_SIZE}")
+
+    _read_pool.conn = conn
+    _read_pool.identity = identity
+    return conn
+
+
+def close_read_connection():
+    """
+    Close the pooled read-only connection of the current thread, if any
+    """
+    conn = getattr(_read_pool, 'conn', None)
+    if conn is not None:
+        conn.release()
+        _read_pool.conn = None
+        _read_pool.identity = None
+
+
+def get_write_connection():
+    """
+    Open a new read-write connection to the database
+
+    This function:
+    1. Creates the database directory if it doesn't exist
+    2. Opens the connection with the shared settings
+    3. Enables incremental auto-vacuum when the database file is new
+    4. Switches the database to WAL mode (persisted in the database file)
+    5. Relaxes fsync to once per checkpoint, which is safe with WAL
+
+    Returns:
+        sqlite3.Connection: A read-write connection to the SQLite database
+    """
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE
+    )
+    apply_pragmas(conn)
+    # Only takes effect on a new, empty file; switching to WAL initializes the
+    # file, so this has to come first (existing files: see shopify_maintenance.py)
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+@contextmanager
+def write_connection():
+    """
+    Context manager around a read-write connection
+
+    Commits when the block completes, rolls back if it raises, and always
+    closes the connection afterwards.
+
+    Yields:
+        sqlite3.Connection: A read-write connection to the SQLite database
+    """
+    conn = get_write_connection()
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+@contextmanager
+def live_read_connection():
+    """
+    Context manager around a read-only connection to the live database
+
+    Unlike get_read_connection() it never reads the published snapshot, so
+    it sees every committed write right away, and unlike write_connection()
+    it never takes the write lock. Always closes the connection afterwards.
+
+    Yields:
+        sqlite3.Connection: A read-only connection to the SQLite database
+    """
+    conn = sqlite3.connect(
+        f"file:{DB_PATH}?mode=ro",
+        uri=True,
+        timeout=BUSY_TIMEOUT_MS / 1000
+    )
+    try:
+        apply_pragmas(conn)
+        yield conn
+    finally:
+        conn.close()
+
+
+def publish_read_snapshot(conn):
+    """
+    Copy the database into a new immutable snapshot and make it current
+
+    This function:
+    1. Copies the committed database with the online backup API into a
+       temporary file inside SNAPSHOT_DIR
+    2. Switches the copy to rollback journal mode so it is one self-contained
+       file, then renames it to its versioned name
+    3. Atomically replaces the CURRENT pointer file
+    4. Removes snapshots older than the last KEEP_SNAPSHOTS
+
+    If anything fails the pointer is removed, so readers fall back to the live
+    database instead of serving an out-of-date snapshot.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the live database with no
+            open transaction (normally the sync's write connection)
+
+    Returns:
+        str or None: Path of the new snapshot, or None if publishing failed
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    name = f"shopify_data_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.db"
+    path = os.path.join(SNAPSHOT_DIR, name)
+    tmp_path = path + '.tmp'
+
+    try:
+        snapshot = sqlite3.connect(tmp_path)
+        try:
+            conn.backup(snapshot)
+            snapshot.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            snapshot.close()
+        os.replace(tmp_path, path)
+
+        pointer_tmp = SNAPSHOT_POINTER + '.tmp'
+        with open(pointer_tmp, 'w', encoding='utf-8') as f:
+            f.write(name)
+        os.replace(pointer_tmp, SNAPSHOT_POINTER)
+    except (sqlite3.Error, OSError) as e:
+        print(f"WARNING: Could not publish read snapshot: {e}")
+        for stale in (tmp_path, SNAPSHOT_POINTER):
+            if os.path.exists(stale):
+                os.remove(stale)
+        return None
+
+    # Remove old snapshots; workers still reading them keep their open handles
+    snapshots = sorted(
+        file_name for file_name in os.listdir(SNAPSHOT_DIR)
+        if file_name.startswith('shopify_data_') and file_name.endswith('.db')
+    )
+    for file_name in snapshots[:-KEEP_SNAPSHOTS]:
+        try:
+            os.remove(os.path.join(SNAPSHOT_DIR, file_name))
+        except OSError:
+            pass
+
+    return path
+
+
+def remove_database_files():
+    """
+    Delete the database file together with its WAL and shared-memory files
+    and every published read snapshot
+    """
+    close_read_connection()
+    for suffix in ('', '-wal', '-shm'):
+        path = DB_PATH + suffix
+        if os.path.exists(path):
+            os.remove(path)
+
+    if os.path.exists(SNAPSHOT_DIR):
+        for file_name in os.listdir(SNAPSHOT_DIR):
+            os.remove(os.path.join(SNAPSHOT_DIR, file_name))
@@ -0,0 +1,477 @@
+# -------------------------------------------------------------------------
+# DERIVED SHOPIFY TABLES
+# -------------------------------------------------------------------------
+# This module maintains tables that are derived from the raw Shopify data
+# at ingest time, so the web application can read small pre-aggregated
+# tables instead of re-aggregating every order line item on each page view.
+#
+# It handles:
+# - A denormalized line-item fact table (orders, products and variants
+#   resolved once per sync instead of joined on every query)
+# - Daily per-variant sales rollups (units, revenue, orders)
+# - Daily per-hour order rollups (order count, revenue)
+# - A customer dimension keyed by a hash of the normalized email, with
+#   per-customer order count, total spent and first/last order
+# - Incremental refresh of only the days and customers touched by a sync
+#
+# Days are the store-local calendar day of the order, i.e. the first ten
+# characters of Shopify's created_at timestamp ("2024-05-01T10:00:00+05:30").
+# That keeps "o.created_at >= DATE('now', '-30 days')" style windows exact.
+# -------------------------------------------------------------------------
+
+import hashlib  # For hashing normalized customer emails into integer keys
+
+from shopify_partitions import default_partition, partition_name, list_partitions
+
+# SQL expressions that turn an order timestamp into its day/hour keys
+ORDER_DAY_SQL = "substr(o.created_at, 1, 10)"
+ORDER_HOUR_SQL = "substr(o.created_at, 12, 2)"
+
+# Maximum number of days bound into a single IN (...) clause
+DAYS_PER_BATCH = 500
+
+# Maximum number of customer keys bound into a single IN (...) clause
+CUSTOMERS_PER_BATCH = 500
+
+
+def setup_derived_tables(cursor):
+    """
+    Create the derived tables and the indexes that keep them cheap to refresh
+
+    This function creates, if they don't already exist:
+    - shopify_sales_facts: One row per order line item with order, product
+      and variant attributes already resolved
+    - shopify_daily_variant_sales: Units, revenue and orders per variant per day
+    - shopify_daily_order_stats: Order count and revenue per day and hour
+    - shopify_customers: One row per customer with running order aggregates,
+      plus the shopify_orders.customer_id column that references it
+    - Indexes on the raw tables used when rebuilding a set of days and when
+      joining products to their variants
+
+    The fact table keeps refunded line items (flagged by is_refunded) because
+    some inventory views count them; the rollups only count non-refunded
+    orders, matching every sales query.
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS shopify_sales_facts (
+        line_item_id INTEGER PRIMARY KEY,
+        order_id INTEGER,
+        product_id INTEGER,
+        variant_id INTEGER,
+        created_at TEXT,
+        day TEXT,
+        hour TEXT,
+        is_refunded INTEGER,
+        product_type TEXT,
+        product_title TEXT,
+        display_name TEXT,
+        sku TEXT,
+        variant_price REAL,
+        unit_price REAL,
+        quantity INTEGER,
+        revenue REAL
+    )
+    ''')
+    # Covering indexes: per-variant, per-product and per-order aggregates are
+    # answered from the index alone without touching the table rows
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sales_facts_day ON shopify_sales_facts (day)")
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_sales_facts_variant
+    ON shopify_sales_facts (variant_id, product_id, is_refunded, quantity, revenue)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_sales_facts_product
+    ON shopify_sales_facts (product_id, is_refunded, quantity, revenue)
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sales_facts_order ON shopify_sales_facts (order_id, quantity)")
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS shopify_daily_variant_sales (
+        day TEXT NOT NULL,
+        product_id INTEGER,
+        variant_id INTEGER,
+        units INTEGER,
+        revenue REAL,
+        line_count INTEGER,
+        order_count INTEGER,
+        price_sum REAL
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_daily_variant_sales_day
+    ON shopify_daily_variant_sales (day, product_id, variant_id)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_daily_variant_sales_variant
+    ON shopify_daily_variant_sales (variant_id, day, units, revenue)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_daily_variant_sales_product
+    ON shopify_daily_variant_sales (product_id, day, units, revenue)
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS shopify_daily_order_stats (
+        day TEXT NOT NULL,
+        hour TEXT NOT NULL,
+        order_count INTEGER,
+        revenue REAL,
+        PRIMARY KEY (day, hour)
+    ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS shopify_customers (
+        customer_id INTEGER PRIMARY KEY,
+        email TEXT,
+        order_count INTEGER DEFAULT 0,
+        total_spent REAL DEFAULT 0,
+        first_order TEXT,
+        last_order TEXT
+    )
+    ''')
+    # Lifetime-value ranking and the repeat-customer list are top-N index scans
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_customers_total_spent
+    ON shopify_customers (total_spent)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_customers_repeat
+    ON shopify_customers (total_spent) WHERE order_count > 1
+    ''')
+
+    # Orders and line items are partitioned by month: columns and indexes are
+    # declared on the default partitions and copied to every monthly partition
+    # (see shopify_partitions.py)
+
+    # Databases created before the customer dimension lack the order foreign key
+    cursor.execute("PRAGMA table_info(shopify_orders_default)")
+    if 'customer_id' not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute('''
+        ALTER TABLE shopify_orders_default
+        ADD COLUMN customer_id INTEGER REFERENCES shopify_customers(customer_id)
+        ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_customer ON shopify_orders_default (customer_id)")
+
+    # Indexes used to rebuild individual days from the raw tables
+    cursor.execute(f'''
+    CREATE INDEX IF NOT EXISTS idx_orders_day
+    ON shopify_orders_default ({ORDER_DAY_SQL.replace('o.', '')})
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_line_items_order
+    ON shopify_order_line_items_default (order_id)
+    ''')
+
+    # Products are joined to their variants by almost every inventory query
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_variants_product
+    ON shopify_variants (product_id)
+    ''')
+
+
+def get_rollup_days(cursor):
+    """
+    List every day currently present in the derived tables
+
+    Used before a full reload so that days which disappear from the source
+    data are cleared from the rollups as well.
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+
+    Returns:
+        set: Day strings in YYYY-MM-DD format
+    """
+    cursor.execute("SELECT DISTINCT day FROM shopify_daily_order_stats")
+    days = {row[0] for row in cursor.fetchall()}
+    cursor.execute("SELECT DISTINCT day FROM shopify_sales_facts")
+    days.update(row[0] for row in cursor.fetchall())
+    return days
+
+
+def get_changed_days(cursor, batch):
+    """
+    List the days of the derived tables affected by logged changes
+
+    Orders and line items change their own day. The facts copy product and
+    variant columns, so a changed product or variant changes every day with
+    one of its line items: the days already in the facts, and the days of
+    its line items as they are now.
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+        batch (ChangeBatch): Changes read from the change log (see
+            shopify_changes.py)
+
+    Returns:
+        set: Day strings in YYYY-MM-DD format
+    """
+    days = batch.days('shopify_orders') | batch.days('shopify_order_line_items')
+    for table, column in (('shopify_products', 'product_id'), ('shopify_variants', 'variant_id')):
+        for ids, placeholders in _day_batches(batch.ids(table)):
+            cursor.execute(f"SELECT DISTINCT day FROM shopify_sales_facts WHERE {column} IN ({placeholders})", ids)
+            days.update(row[0] for row in cursor.fetchall())
+            cursor.execute(f'''
+            SELECT DISTINCT substr(created_at, 1, 10)
+            FROM shopify_order_line_items
+            WHERE {column} IN ({placeholders})
+            ''', ids)
+            days.update(row[0] for row in cursor.fetchall())
+    return days
+
+
+def customer_key(email):
+    """
+    Turn an order email into the customer's integer key
+
+    Emails are normalized (surrounding whitespace removed, lower-cased) so
+    that "Jane@Example.com " and "jane@example.com" are the same customer.
+    The key is the first 8 bytes of a BLAKE2b hash of the normalized email,
+    as a signed 64-bit integer so it fits SQLite's INTEGER type.
+
+    Args:
+        email (str): Email address as stored on the order
+
+    Returns:
+        tuple: (customer_id, normalized_email), or (None, None) if the order
+            has no email
+    """
+    normalized = (email or '').strip().lower()
+    if not normalized:
+        return None, None
+
+    digest = hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True), normalized
+
+
+def get_customer_ids(cursor):
+    """
+    List every customer key currently present in the customer dimension
+
+    Used before a full reload, like get_rollup_days().
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+
+    Returns:
+        set: Customer keys
+    """
+    cursor.execute("SELECT customer_id FROM shopify_customers")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _day_batches(days):
+    """
+    Split a collection of days into sorted batches for IN (...) clauses
+
+    Yields:
+        tuple: (batch, placeholders) with the day list and its SQL placeholders
+    """
+    days = sorted(day for day in set(days) if day)
+
+    for start in range(0, len(days), DAYS_PER_BATCH):
+        batch = days[start:start + DAYS_PER_BATCH]
+        yield batch, ', '.join('?' * len(batch))
+
+
+def _partition_pairs(cursor, days):
+    """
+    List the (orders, line items) partitions that can hold the given days
+
+    Yields:
+        tuple: (orders table, line items table) for each month involved, plus
+            the default partitions
+    """
+    months = sorted({day[:7] for day in days})
+    yield default_partition('shopify_orders'), default_partition('shopify_order_line_items')
+
+    existing = {month for month, _ in list_partitions(cursor, 'shopify_orders')}
+    for month in months:
+        if month in existing:
+            yield partition_name('shopify_orders', month), partition_name('shopify_order_line_items', month)
+
+
+def refresh_sales_facts(cursor, days):
+    """
+    Rebuild the line-item facts for the given days
+
+    This function:
+    1. Deletes the existing fact rows for each changed day
+    2. Joins the raw orders, line items, products and variants for those days
+       once and stores the resolved rows, reading only the monthly partitions
+       that contain those days
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+        days (iterable): Day strings (YYYY-MM-DD) whose data changed
+    """
+    for batch, placeholders in _day_batches(days):
+        cursor.execute(f"DELETE FROM shopify_sales_facts WHERE day IN ({placeholders})", batch)
+
+        # An order and its line items share a month, so each month's
+        # partitions are joined on their own instead of joining the views
+        for orders_table, line_items_table in _partition_pairs(cursor, batch):
+            cursor.execute(f'''
+            INSERT OR REPLACE INTO shopify_sales_facts
+            (line_item_id, order_id, product_id, variant_id, created_at, day, hour,
+            is_refunded, product_type, product_title, display_name, sku,
+            variant_price, unit_price, quantity, revenue)
+            SELECT
+                oli.id,
+                oli.order_id,
+                oli.product_id,
+                oli.variant_id,
+                o.created_at,
+                {ORDER_DAY_SQL},
+                {ORDER_HOUR_SQL},
+                CASE WHEN o.financial_status = 'refunded' THEN 1 ELSE 0 END,
+                p.product_type,
+                p.title,
+                CASE 
+                    WHEN p.title IS NOT NULL THEN p.title || CASE WHEN v.title != 'Default Title' THEN ' - ' || v.title ELSE '' END
+                    ELSE 'Unknown Product'
+                END,
+                v.sku,
+                v.price,
+                oli.price,
+                oli.quantity,
+                oli.quantity * oli.price
+            FROM {orders_table} o
+            JOIN {line_items_table} oli ON oli.order_id = o.id
+            LEFT JOIN shopify_products p ON oli.product_id = p.id
+            LEFT JOIN shopify_variants v ON oli.variant_id = v.id
+            WHERE {ORDER_DAY_SQL} IN ({placeholders})
+            ''', batch)
+
+
+def refresh_daily_rollups(cursor, days):
+    """
+    Recompute the rollup rows for the given days
+
+    This function:
+    1. Deletes the existing rollup rows for each changed day
+    2. Re-aggregates those days from the line-item facts and raw orders
+
+    Days that no longer have any orders simply end up without rollup rows.
+    The facts for these days must already be up to date.
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+        days (iterable): Day strings (YYYY-MM-DD) whose data changed
+    """
+    for batch, placeholders in _day_batches(days):
+        cursor.execute(f"DELETE FROM shopify_daily_variant_sales WHERE day IN ({placeholders})", batch)
+        cursor.execute(f"DELETE FROM shopify_daily_order_stats WHERE day IN ({placeholders})", batch)
+
+        cursor.execute(f'''
+        INSERT INTO shopify_daily_variant_sales
+        (day, product_id, variant_id, units, revenue, line_count, order_count, price_sum)
+        SELECT
+            day,
+            product_id,
+            variant_id,
+            SUM(quantity),
+            SUM(revenue),
+            COUNT(*),
+            COUNT(DISTINCT order_id),
+            SUM(unit_price)
+        FROM shopify_sales_facts
+        WHERE is_refunded = 0
+        AND day IN ({placeholders})
+        GROUP BY day, product_id, variant_id
+        ''', batch)
+
+        cursor.execute(f'''
+        INSERT INTO shopify_daily_order_stats (day, hour, order_count, revenue)
+        SELECT
+            {ORDER_DAY_SQL},
+            {ORDER_HOUR_SQL},
+            COUNT(*),
+            SUM(o.total_price)
+        FROM shopify_orders o
+        WHERE o.financial_status != 'refunded'
+        AND {ORDER_DAY_SQL} IN ({placeholders})
+        GROUP BY 1, 2
+        ''', batch)
+
+
+def refresh_customers(cursor, customer_ids):
+    """
+    Recompute the running aggregates of the given customers
+
+    This function:
+    1. Recalculates order count, total spent and first/last order from the
+       customer's non-refunded orders (an indexed lookup per customer)
+    2. Removes customers that no longer have any orders
+
+    Customer rows themselves are created by the data fetcher as orders are
+    stored, so only the aggregates are maintained here.
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+        customer_ids (iterable): Keys of customers whose orders changed
+    """
+    customer_ids = sorted(customer_id for customer_id in set(customer_ids) if customer_id is not None)
+
+    for start in range(0, len(customer_ids), CUSTOMERS_PER_BATCH):
+        batch = customer_ids[start:start + CUSTOMERS_PER_BATCH]
+        placeholders = ', '.join('?' * len(batch))
+
+        # Customers whose orders all disappeared or were refunded start from zero
+        cursor.execute(f'''
+        UPDATE shopify_customers
+        SET order_count = 0, total_spent = 0, first_order = NULL, last_order = NULL
+        WHERE customer_id IN ({placeholders})
+        ''', batch)
+
+        # Filtering the orders view by customer_id first lets each monthly
+        # partition answer from its customer index
+        cursor.execute(f'''
+        UPDATE shopify_customers
+        SET order_count = s.order_count,
+            total_spent = s.total_spent,
+            first_order = s.first_order,
+            last_order = s.last_order
+        FROM (
+            SELECT
+                customer_id,
+                COUNT(*) as order_count,
+                SUM(total_price) as total_spent,
+                MIN(created_at) as first_order,
+                MAX(created_at) as last_order
+            FROM shopify_orders
+            WHERE customer_id IN ({placeholders})
+            AND financial_status != 'refunded'
+            GROUP BY customer_id
+        ) s
+        WHERE shopify_customers.customer_id = s.customer_id
+        ''', batch)
+
+        cursor.execute(f'''
+        DELETE FROM shopify_customers
+        WHERE customer_id IN ({placeholders})
+        AND customer_id NOT IN (
+            SELECT customer_id FROM shopify_orders WHERE customer_id IN ({placeholders})
+        )
+        ''', batch + batch)
+
+
+def refresh_derived_tables(cursor, days, customer_ids=()):
+    """
+    Bring every derived table up to date for the given days and customers
+
+    Called by the data fetcher after the raw tables have been loaded.
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+        days (iterable): Day strings (YYYY-MM-DD) whose data changed
+        customer_ids (iterable): Keys of customers whose orders changed
+    """
+    days = set(days)
+    refresh_sales_facts(cursor, days)
+    refresh_daily_rollups(cursor, days)
+    refresh_customers(cursor, customer_ids)
@@ -0,0 +1,180 @@
+# -------------------------------------------------------------------------
+# EXTRACTED SHOPIFY FIELDS
+# -------------------------------------------------------------------------
+# Shopify payloads are stored whole in each row's raw_data column, but many
+# useful attributes (shipping country, discount codes, inventory quantity,
+# vendor, tags) are not first-class columns. Querying them would mean running
+# json_extract on every row of every query.
+#
+# This module declares which fields are extracted, and materializes them at
+# ingest time with SQLite's JSON1 functions:
+# - EXTRACTED_COLUMNS: single values copied into an indexed column on the row
+# - EXTRACTED_LISTS: multi-valued fields stored one value per row in an
+#   indexed child table
+#
+# Plain columns populated at ingest are used instead of generated columns
+# because raw_data is cleared by the retention policies (see
+# shopify_maintenance.py); the extracted values have to outlive the payload.
+# -------------------------------------------------------------------------
+
+from shopify_partitions import default_partition, physical_tables, PARTITIONED_TABLES
+
+# Single-valued fields:
+# - table/column/type: where the value is stored
+# - path: JSON path inside raw_data
+# - index: columns of the index created for it (None for no index)
+EXTRACTED_COLUMNS = [
+    {
+        'table': 'shopify_orders',
+        'column': 'shipping_country',
+        'type': 'TEXT',
+        'path': '$.shipping_address.country_code',
+        # Covers regional revenue breakdowns without touching the table
+        'index': ('shipping_country', 'financial_status', 'total_price'),
+    },
+    {
+        'table': 'shopify_variants',
+        'column': 'inventory_quantity',
+        'type': 'INTEGER',
+        'path': '$.inventory_quantity',
+        'index': ('inventory_quantity',),
+    },
+    {
+        'table': 'shopify_products',
+        'column': 'vendor',
+        'type': 'TEXT',
+        'path': '$.vendor',
+        'index': ('vendor', 'status'),
+    },
+]
+
+# Multi-valued fields:
+# - table/column: child table and the column holding each value
+# - parent/key: source table and the child column referencing its id
+# - path: JSON path inside the parent's raw_data
+# - item_path: JSON path of the value inside each array element (arrays), or
+# - separator: separator of a delimited string (e.g. Shopify's "a, b" tags)
+EXTRACTED_LISTS = [
+    {
+        'table': 'shopify_order_discount_codes',
+        'column': 'code',
+        'parent': 'shopify_orders',
+        'key': 'order_id',
+        'path': '$.discount_codes',
+        'item_path': '$.code',
+    },
+    {
+        'table': 'shopify_product_tags',
+        'column': 'tag',
+        'parent': 'shopify_products',
+        'key': 'product_id',
+        'path': '$.tags',
+        'separator': ',',
+    },
+]
+
+
+def _index_name(table, columns):
+    """
+    Build the index name for an extracted field
+    """
+    return f"idx_{table.replace('shopify_', '')}_{columns[0]}"
+
+
+def setup_extracted_fields(cursor):
+    """
+    Create the columns, child tables and indexes for every extracted field
+
+    Columns missing from databases created before a field was declared are
+    added with ALTER TABLE, so adding a field only needs a new list entry.
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+    """
+    for field in EXTRACTED_COLUMNS:
+        # Partitioned tables are changed through their default partition,
+        # whose schema is copied to the monthly partitions
+        table = field['table']
+        if table in PARTITIONED_TABLES:
+            table = default_partition(table)
+
+        cursor.execute(f"PRAGMA table_info({table})")
+        if field['column'] not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {field['column']} {field['type']}")
+
+        if field['index']:
+            cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS {_index_name(field['table'], field['index'])}
+            ON {table} ({', '.join(field['index'])})
+            ''')
+
+    for field in EXTRACTED_LISTS:
+        cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {field['table']} (
+            {field['key']} INTEGER NOT NULL,
+            {field['column']} TEXT NOT NULL,
+            PRIMARY KEY ({field['key']}, {field['column']}),
+            FOREIGN KEY ({field['key']}) REFERENCES {field['parent']}(id)
+        ) WITHOUT ROWID
+        ''')
+        # Lookups by value ("orders that used code X", "products tagged Y")
+        cursor.execute(f'''
+        CREATE INDEX IF NOT EXISTS {_index_name(field['table'], (field['column'],))}
+        ON {field['table']} ({field['column']}, {field['key']})
+        ''')
+
+
+def refresh_extracted_fields(cursor):
+    """
+    Extract every declared field from the rows that still have a payload
+
+    This function:
+    1. Copies each single-valued field out of raw_data with json_extract
+    2. Rebuilds the child rows of each multi-valued field with json_each
+       (arrays) or by splitting the delimited string (tags)
+    3. Removes child rows whose parent row no longer exists
+
+    Rows whose raw_data has already been cleared keep the values extracted
+    when they were loaded. Called by the data fetcher after the raw tables
+    have been loaded and before the payloads are compacted.
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+    """
+    for field in EXTRACTED_COLUMNS:
+        for table in physical_tables(cursor, field['table']):
+            cursor.execute(f'''
+            UPDATE {table}
+            SET {field['column']} = json_extract(raw_data, ?)
+            WHERE raw_data IS NOT NULL
+            ''', (field['path'],))
+
+    for field in EXTRACTED_LISTS:
+        table, key, column, parent = field['table'], field['key'], field['column'], field['parent']
+
+        cursor.execute(f'''
+        DELETE FROM {table}
+        WHERE {key} IN (SELECT id FROM {parent} WHERE raw_data IS NOT NULL)
+        OR {key} NOT IN (SELECT id FROM {parent})
+        ''')
+
+        for source in physical_tables(cursor, parent):
+            if 'item_path' in field:
+                cursor.execute(f'''
+                INSERT OR IGNORE INTO {table} ({key}, {column})
+                SELECT p.id, trim(json_extract(item.value, ?))
+                FROM {source} p, json_each(p.raw_data, ?) item
+                WHERE p.raw_data IS NOT NULL
+                AND trim(json_extract(item.value, ?)) != ''
+                ''', (field['item_path'], field['path'], field['item_path']))
+            else:
+                cursor.execute(f'''
+                SELECT id, json_extract(raw_data, ?) FROM {source}
+                WHERE raw_data IS NOT NULL
+                ''', (field['path'],))
+                rows = [
+                    (row_id, value.strip())
+                    for row_id, values in cursor.fetchall() if values
+                    for value in str(values).split(field['separator']) if value.strip()
+                ]
+                cursor.executemany(f"INSERT OR IGNORE INTO {table} ({key}, {column}) VALUES (?, ?)", rows)
@@ -0,0 +1,417 @@
+# -------------------------------------------------------------------------
+# INVENTORY HISTORY
+# -------------------------------------------------------------------------
+# Every sync replaces shopify_variants, so only today's stock level
+# (inventory_quantity, see shopify_fields.py) is ever known. This module
+# keeps the history of stock levels per variant per day without storing a
+# full copy of every variant every day:
+#
+# - shopify_inventory_checkpoints: the full level of a variant on a day,
+#   written when a variant first appears, when it disappears (quantity
+#   NULL) and every CHECKPOINT_INTERVAL_DAYS after the previous checkpoint
+# - shopify_inventory_deltas: the net change of a variant's level on a day,
+#   written only on days where the level changed
+# - shopify_inventory_levels: the latest level and checkpoint day of every
+#   tracked variant, used to compute the next day's deltas
+#
+# The level of a variant on day D is its latest checkpoint on or before D
+# plus the deltas after that checkpoint up to D. Checkpoints bound how many
+# deltas a reconstruction reads, so a series for any SKU or date range is a
+# couple of index range scans and a cumulative sum. Averages over a range
+# (average_levels()) integrate the levels between events directly, without
+# expanding them to one row per day.
+# -------------------------------------------------------------------------
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from shopify_db import get_read_connection
+
+# Days between two checkpoints of the same variant
+CHECKPOINT_INTERVAL_DAYS = 30
+
+
+def setup_inventory_history(cursor):
+    """
+    Create the inventory history tables
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS shopify_inventory_checkpoints (
+        variant_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        quantity INTEGER,
+        PRIMARY KEY (variant_id, day)
+    ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS shopify_inventory_deltas (
+        variant_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        delta INTEGER NOT NULL,
+        PRIMARY KEY (variant_id, day)
+    ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS shopify_inventory_levels (
+        variant_id INTEGER PRIMARY KEY,
+        quantity INTEGER NOT NULL,
+        checkpoint_day TEXT NOT NULL,
+        updated_day TEXT NOT NULL
+    )
+    ''')
+
+
+def record_inventory_levels(cursor, day=None):
+    """
+    Record the stock levels of the freshly loaded variants for one day
+
+    This function:
+    1. Writes a checkpoint for variants seen for the first time
+    2. Writes a checkpoint for variants whose last checkpoint is due (or
+       already on this day, so a second sync on the same day updates it)
+    3. Adds the net change of every other variant whose level changed to
+       the day's delta, dropping deltas that cancel out
+    4. Writes an empty (NULL) checkpoint for variants that disappeared
+
+    Variants without a tracked inventory_quantity are ignored. Must run after
+    the extracted fields have been refreshed.
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+        day (str): YYYY-MM-DD day the levels belong to, defaults to today
+
+    Returns:
+        dict: Number of checkpoints and deltas written, and variants removed
+    """
+    day = day or datetime.now().strftime('%Y-%m-%d')
+    stats = {}
+
+    cursor.execute("DROP TABLE IF EXISTS temp.inventory_now")
+    cursor.execute('''
+    CREATE TEMP TABLE inventory_now AS
+    SELECT v.id AS variant_id, v.inventory_quantity AS quantity,
+        l.quantity AS previous_quantity,
+        l.variant_id IS NULL
+            OR l.checkpoint_day = :day
+            OR l.checkpoint_day <= DATE(:day, :interval) AS checkpoint_due
+    FROM shopify_variants v
+    LEFT JOIN shopify_inventory_levels l ON l.variant_id = v.id
+    WHERE v.inventory_quantity IS NOT NULL
+    ''', {'day': day, 'interval': f"-{CHECKPOINT_INTERVAL_DAYS} days"})
+
+    # New variants and due checkpoints store the full level; a same-day
+    # delta is folded into the checkpoint
+    cursor.execute('''
+    INSERT OR REPLACE INTO shopify_inventory_checkpoints (variant_id, day, quantity)
+    SELECT variant_id, ?, quantity FROM temp.inventory_now WHERE checkpoint_due
+    ''', (day,))
+    stats['checkpoints'] = cursor.rowcount
+    cursor.execute('''
+    DELETE FROM shopify_inventory_deltas
+    WHERE day = ? AND variant_id IN (SELECT variant_id FROM temp.inventory_now WHERE checkpoint_due)
+    ''', (day,))
+
+    # Everything else stores only the change since the last recorded level
+    cursor.execute('''
+    INSERT INTO shopify_inventory_deltas (variant_id, day, delta)
+    SELECT variant_id, ?, quantity - previous_quantity
+    FROM temp.inventory_now
+    WHERE NOT checkpoint_due AND quantity != previous_quantity
+    ON CONFLICT (variant_id, day) DO UPDATE SET delta = delta + excluded.delta
+    ''', (day,))
+    stats['deltas'] = cursor.rowcount
+    cursor.execute("DELETE FROM shopify_inventory_deltas WHERE day = ? AND delta = 0", (day,))
+
+    # Variants that are gone: an empty checkpoint ends their series
+    cursor.execute('''
+    INSERT OR REPLACE INTO shopify_inventory_checkpoints (variant_id, day, quantity)
+    SELECT variant_id, ?, NULL FROM shopify_inventory_levels
+    WHERE variant_id NOT IN (SELECT variant_id FROM temp.inventory_now)
+    ''', (day,))
+    stats['removed'] = cursor.rowcount
+    cursor.execute('''
+    DELETE FROM shopify_inventory_deltas
+    WHERE day = ? AND variant_id NOT IN (SELECT variant_id FROM temp.inventory_now)
+    ''', (day,))
+    cursor.execute('''
+    DELETE FROM shopify_inventory_levels
+    WHERE variant_id NOT IN (SELECT variant_id FROM temp.inventory_now)
+    ''')
+
+    cursor.execute('''
+    INSERT OR REPLACE INTO shopify_inventory_levels (variant_id, quantity, checkpoint_day, updated_day)
+    SELECT n.variant_id, n.quantity,
+        CASE WHEN n.checkpoint_due THEN :day ELSE l.checkpoint_day END, :day
+    FROM temp.inventory_now n
+    LEFT JOIN shopify_inventory_levels l ON l.variant_id = n.variant_id
+    ''', {'day': day})
+
+    cursor.execute("DROP TABLE IF EXISTS temp.inventory_now")
+    return stats
+
+
+def _variant_ids_for_sku(cursor, sku):
+    """
+    Get the ids of the variants with a SKU
+    """
+    cursor.execute("SELECT id FROM shopify_variants WHERE sku = ?", (sku,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def read_stock_levels(conn, variant_ids=None, start_day=None, end_day=None):
+    """
+    Read the checkpoints and deltas of a date range and resolve their levels
+
+    For each variant the latest checkpoint on or before start_day is read
+    together with every checkpoint and delta after it up to end_day. Levels
+    are a cumulative sum of the deltas within each checkpoint's segment.
+
+    Args:
+        conn (sqlite3.Connection): Connection to read from
+        variant_ids (list): Only these variants (None for all)
+        start_day (str): Inclusive YYYY-MM-DD start (None for all history)
+        end_day (str): Inclusive YYYY-MM-DD end (None for all history)
+
+    Returns:
+        pd.DataFrame: Columns variant_id, day and quantity (the level after
+            the event, NaN while the variant was not tracked), one row per
+            variant and day, sorted by variant and day
+    """
+    filters = []
+    params = []
+    if variant_ids is not None:
+        filters.append(f"variant_id IN ({', '.join('?' for _ in variant_ids)})")
+        params.extend(variant_ids)
+    if end_day:
+        filters.append("day <= ?")
+        params.append(end_day)
+    where_sql = f"WHERE {' AND '.join(filters)}" if filters else ''
+
+    # Each variant starts from its latest checkpoint on or before start_day
+    start_filter = ''
+    start_params = []
+    if start_day:
+        start_filter = '''
+        AND day >= COALESCE(
+            (SELECT MAX(c2.day) FROM shopify_inventory_checkpoints c2
+             WHERE c2.variant_id = events.variant_id AND c2.day <= ?),
+            '')
+        '''
+        start_params = [start_day]
+
+    events = pd.read_sql(f'''
+    SELECT variant_id, day, quantity, delta, is_checkpoint FROM (
+        SELECT variant_id, day, quantity, NULL AS delta, 1 AS is_checkpoint
+        FROM shopify_inventory_checkpoints {where_sql}
+        UNION ALL
+        SELECT variant_id, day, NULL, delta, 0
+        FROM shopify_inventory_deltas {where_sql}
+    ) events
+    WHERE 1 {start_filter}
+    ORDER BY variant_id, day, is_checkpoint DESC
+    ''', conn, params=params + params + start_params)
+
+    if events.empty:
+        return events[['variant_id', 'day', 'quantity']]
+
+    # A new segment starts at every checkpoint; within a segment the level
+    # is the checkpoint's quantity plus the running sum of the deltas
+    # (a variant's first event also starts one, without a base level if it
+    # is not a checkpoint)
+    is_checkpoint = events['is_checkpoint'].to_numpy().astype(bool)
+    event_variants = events['variant_id'].to_numpy()
+    starts = is_checkpoint | np.concatenate(([True], event_variants[1:] != event_variants[:-1]))
+    segment = np.cumsum(starts) - 1
+    checkpoint_quantity = pd.to_numeric(events['quantity'], errors='coerce').to_numpy(dtype='float64')
+    bases = np.where(is_checkpoint, checkpoint_quantity, np.nan)[starts]
+    running = pd.to_numeric(events['delta'], errors='coerce').fillna(0).groupby(segment).cumsum()
+    events['quantity'] = bases[segment] + running.to_numpy()
+
+    # One level per variant and day (the last event of the day wins)
+    return events.drop_duplicates(['variant_id', 'day'], keep='last')[['variant_id', 'day', 'quantity']]
+
+
+def get_stock_series(sku=None, variant_ids=None, start_day=None, end_day=None, conn=None):
+    """
+    Reconstruct daily stock levels from checkpoints and deltas
+
+    The levels of the variants' events (see read_stock_levels()) are
+    expanded to one row per day.
+
+    Args:
+        sku (str): Only variants with this SKU
+        variant_ids (list): Only these variants (None with no SKU for all)
+        start_day (str): Inclusive YYYY-MM-DD start, defaults to the first
+            recorded day
+        end_day (str): Inclusive YYYY-MM-DD end, defaults to the last recorded day
+        conn (sqlite3.Connection): Connection to read from, defaults to the
+            read connection
+
+    Returns:
+        pd.DataFrame: Columns variant_id, day and quantity (NaN while the
+            variant was not tracked), sorted by variant and day
+    """
+    conn = conn or get_read_connection()
+    cursor = conn.cursor()
+    empty = pd.DataFrame({'variant_id': pd.Series(dtype='int64'),
+                          'day': pd.Series(dtype='object'),
+                          'quantity': pd.Series(dtype='float64')})
+
+    if sku is not None:
+        variant_ids = _variant_ids_for_sku(cursor, sku)
+        if not variant_ids:
+            return empty
+
+    levels = read_stock_levels(conn, variant_ids, start_day, end_day)
+    if levels.empty:
+        return empty
+
+    first_day = start_day or levels['day'].min()
+    last_day = end_day or levels['day'].max()
+    days = pd.date_range(first_day, last_day, freq='D').strftime('%Y-%m-%d')
+
+    # Carry each level forward to the following days. Untracked levels (an
+    # empty checkpoint) use a sentinel so forward-filling stops at them.
+    grid = levels.assign(quantity=levels['quantity'].fillna(np.inf)).pivot(
+        index='day', columns='variant_id', values='quantity'
+    )
+    grid = grid.reindex(grid.index.union(days)).ffill().reindex(days)
+    quantities = grid.to_numpy().T.ravel()
+    quantities = np.where(np.isinf(quantities), np.nan, quantities)
+
+    return pd.DataFrame({
+        'variant_id': np.repeat(grid.columns.to_numpy(), len(days)),
+        'day': np.tile(days.to_numpy(), len(grid.columns)),
+        'quantity': quantities,
+    })
+
+
+def average_levels(codes, days, levels, first_day, last_day, size):
+    """
+    Time-weighted average level per variant over a range of day numbers
+
+    Each level holds from its day until the variant's next level (or the
+    end of the range), so the average is the sum of level x days held over
+    the days the variant was tracked. Levels from before the range count
+    from its first day, where only the latest of them holds. The cost grows
+    with the number of levels, not with variants x days.
+
+    Args:
+        codes (np.ndarray): Variant code (0 to size - 1) of every level
+        days (np.ndarray): Day number (days since 1970-01-01) of every level
+        levels (np.ndarray): The levels (NaN while not tracked), sorted by
+            code and day, at most one per code and day
+        first_day (int): Inclusive first day number of the range
+        last_day (int): Inclusive last day number of the range
+        size (int): Number of variant codes
+
+    Returns:
+        tuple: (tracked_days, average) arrays indexed by variant code, the
+            average NaN for variants not tracked on any day of the range
+    """
+    in_range = days <= last_day
+    codes, levels = codes[in_range], levels[in_range]
+    days = np.maximum(days[in_range], first_day)
+
+    # Of several levels moved to the first day, the last one holds
+    keep = np.concatenate(((codes[1:] != codes[:-1]) | (days[1:] != days[:-1]), [True]))
+    codes, days, levels = codes[keep], days[keep], levels[keep]
+
+    # Each level holds until the variant's next level, the last one until the end
+    last_of_variant = np.concatenate((codes[1:] != codes[:-1], [True]))
+    until = np.where(last_of_variant, last_day + 1, np.roll(days, -1))
+    held = np.where(np.isnan(levels), 0, until - days)
+
+    tracked_days = np.bincount(codes, weights=held, minlength=size)
+    level_days = np.bincount(codes, weights=np.nan_to_num(levels) * held, minlength=size)
+    average = np.full(size, np.nan)
+    np.divide(level_days, tracked_days, out=average, where=tracked_days > 0)
+    return tracked_days.astype(np.int64), average
+
+
+def get_average_stock(start_day, end_day, variant_ids=None, conn=None):
+    """
+    Time-weighted average stock level of every variant over a date range
+
+    Works on the variants' levels directly instead of a day-by-day series
+    (see average_levels()).
+
+    Args:
+        start_day (str): Inclusive YYYY-MM-DD start
+        end_day (str): Inclusive YYYY-MM-DD end
+        variant_ids (list): Only these variants (None for all)
+        conn (sqlite3.Connection): Connection to read from, defaults to the
+            read connection
+
+    Returns:
+        pd.DataFrame: Columns variant_id, tracked_days and avg_quantity, for
+            the variants tracked on at least one day of the range
+    """
+    conn = conn or get_read_connection()
+    columns = ['variant_id', 'tracked_days', 'avg_quantity']
+    levels = read_stock_levels(conn, variant_ids, start_day, end_day)
+    if levels.empty:
+        return pd.DataFrame(columns=columns)
+
+    codes, unique_variants = pd.factorize(levels['variant_id'], sort=True)
+    tracked_days, average = average_levels(
+        codes,
+        pd.to_datetime(levels['day']).to_numpy().astype('datetime64[D]').astype(np.int64),
+        levels['quantity'].to_numpy(dtype='float64'),
+        np.datetime64(start_day, 'D').astype(np.int64),
+        np.datetime64(end_day, 'D').astype(np.int64),
+        len(unique_variants),
+    )
+
+    tracked = tracked_days > 0
+    return pd.DataFrame({
+        'variant_id': unique_variants[tracked],
+        'tracked_days': tracked_days[tracked],
+        'avg_quantity': average[tracked],
+    })
+
+
+def get_stockout_history(sku=None, variant_ids=None, start_day=None, end_day=None, conn=None):
+    """
+    Summarize stock-outs per variant over a date range
+
+    Args:
+        sku, variant_ids, start_day, end_day, conn: As for get_stock_series
+
+    Returns:
+        pd.DataFrame: Columns variant_id, tracked_days, stockout_days,
+            stockout_periods (number of separate runs of days at or below
+            zero) and last_stockout_day
+    """
+    series = get_stock_series(sku, variant_ids, start_day, end_day, conn)
+    columns = ['variant_id', 'tracked_days', 'stockout_days', 'stockout_periods', 'last_stockout_day']
+    if series.empty:
+        return pd.DataFrame(columns=columns)
+
+    tracked = series['quantity'].notna()
+    out = tracked & (series['quantity'] <= 0)
+
+    # A period starts on an out-of-stock day whose previous day (of the same variant) was not
+    previous_out = out.groupby(series['variant_id']).shift(fill_value=False)
+    period_start = out & ~previous_out
+
+    summary = pd.DataFrame({
+        'variant_id': series['variant_id'],
+        'tracked': tracked,
+        'out': out,
+        'start': period_start,
+        'out_day': series['day'].where(out),
+    }).groupby('variant_id').agg(
+        tracked_days=('tracked', 'sum'),
+        stockout_days=('out', 'sum'),
+        stockout_periods=('start', 'sum'),
+        last_stockout_day=('out_day', 'max'),
+    ).reset_index()
+    return summary[columns]
@@ -0,0 +1,333 @@
+# -------------------------------------------------------------------------
+# SHOPIFY DATABASE MAINTENANCE
+# -------------------------------------------------------------------------
+# This module keeps the local SQLite database compact and its planner
+# statistics fresh. Every sync deletes and reloads the raw tables, which
+# leaves free pages behind, and the raw JSON payloads stored alongside each
+# row make up most of the file.
+#
+# It handles:
+# - Per-table retention policies (how long rows and raw JSON payloads are kept)
+# - Incremental auto-vacuum, so free pages can be returned to the file system
+#   a few at a time instead of rewriting the whole file with VACUUM
+# - ANALYZE / PRAGMA optimize after each sync
+# - A background thread that vacuums free pages while no sync is running
+# -------------------------------------------------------------------------
+
+import os         # For checking that the database exists
+import sqlite3    # For local database operations
+import threading  # For the idle-time vacuum thread
+import time       # For scheduling the idle-time vacuum
+
+from shopify_db import DB_PATH, apply_pragmas
+from shopify_derived import ORDER_DAY_SQL, refresh_derived_tables
+from shopify_partitions import (PARTITIONED_TABLES, list_partitions, physical_tables,
+                                drop_partitions_before, archive_partition)
+from shopify_changes import log_deletes, prune_change_log
+
+# Retention policy per table:
+# - day_sql: SQL expression giving the YYYY-MM-DD day a row belongs to
+# - keep_rows_days: rows older than this are deleted (None keeps them forever)
+# - keep_raw_days: raw_data payloads older than this are cleared (None keeps them)
+# - archive_expired: for monthly partitioned tables, copy expired months to
+#   an archive file before dropping them
+#
+# Partitioned tables (orders, line items) expire a whole month at a time, once
+# every day of the month is older than keep_rows_days; dropping a partition
+# costs the same no matter how many rows it holds.
+#
+# Line item payloads are always cleared because the order payload already
+# contains every line item.
+RETENTION_POLICIES = {
+    'shopify_orders': {
+        'day_sql': ORDER_DAY_SQL.replace('o.', ''),
+        'keep_rows_days': 730,
+        'keep_raw_days': 30,
+        'archive_expired': False,
+    },
+    'shopify_order_line_items': {
+        'day_sql': 'substr(created_at, 1, 10)',
+        'keep_rows_days': 730,
+        'keep_raw_days': 0,
+        'archive_expired': False,
+    },
+    'shopify_products': {
+        'day_sql': 'substr(updated_at, 1, 10)',
+        'keep_rows_days': None,
+        'keep_raw_days': 180,
+    },
+    'shopify_variants': {
+        'day_sql': 'substr(updated_at, 1, 10)',
+        'keep_rows_days': None,
+        'keep_raw_days': 180,
+    },
+}
+
+# PRAGMA auto_vacuum value for INCREMENTAL mode
+AUTO_VACUUM_INCREMENTAL = 2
+
+# Free pages returned to the file system per vacuum step. Small steps keep
+# each write lock short so a sync or reader is never held up for long.
+VACUUM_PAGES_PER_STEP = 2000
+
+# Free pages below which vacuuming is not worth the write lock
+VACUUM_MIN_FREE_PAGES = 1000
+
+# Rows sampled per index by ANALYZE (keeps ANALYZE fast on large tables)
+ANALYSIS_LIMIT = 1000
+
+# Seconds between idle-time vacuum checks
+IDLE_VACUUM_INTERVAL = 15 * 60
+
+# Background thread started by start_idle_vacuum()
+_idle_vacuum_thread = None
+
+
+def ensure_incremental_auto_vacuum(conn):
+    """
+    Switch the database to incremental auto-vacuum if it isn't already
+
+    For a new database the setting simply applies to the file being created.
+    An existing database has to be rebuilt once with VACUUM for the change to
+    take effect; that happens the first time this runs against it.
+
+    Args:
+        conn (sqlite3.Connection): Read-write connection with no open transaction
+    """
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    if mode == AUTO_VACUUM_INCREMENTAL:
+        return
+
+    conn.execute(f"PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}")
+
+    table_count = conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0]
+    if table_count > 0:
+        print("Converting database to incremental auto-vacuum (one-time VACUUM)...")
+        conn.execute("VACUUM")
+
+
+def apply_retention_policies(conn, policies=None):
+    """
+    Delete expired rows and clear expired raw JSON payloads
+
+    This function:
+    1. Drops (or archives) monthly order and line item partitions that are
+       entirely older than their row retention, and deletes expired rows of
+       other tables
+    2. Clears raw_data on rows older than each table's payload retention
+    3. Rebuilds the derived tables for the days and customers whose orders
+       were dropped
+    4. Logs removed rows in the change log and prunes changes older than
+       the log's own retention (see shopify_changes.py)
+
+    Args:
+        conn (sqlite3.Connection): Read-write connection
+        policies (dict): Retention policies, defaults to RETENTION_POLICIES
+
+    Returns:
+        dict: Partitions expired, rows deleted and payloads cleared per table
+    """
+    policies = policies or RETENTION_POLICIES
+    cursor = conn.cursor()
+    summary = {}
+
+    # Days and customers of dropped orders, refreshed in the derived tables
+    expired_days = set()
+    expired_customers = set()
+
+    for table, policy in policies.items():
+        stats = summary.setdefault(table, {})
+
+        if policy.get('keep_rows_days') is not None:
+            cutoff = f"-{policy['keep_rows_days']} days"
+
+            if table in PARTITIONED_TABLES:
+                # Every month before the cutoff's month has fully expired
+                cursor.execute("SELECT strftime('%Y-%m', 'now', ?)", (cutoff,))
+                first_kept_month = cursor.fetchone()[0]
+                expired = [(month, name) for month, name in list_partitions(cursor, table)
+                           if month < first_kept_month]
+
+                if table == 'shopify_orders':
+                    for _, name in expired:
+                        cursor.execute(f"SELECT {policy['day_sql']}, customer_id FROM {name}")
+                        for day, customer_id in cursor.fetchall():
+                            expired_days.add(day)
+                            expired_customers.add(customer_id)
+
+                for _, name in expired:
+                    log_deletes(cursor, table, name)
+
+                if policy.get('archive_expired'):
+                    for month, _ in expired:
+                        archive_partition(conn, table, month)
+                else:
+                    drop_partitions_before(cursor, table, first_kept_month)
+                stats['partitions_expired'] = len(expired)
+            else:
+                where_sql = f"{policy['day_sql']} < DATE('now', ?)"
+                log_deletes(cursor, table, table, where_sql, (cutoff,))
+                cursor.execute(f"DELETE FROM {table} WHERE {where_sql}", (cutoff,))
+                stats['rows_deleted'] = cursor.rowcount
+
+        if policy.get('keep_raw_days') is not None:
+            cleared = 0
+            for physical_table in physical_tables(cursor, table):
+                sql = f"UPDATE {physical_table} SET raw_data = NULL WHERE raw_data IS NOT NULL"
+                params = ()
+                if policy['keep_raw_days'] > 0:
+                    sql += f" AND {policy['day_sql']} < DATE('now', ?)"
+                    params = (f"-{policy['keep_raw_days']} days",)
+                cursor.execute(sql, params)
+                cleared += cursor.rowcount
+            stats['payloads_cleared'] = cleared
+
+    if expired_days:
+        refresh_derived_tables(cursor, expired_days, expired_customers)
+
+    summary['shopify_change_log'] = {'rows_deleted': prune_change_log(cursor)}
+
+    conn.commit()
+    return summary
+
+
+def refresh_statistics(conn):
+    """
+    Refresh the query planner statistics
+
+    A sync replaces most of the data, so the statistics are rebuilt with a
+    sampled ANALYZE and then handed to PRAGMA optimize for anything it still
+    considers stale.
+
+    Args:
+        conn (sqlite3.Connection): Read-write connection
+    """
+    conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA optimize")
+    conn.commit()
+
+
+def incremental_vacuum(conn, max_pages=None):
+    """
+    Return free pages to the file system in small steps
+
+    Args:
+        conn (sqlite3.Connection): Read-write connection
+        max_pages (int): Stop after releasing this many pages (None for all)
+
+    Returns:
+        int: Number of pages released
+    """
+    # Without incremental auto-vacuum the pragma below is a no-op
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+        return 0
+
+    released = 0
+
+    while max_pages is None or released < max_pages:
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if free_pages == 0:
+            break
+
+        step = min(free_pages, VACUUM_PAGES_PER_STEP)
+        if max_pages is not None:
+            step = min(step, max_pages - released)
+
+        conn.execute(f"PRAGMA incremental_vacuum({step})").fetchall()
+        conn.commit()
+        released += step
+
+    return released
+
+
+def run_post_sync_maintenance(conn):
+    """
+    Maintenance run by the data fetcher right after a successful sync
+
+    This function:
+    1. Applies the retention policies
+    2. Refreshes the planner statistics
+    3. Releases up to one step of free pages (the rest is left to idle time)
+
+    Failures are reported but never fail the sync itself.
+
+    Args:
+        conn (sqlite3.Connection): The sync's read-write connection, committed
+    """
+    try:
+        summary = apply_retention_policies(conn)
+        refresh_statistics(conn)
+        released = incremental_vacuum(conn, max_pages=VACUUM_PAGES_PER_STEP)
+        print(f"Maintenance complete: {summary}, released {released} free pages")
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"WARNING: Database maintenance failed: {e}")
+
+
+def vacuum_if_idle():
+    """
+    Release free pages if no other connection is writing
+
+    The write lock is requested without waiting, so when a sync is running
+    this simply skips and tries again at the next interval.
+
+    Returns:
+        int: Number of pages released
+    """
+    if not os.path.exists(DB_PATH):
+        return 0
+
+    try:
+        conn = sqlite3.connect(DB_PATH, timeout=0)
+    except sqlite3.Error:
+        return 0
+
+    try:
+        apply_pragmas(conn)
+        conn.execute("PRAGMA busy_timeout = 0")
+        if conn.execute("PRAGMA freelist_count").fetchone()[0] < VACUUM_MIN_FREE_PAGES:
+            return 0
+        return incremental_vacuum(conn)
+    except sqlite3.OperationalError:
+        # Another connection holds the write lock - try again later
+        return 0
+    finally:
+        conn.close()
+
+
+def _idle_vacuum_loop(interval):
+    """
+    Body of the idle-time vacuum thread
+    """
+    while True:
+        time.sleep(interval)
+        try:
+            released = vacuum_if_idle()
+            if released:
+                print(f"Idle maintenance released {released} free pages")
+        except Exception as e:
+            print(f"WARNING: Idle maintenance failed: {e}")
+
+
+def start_idle_vacuum(interval=IDLE_VACUUM_INTERVAL):
+    """
+    Start the background thread that vacuums free pages during idle time
+
+    Safe to call more than once; only one thread is started per process.
+
+    Args:
+        interval (int): Seconds between checks
+    """
+    global _idle_vacuum_thread
+
+    if _idle_vacuum_thread is not None and _idle_vacuum_thread.is_alive():
+        return
+
+    _idle_vacuum_thread = threading.Thread(
+        target=_idle_vacuum_loop,
+        args=(interval,),
+        name='shopify-idle-vacuum',
+        daemon=True
+    )
+    _idle_vacuum_thread.start()
@@ -0,0 +1,398 @@
+# -------------------------------------------------------------------------
+# TIME-PARTITIONED ORDER STORAGE
+# -------------------------------------------------------------------------
+# Orders and order line items are stored in one physical table per calendar
+# month of the order (shopify_orders_2024_05, shopify_order_line_items_2024_05,
+# ...) behind a UNION ALL view that keeps the original table name, so every
+# read query keeps working unchanged.
+#
+# It handles:
+# - The default partition (shopify_orders_default, ...) which defines the
+#   schema copied to every monthly partition and holds rows without a
+#   usable date (and the rows of databases created before partitioning)
+# - Routing writes to the partition of the order's month
+# - Pruning: listing only the partitions that overlap a date range
+# - Dropping or archiving whole months instead of deleting row by row
+#
+# Months are the store-local month of the order, i.e. the first seven
+# characters of Shopify's created_at timestamp, matching the day keys used
+# by the derived tables (see shopify_derived.py).
+# -------------------------------------------------------------------------
+
+import os  # For the archive directory
+import re  # For parsing partition names and timestamps
+
+from shopify_db import DB_PATH
+
+# Logical tables stored as monthly partitions
+PARTITIONED_TABLES = ('shopify_orders', 'shopify_order_line_items')
+
+# Column holding the timestamp that decides a row's partition
+PARTITION_COLUMN = 'created_at'
+
+# Where archived partitions are written
+ARCHIVE_DIR = os.path.join(os.path.dirname(DB_PATH), 'archive')
+
+_MONTH_PATTERN = re.compile(r'^(\d{4})-(\d{2})')
+
+
+def default_partition(table):
+    """
+    Name of the default partition of a logical table
+    """
+    return f"{table}_default"
+
+
+def partition_name(table, month):
+    """
+    Name of the partition holding one month (YYYY-MM) of a logical table
+    """
+    return f"{table}_{month.replace('-', '_')}"
+
+
+def month_of(timestamp):
+    """
+    Get the YYYY-MM month of a Shopify timestamp
+
+    Returns:
+        str or None: The month, or None if the timestamp has no valid date
+    """
+    match = _MONTH_PATTERN.match(timestamp or '')
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        return None
+    return f"{match.group(1)}-{match.group(2)}"
+
+
+def list_partitions(cursor, table):
+    """
+    List the monthly partitions of a logical table
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+        table (str): Logical table name
+
+    Returns:
+        list: (month, partition name) tuples sorted by month
+    """
+    pattern = re.compile(rf'^{re.escape(table)}_(\d{{4}})_(\d{{2}})$')
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?", (f"{table}_%",))
+
+    partitions = []
+    for (name,) in cursor.fetchall():
+        match = pattern.match(name)
+        if match:
+            partitions.append((f"{match.group(1)}-{match.group(2)}", name))
+    return sorted(partitions)
+
+
+def physical_tables(cursor, table):
+    """
+    List every physical table of a logical table (default partition first)
+
+    Tables that are not partitioned are returned as they are, so callers can
+    use this for any table they write to.
+    """
+    if table not in PARTITIONED_TABLES:
+        return [table]
+    return [default_partition(table)] + [name for _, name in list_partitions(cursor, table)]
+
+
+def prune_partitions(cursor, table, start_day=None, end_day=None):
+    """
+    List the physical tables that can hold rows in a date range
+
+    The default partition is always included because its rows have no month.
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+        table (str): Logical table name
+        start_day (str): Inclusive YYYY-MM-DD lower bound, or None
+        end_day (str): Exclusive YYYY-MM-DD upper bound, or None
+
+    Returns:
+        list: Names of the physical tables to read
+    """
+    start_month = start_day[:7] if start_day else None
+    end_month = end_day[:7] if end_day else None
+
+    tables = [default_partition(table)]
+    for month, name in list_partitions(cursor, table):
+        if start_month and month < start_month:
+            continue
+        if end_month and (month > end_month or (month == end_month and end_day[8:] == '01')):
+            continue
+        tables.append(name)
+    return tables
+
+
+def partitioned_source(cursor, table, start_day=None, end_day=None):
+    """
+    Build a FROM-clause source reading only the partitions of a date range
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+        table (str): Logical table name
+        start_day (str): Inclusive YYYY-MM-DD lower bound, or None
+        end_day (str): Exclusive YYYY-MM-DD upper bound, or None
+
+    Returns:
+        str: A parenthesized UNION ALL subquery, usable as "FROM {source} o"
+    """
+    tables = prune_partitions(cursor, table, start_day, end_day)
+    return '(' + ' UNION ALL '.join(f"SELECT * FROM {name}" for name in tables) + ')'
+
+
+def _columns(cursor, name):
+    """
+    Get the (name, declared type) columns of a physical table
+    """
+    cursor.execute(f"PRAGMA table_info({name})")
+    return [(row[1], row[2]) for row in cursor.fetchall()]
+
+
+def rebuild_view(cursor, table):
+    """
+    Recreate the UNION ALL view of a logical table over all its partitions
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+        table (str): Logical table name
+    """
+    column_list = ', '.join(name for name, _ in _columns(cursor, default_partition(table)))
+    selects = ' UNION ALL '.join(
+        f"SELECT {column_list} FROM {name}" for name in physical_tables(cursor, table)
+    )
+    cursor.execute(f"DROP VIEW IF EXISTS {table}")
+    cursor.execute(f"CREATE VIEW {table} AS {selects}")
+
+
+def _copy_indexes(cursor, table, partition):
+    """
+    Create the default partition's indexes on another partition
+    """
+    default = default_partition(table)
+    suffix = partition[len(table):]
+
+    cursor.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (default,)
+    )
+    for index_name, sql in cursor.fetchall():
+        sql = re.sub(
+            rf'^CREATE (UNIQUE )?INDEX "?{re.escape(index_name)}"?(\s+)ON "?{re.escape(default)}"?(?=\W)',
+            lambda m: f"CREATE {m.group(1) or ''}INDEX IF NOT EXISTS {index_name}{suffix}{m.group(2)}ON {partition}",
+            sql
+        )
+        cursor.execute(sql)
+
+
+def create_partition(cursor, table, month):
+    """
+    Create the partition of one month with the default partition's schema
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+        table (str): Logical table name
+        month (str): Month in YYYY-MM format
+
+    Returns:
+        str: Name of the partition
+    """
+    default = default_partition(table)
+    name = partition_name(table, month)
+
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (default,))
+    create_sql = cursor.fetchone()[0]
+    cursor.execute(re.sub(
+        rf'^CREATE TABLE "?{re.escape(default)}"?',
+        f"CREATE TABLE IF NOT EXISTS {name}",
+        create_sql
+    ))
+    _copy_indexes(cursor, table, name)
+    rebuild_view(cursor, table)
+    return name
+
+
+def setup_partitions(cursor):
+    """
+    Bring the partitioned storage up to date with the default partitions
+
+    This function:
+    1. Renames tables of databases created before partitioning to become
+       their default partition
+    2. Adds columns and indexes that were added to a default partition to
+       every monthly partition
+    3. Recreates the UNION ALL views
+
+    Must run after the default partitions and all their columns and indexes
+    have been created.
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+    """
+    for table in PARTITIONED_TABLES:
+        default = default_partition(table)
+        default_columns = _columns(cursor, default)
+
+        for _, name in list_partitions(cursor, table):
+            existing = {column for column, _ in _columns(cursor, name)}
+            for column, column_type in default_columns:
+                if column not in existing:
+                    cursor.execute(f"ALTER TABLE {name} ADD COLUMN {column} {column_type}")
+            _copy_indexes(cursor, table, name)
+
+        rebuild_view(cursor, table)
+
+
+def migrate_unpartitioned_tables(cursor):
+    """
+    Turn tables from before partitioning into default partitions
+
+    The old rows stay readable through the view; repartition() moves them
+    into monthly partitions. Must run before the default partitions are created.
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+    """
+    for table in PARTITIONED_TABLES:
+        cursor.execute("SELECT type FROM sqlite_master WHERE name = ?", (table,))
+        row = cursor.fetchone()
+        if row and row[0] == 'table':
+            cursor.execute(f"ALTER TABLE {table} RENAME TO {default_partition(table)}")
+
+
+def repartition(cursor, table):
+    """
+    Move dated rows from the default partition into monthly partitions
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+        table (str): Logical table name
+
+    Returns:
+        int: Number of rows moved
+    """
+    default = default_partition(table)
+    cursor.execute(f"SELECT DISTINCT substr({PARTITION_COLUMN}, 1, 7) FROM {default}")
+    months = [month for (month,) in cursor.fetchall() if month_of(month)]
+
+    moved = 0
+    for month in months:
+        name = create_partition(cursor, table, month)
+        cursor.execute(
+            f"INSERT OR REPLACE INTO {name} SELECT * FROM {default} WHERE substr({PARTITION_COLUMN}, 1, 7) = ?",
+            (month,)
+        )
+        moved += cursor.rowcount
+        cursor.execute(f"DELETE FROM {default} WHERE substr({PARTITION_COLUMN}, 1, 7) = ?", (month,))
+    return moved
+
+
+class PartitionRouter:
+    """
+    Sends rows of partitioned tables to the partition of their month
+
+    Keeps track of the partitions that already exist, so the schema is only
+    read once per sync and a partition is created the first time a row for
+    its month arrives.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.known = {
+            table: {month for month, _ in list_partitions(cursor, table)}
+            for table in PARTITIONED_TABLES
+        }
+
+    def table_for(self, table, timestamp):
+        """
+        Get the physical table a row belongs in, creating it if needed
+
+        Args:
+            table (str): Logical table name
+            timestamp (str): The row's created_at timestamp
+
+        Returns:
+            str: Name of the physical table to write to
+        """
+        month = month_of(timestamp)
+        if month is None:
+            return default_partition(table)
+
+        if month not in self.known[table]:
+            create_partition(self.cursor, table, month)
+            self.known[table].add(month)
+        return partition_name(table, month)
+
+
+def clear_partitioned_table(cursor, table):
+    """
+    Remove every row of a logical table by dropping its monthly partitions
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+        table (str): Logical table name
+    """
+    for _, name in list_partitions(cursor, table):
+        cursor.execute(f"DROP TABLE {name}")
+    cursor.execute(f"DELETE FROM {default_partition(table)}")
+    rebuild_view(cursor, table)
+
+
+def drop_partitions_before(cursor, table, month):
+    """
+    Drop every monthly partition older than a month
+
+    Args:
+        cursor (sqlite3.Cursor): Database cursor for executing SQL
+        table (str): Logical table name
+        month (str): First month to keep, in YYYY-MM format
+
+    Returns:
+        list: Months that were dropped
+    """
+    dropped = []
+    for partition_month, name in list_partitions(cursor, table):
+        if partition_month < month:
+            cursor.execute(f"DROP TABLE {name}")
+            dropped.append(partition_month)
+
+    if dropped:
+        rebuild_view(cursor, table)
+    return dropped
+
+
+def archive_partition(conn, table, month, archive_dir=ARCHIVE_DIR):
+    """
+    Copy one monthly partition into its own database file, then drop it
+
+    ATTACH is not allowed inside a transaction, so this commits whatever
+    the connection has pending first.
+
+    Args:
+        conn (sqlite3.Connection): Read-write connection
+        table (str): Logical table name
+        month (str): Month in YYYY-MM format
+        archive_dir (str): Directory for archive files
+
+    Returns:
+        str: Path of the archive file
+    """
+    name = partition_name(table, month)
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.db")
+
+    conn.commit()
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS archive.{name}")
+        conn.execute(f"CREATE TABLE archive.{name} AS SELECT * FROM main.{name}")
+        conn.commit()
+    finally:
+        conn.execute("DETACH DATABASE archive")
+
+    cursor = conn.cursor()
+    cursor.execute(f"DROP TABLE {name}")
+    rebuild_view(cursor, table)
+    conn.commit()
+    return path
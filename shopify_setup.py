@@ -21,6 +21,16 @@ import time      # For rate limiting API calls
 import re        # For regular expression matching
 from datetime import datetime, timedelta  # For date calculations
 from dotenv import load_dotenv  # For loading environment variables
+from shopify_db import DB_PATH, get_read_connection, write_connection, remove_database_files, publish_read_snapshot
+from shopify_derived import (setup_derived_tables, get_rollup_days, get_changed_days, get_customer_ids,
+                             customer_key, refresh_derived_tables)
+from shopify_partitions import (PartitionRouter, setup_partitions, migrate_unpartitioned_tables,
+                                clear_partitioned_table)
+from shopify_fields import setup_extracted_fields, refresh_extracted_fields
+from shopify_changes import setup_change_log, ChangeCapture, ChangeConsumer
+from shopify_inventory import setup_inventory_history, record_inventory_levels
+from shopify_maintenance import ensure_incremental_auto_vacuum, run_post_sync_maintenance
+from columnar_snapshot import export_sales_snapshot, remove_sales_snapshots, withdraw_sales_snapshot
 
 # Load environment variables from .env file
 load_dotenv()
@@ -30,8 +40,8 @@ SHOP_NAME = os.getenv("SHOPIFY_SHOP_NAME")  # Shopify store name
 ACCESS_TOKEN = os.getenv("SHOPIFY_ACCESS_TOKEN")  # API access token
 API_VERSION = "2023-10"  # Shopify API version - update to latest stable when needed
 
-# Define database path - SQLite database file location
-DB_PATH = 'database/shopify_data.db'
+# Change log consumer that keeps the facts and daily rollups up to date
+DERIVED_TABLES_CONSUMER = 'derived_tables'
 
 def validate_credentials():
     """
@@ -114,13 +124,24 @@ def setup_database():
        - shopify_variants: Store product variants
        - shopify_orders: Store order information
        - shopify_order_line_items: Store individual line items in orders
+       (both partitioned by month behind a view, see shopify_partitions.py)
        - shopify_metadata: Store information about data fetching status
+    4. Creates the columns and tables for fields extracted from the raw
+       JSON payloads (see shopify_fields.py)
+    5. Creates the derived fact and rollup tables (see shopify_derived.py)
+    6. Brings the monthly order partitions and their views up to date
+    7. Creates the change data capture log (see shopify_changes.py)
+    8. Creates the inventory history tables (see shopify_inventory.py)
+    
+    The database is switched to incremental auto-vacuum first so that free
+    pages left by syncs can be released later (see shopify_maintenance.py).
     """
-    # Create database directory if it doesn't exist
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    
     # Use context manager for proper connection handling
-    with sqlite3.connect(DB_PATH, timeout=20) as conn:
+    # (the connection layer creates the database directory if needed)
+    with write_connection() as conn:
+        # Must run before the first table is created to apply without a VACUUM
+        ensure_incremental_auto_vacuum(conn)
+        
         cursor = conn.cursor()
         
         # Create shopify_products table
@@ -166,9 +187,12 @@ def setup_database():
         )
         ''')
         
-        # Create shopify_orders table
+        # Tables from before partitioning become the default partitions
+        migrate_unpartitioned_tables(cursor)
+        
+        # Create shopify_orders default partition (monthly partitions copy its schema)
         cursor.execute('''
-        CREATE TABLE IF NOT EXISTS shopify_orders (
+        CREATE TABLE IF NOT EXISTS shopify_orders_default (
             id INTEGER PRIMARY KEY,
             email TEXT,
             created_at TEXT,
@@ -181,13 +205,15 @@ def setup_database():
             financial_status TEXT,
             fulfillment_status TEXT,
             processed_at TEXT,
-            raw_data TEXT
+            raw_data TEXT,
+            customer_id INTEGER,
+            FOREIGN KEY (customer_id) REFERENCES shopify_customers(customer_id)
         )
         ''')
         
-        # Create shopify_order_line_items table
+        # Create shopify_order_line_items default partition
         cursor.execute('''
-        CREATE TABLE IF NOT EXISTS shopify_order_line_items (
+        CREATE TABLE IF NOT EXISTS shopify_order_line_items_default (
             id INTEGER PRIMARY KEY,
             order_id INTEGER,
             variant_id INTEGER,
@@ -212,10 +238,32 @@ def setup_database():
             products_count INTEGER,
             orders_count INTEGER,
             status TEXT,
-            error_message TEXT
+            error_message TEXT,
+            data_version INTEGER DEFAULT 0
         )
         ''')
         
+        # Databases created before data versions get the column added
+        cursor.execute("PRAGMA table_info(shopify_metadata)")
+        if 'data_version' not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE shopify_metadata ADD COLUMN data_version INTEGER DEFAULT 0")
+        
+        # Create columns and child tables for fields extracted from raw_data
+        setup_extracted_fields(cursor)
+        
+        # Create derived tables maintained at ingest time
+        setup_derived_tables(cursor)
+        
+        # Copy the default partitions' schema to every monthly partition and
+        # (re)create the shopify_orders / shopify_order_line_items views
+        setup_partitions(cursor)
+        
+        # Create the change log read by downstream incremental consumers
+        setup_change_log(cursor)
+        
+        # Create the delta-encoded stock level history
+        setup_inventory_history(cursor)
+        
         conn.commit()
 
 def safe_get_value(obj, key, default=None, expected_type=None):
@@ -267,7 +315,16 @@ def fetch_shopify_data():
     4. Tests API connection before proceeding
     5. Fetches products and their variants
     6. Fetches orders and their line items
-    7. Updates metadata with fetch status
+    7. Extracts the declared JSON fields, logs the rows that changed (see
+       shopify_changes.py), records today's stock levels (see
+       shopify_inventory.py), then refreshes the line-item facts and daily
+       rollups for the days in the change log since their last refresh, and
+       the customer aggregates for the customers that changed
+    8. Updates metadata with fetch status
+    9. Runs post-sync maintenance (retention, ANALYZE, incremental vacuum)
+    10. Exports the committed facts as a memory-mapped columnar snapshot
+        (or withdraws the old one if the export fails)
+    11. Publishes an immutable read snapshot for the web application
     
     Returns:
         dict: A dictionary containing the result of the operation:
@@ -292,12 +349,19 @@ def fetch_shopify_data():
     
     try:
         # Use context manager for database connection
-        with sqlite3.connect(DB_PATH, timeout=20) as conn:
+        with write_connection() as conn:
             cursor = conn.cursor()
             
-            # Clear existing data
-            cursor.execute("DELETE FROM shopify_order_line_items")
-            cursor.execute("DELETE FROM shopify_orders")
+            # Every customer currently aggregated changes when the data is cleared
+            changed_customers = get_customer_ids(cursor)
+            fetched_days = set()
+            
+            # Remember every row's version so the changes made by this sync can be logged
+            capture = ChangeCapture(cursor)
+            
+            # Clear existing data (orders are dropped a month at a time)
+            clear_partitioned_table(cursor, 'shopify_order_line_items')
+            clear_partitioned_table(cursor, 'shopify_orders')
             cursor.execute("DELETE FROM shopify_variants")
             cursor.execute("DELETE FROM shopify_products")
             
@@ -321,28 +385,74 @@ def fetch_shopify_data():
             except requests.exceptions.Timeout:
                 error_msg = "Connection to Shopify API timed out after 30 seconds"
                 print(error_msg)
-                update_metadata(status="error", error_message=error_msg)
+                update_metadata(status="error", error_message=error_msg, conn=conn)
                 return {"success": False, "error": error_msg}
             except requests.exceptions.RequestException as e:
                 error_msg = f"Failed to connect to Shopify API: {str(e)}"
                 print(error_msg)
-                update_metadata(status="error", error_message=error_msg)
+                update_metadata(status="error", error_message=error_msg, conn=conn)
                 return {"success": False, "error": error_msg}
             
             # Fetch products
             products_count = fetch_products(BASE_URL, HEADERS, cursor)
             
             # Fetch orders
-            orders_count = fetch_orders(BASE_URL, HEADERS, cursor)
+            orders_count = fetch_orders(
+                BASE_URL, HEADERS, cursor,
+                changed_days=fetched_days,
+                changed_customers=changed_customers
+            )
             
-            # Update metadata
+            # Copy the declared JSON fields out of the freshly loaded payloads
+            refresh_extracted_fields(cursor)
+            
+            # Log the rows this sync inserted, updated or deleted
+            change_count = capture.record()
+            print(f"Logged {change_count} changes for sync {capture.sync_id}")
+            
+            # Add today's stock levels to the inventory history
+            record_inventory_levels(cursor)
+            
+            # Rebuild facts, rollups and customer aggregates only for the
+            # days and customers touched by this sync. The days come from the
+            # change log, read and committed in this transaction; without a
+            # usable offset every day is rebuilt (old days and fetched days).
+            consumer = ChangeConsumer(DERIVED_TABLES_CONSUMER)
+            batch = consumer.poll(conn=conn)
+            if batch.full_refresh:
+                changed_days = get_rollup_days(cursor) | fetched_days
+            else:
+                changed_days = get_changed_days(cursor, batch)
+            print(f"Refreshing derived tables for {len(changed_days)} days")
+            refresh_derived_tables(cursor, changed_days, changed_customers)
+            consumer.commit(batch, conn=conn)
+            
+            # Update metadata in the same transaction as the data load
             update_metadata(
                 status="success", 
                 products_count=products_count, 
-                orders_count=orders_count
+                orders_count=orders_count,
+                conn=conn
             )
             
             conn.commit()
+            
+            # Apply retention, refresh planner statistics and release free pages
+            run_post_sync_maintenance(conn)
+            
+            # Publish the committed facts as a columnar snapshot for the web app
+            # before the read snapshot, so the two never show different syncs.
+            # If this fails the old version is withdrawn and the app falls back
+            # to SQL, so the sync still succeeds.
+            try:
+                export_sales_snapshot()
+            except Exception as e:
+                print(f"WARNING: Could not export columnar snapshot: {str(e)}")
+                withdraw_sales_snapshot()
+            
+            # Hand readers an immutable copy of the freshly loaded data
+            publish_read_snapshot(conn)
+            
             return {
                 "success": True, 
                 "products_count": products_count, 
@@ -470,21 +580,27 @@ def fetch_products(base_url, headers, cursor):
         print(f"Error fetching products: {e}")
         raise
 
-def fetch_orders(base_url, headers, cursor, days=90):
+def fetch_orders(base_url, headers, cursor, days=90, changed_days=None, changed_customers=None):
     """
     Fetch orders from Shopify API
     
     This function:
     1. Makes API calls to retrieve orders from Shopify within a specified time period
     2. Processes each order and its line items
-    3. Stores the order data in the database
-    4. Handles pagination and rate limiting
+    3. Stores the order data in the partitions of the order's month
+    4. Links each order to its customer (keyed by normalized email hash)
+    5. Records the days and customers whose orders were added or changed
+    6. Handles pagination and rate limiting
     
     Args:
         base_url (str): Base URL for the Shopify API
         headers (dict): HTTP headers containing authentication
         cursor (sqlite3.Cursor): Database cursor for executing SQL
         days (int): Number of days to look back for orders (default: 90)
+        changed_days (set): Optional set that receives the day (YYYY-MM-DD) of
+            every stored order, plus its previous day if it was already stored
+        changed_customers (set): Optional set that receives the customer key of
+            every stored order, plus its previous key if it was already stored
         
     Returns:
         int: The number of orders successfully fetched and stored
@@ -496,6 +612,9 @@ def fetch_orders(base_url, headers, cursor, days=90):
     orders_count = 0
     line_items_count = 0
     
+    # Routes each order and its line items to the partition of their month
+    router = PartitionRouter(cursor)
+    
     # Calculate date for filtering orders
     start_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
     
@@ -509,12 +628,52 @@ def fetch_orders(base_url, headers, cursor, days=90):
         
         # Process each order
         for order in data.get('orders', []):
+            order_id = safe_get_value(order, 'id', expected_type=int)
+            created_at = safe_get_value(order, 'created_at', '')
+            customer_id, customer_email = customer_key(safe_get_value(order, 'email', ''))
+            
+            # The order and its line items go to the partition of the order's month
+            orders_table = router.table_for('shopify_orders', created_at)
+            line_items_table = router.table_for('shopify_order_line_items', created_at)
+            
+            cursor.execute("SELECT created_at, customer_id FROM shopify_orders WHERE id = ?", (order_id,))
+            previous = cursor.fetchone()
+            
+            # An order whose date changed moves out of its old month's partition
+            if previous and router.table_for('shopify_orders', previous[0]) != orders_table:
+                cursor.execute(
+                    f"DELETE FROM {router.table_for('shopify_orders', previous[0])} WHERE id = ?",
+                    (order_id,)
+                )
+                cursor.execute(
+                    f"DELETE FROM {router.table_for('shopify_order_line_items', previous[0])} WHERE order_id = ?",
+                    (order_id,)
+                )
+            
+            # Both the old and the new day/customer of a replaced order change
+            if changed_days is not None:
+                if previous:
+                    changed_days.add(previous[0][:10])
+                changed_days.add(created_at[:10])
+            if changed_customers is not None:
+                if previous:
+                    changed_customers.add(previous[1])
+                changed_customers.add(customer_id)
+            
+            # Make sure the customer exists; its aggregates are refreshed after the load
+            if customer_id is not None:
+                cursor.execute(
+                    "INSERT OR IGNORE INTO shopify_customers (customer_id, email) VALUES (?, ?)",
+                    (customer_id, customer_email)
+                )
+            
             # Insert order data with safe value extraction
-            cursor.execute('''
-            INSERT OR REPLACE INTO shopify_orders
+            cursor.execute(f'''
+            INSERT OR REPLACE INTO {orders_table}
             (id, email, created_at, updated_at, number, total_price, subtotal_price, 
-            total_tax, currency, financial_status, fulfillment_status, processed_at, raw_data)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            total_tax, currency, financial_status, fulfillment_status, processed_at, raw_data,
+            customer_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 safe_get_value(order, 'id', expected_type=int),
                 safe_get_value(order, 'email', ''),
@@ -528,13 +687,14 @@ def fetch_orders(base_url, headers, cursor, days=90):
                 safe_get_value(order, 'financial_status', ''),
                 safe_get_value(order, 'fulfillment_status', ''),
                 safe_get_value(order, 'processed_at', ''),
-                json.dumps(order)
+                json.dumps(order),
+                customer_id
             ))
             
             # Process line items
             for item in order.get('line_items', []):
-                cursor.execute('''
-                INSERT OR REPLACE INTO shopify_order_line_items
+                cursor.execute(f'''
+                INSERT OR REPLACE INTO {line_items_table}
                 (id, order_id, variant_id, product_id, title, variant_title,
                 sku, quantity, price, total_discount, created_at, raw_data)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
@@ -566,7 +726,7 @@ def fetch_orders(base_url, headers, cursor, days=90):
     print(f"Fetched {orders_count} orders with {line_items_count} line items")
     return orders_count
 
-def update_metadata(status="unknown", products_count=0, orders_count=0, error_message=None):
+def update_metadata(status="unknown", products_count=0, orders_count=0, error_message=None, conn=None):
     """
     Update metadata about the last fetch
     
@@ -578,28 +738,45 @@ def update_metadata(status="unknown", products_count=0, orders_count=0, error_me
         products_count (int): Number of products successfully fetched
         orders_count (int): Number of orders successfully fetched
         error_message (str): Error message if status is "error", None otherwise
+        conn (sqlite3.Connection): Open write connection to reuse. A sync holds
+            the write lock while loading, so it must record its own metadata
+            through that connection instead of opening a second writer.
     
     This data is used by the application to determine if the database has been
     properly populated and to display information to the user about the last fetch.
+    
+    Every successful fetch also bumps the data version, which keys the web
+    application's query result cache (see query_cache.py). Failed fetches
+    leave the data, and therefore the version, unchanged.
     """
+    def write(conn):
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT COALESCE(MAX(data_version), 0) FROM shopify_metadata")
+        data_version = cursor.fetchone()[0]
+        if status == "success":
+            data_version += 1
+        
+        cursor.execute("DELETE FROM shopify_metadata")
+        cursor.execute('''
+        INSERT INTO shopify_metadata 
+        (last_fetch_time, products_count, orders_count, status, error_message, data_version)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', (
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            products_count,
+            orders_count,
+            status,
+            error_message,
+            data_version
+        ))
+    
     try:
-        with sqlite3.connect(DB_PATH, timeout=20) as conn:
-            cursor = conn.cursor()
-            
-            cursor.execute("DELETE FROM shopify_metadata")
-            cursor.execute('''
-            INSERT INTO shopify_metadata 
-            (last_fetch_time, products_count, orders_count, status, error_message)
-            VALUES (?, ?, ?, ?, ?)
-            ''', (
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                products_count,
-                orders_count,
-                status,
-                error_message
-            ))
-            
-            conn.commit()
+        if conn is not None:
+            write(conn)
+        else:
+            with write_connection() as own_conn:
+                write(own_conn)
     except sqlite3.Error as e:
         print(f"Database error in update_metadata: {e}")
 
@@ -622,11 +799,14 @@ def check_shopify_data():
             - error: Error message (if applicable)
     """
     try:
-        with sqlite3.connect(DB_PATH, timeout=20) as conn:
+        with get_read_connection() as conn:
             cursor = conn.cursor()
             
             # Check metadata first
-            cursor.execute("SELECT * FROM shopify_metadata ORDER BY id DESC LIMIT 1")
+            cursor.execute('''
+            SELECT id, last_fetch_time, products_count, orders_count, status, error_message
+            FROM shopify_metadata ORDER BY id DESC LIMIT 1
+            ''')
             metadata = cursor.fetchone()
             
             if not metadata:
@@ -690,8 +870,7 @@ def get_analytics():
             - error: Error message (if applicable)
     """
     try:
-        with sqlite3.connect(DB_PATH, timeout=20) as conn:
-            conn.row_factory = sqlite3.Row  # This enables column access by name
+        with get_read_connection() as conn:  # Rows allow column access by name
             cursor = conn.cursor()
             
             # Check if we have data
@@ -720,9 +899,8 @@ def get_analytics():
             # Calculate total items sold
             cursor.execute("""
             SELECT SUM(quantity) as total_items 
-            FROM shopify_order_line_items oli
-            JOIN shopify_orders o ON oli.order_id = o.id
-            WHERE o.financial_status != 'refunded'
+            FROM shopify_sales_facts
+            WHERE is_refunded = 0
             """)
             result = cursor.fetchone()
             total_items = result['total_items'] if result and result['total_items'] is not None else 0
@@ -731,14 +909,12 @@ def get_analytics():
             cursor.execute("""
             SELECT 
                 p.title || CASE WHEN v.title != 'Default Title' AND v.title IS NOT NULL THEN ' - ' || v.title ELSE '' END as title,
-                SUM(oli.quantity) as quantity,
-                SUM(oli.quantity * oli.price) as sales
-            FROM shopify_order_line_items oli
-            JOIN shopify_orders o ON oli.order_id = o.id
-            LEFT JOIN shopify_products p ON oli.product_id = p.id
-            LEFT JOIN shopify_variants v ON oli.variant_id = v.id
-            WHERE o.financial_status != 'refunded'
-            GROUP BY oli.product_id, oli.variant_id
+                SUM(r.units) as quantity,
+                SUM(r.revenue) as sales
+            FROM shopify_daily_variant_sales r
+            LEFT JOIN shopify_products p ON r.product_id = p.id
+            LEFT JOIN shopify_variants v ON r.variant_id = v.id
+            GROUP BY r.product_id, r.variant_id
             ORDER BY sales DESC
             LIMIT 5
             """)
@@ -792,12 +968,13 @@ if __name__ == "__main__":
     # Make sure database directory exists
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
     
-    # Delete existing database file to recreate it from scratch
+    # Delete existing database file (and its WAL files) to recreate it from scratch
     # This ensures we have a clean start and prevents data inconsistencies
     if os.path.exists(DB_PATH):
         try:
             print("Removing existing database file...")
-            os.remove(DB_PATH)
+            remove_database_files()
+            remove_sales_snapshots()
             print("Database file removed. Will create a new one.")
         except Exception as e:
             print(f"Could not remove database file: {e}")
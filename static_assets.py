@@ -0,0 +1,159 @@
+# -------------------------------------------------------------------------
+# VENDORED STATIC ASSETS
+# -------------------------------------------------------------------------
+# Third-party browser assets are served by Flask from static/ instead of a
+# CDN. Every vendored file has a hash of its content in its filename, so
+# it can be cached by browsers for good (see the after_request hook in
+# app.py) and a new version always gets a new URL.
+#
+# static/manifest.json maps each asset's logical name to its current file:
+#
+#   {"plotly.min.js": "js/plotly-basic-4.1.1.0123abcd.min.js"}
+#
+# Vendoring the Plotly bundle:
+#   python static_assets.py                        # download the basic bundle
+#   python static_assets.py plotly-basic.min.js    # a partial bundle on disk
+#
+# The pages only draw bar, pie and scatter traces, which is exactly the
+# "basic" partial bundle of plotly.js (npm package plotly.js-basic-dist-min,
+# about a fifth of the full size). Custom partial builds with at least those
+# traces work too. The full bundle that comes with the plotly package is
+# refused: it is several MB that every page would download for nothing.
+# The bundle's plotly.js version should match the one the installed plotly
+# package generates figures for; a mismatch is reported.
+# -------------------------------------------------------------------------
+
+import glob
+import hashlib  # For content-hashed filenames
+import json
+import os
+import re
+import sys
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+MANIFEST_PATH = os.path.join(STATIC_DIR, 'manifest.json')
+
+# Logical name of the Plotly bundle in the manifest
+PLOTLY_ASSET = 'plotly.min.js'
+
+# Partial bundle the pages need (bar, pie and scatter traces)
+PLOTLY_PARTIAL_BUNDLE = 'basic'
+
+# Seconds to wait for the CDN when downloading the bundle
+DOWNLOAD_TIMEOUT = 60
+
+
+def load_manifest():
+    """
+    Load the manifest of vendored assets
+
+    Returns:
+        dict: Logical name -> file path relative to static/ (empty if
+            nothing has been vendored)
+    """
+    try:
+        with open(MANIFEST_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"WARNING: Could not read {MANIFEST_PATH}: {e}")
+        return {}
+
+
+def plotly_cdn_url():
+    """
+    The CDN URL of the basic partial bundle of the plotly.js version the
+    installed plotly package targets
+
+    Used when no bundle has been vendored, and by vendor_plotly() to
+    download one.
+    """
+    from plotly.offline import get_plotlyjs_version
+    return f"https://cdn.plot.ly/plotly-{PLOTLY_PARTIAL_BUNDLE}-{get_plotlyjs_version()}.min.js"
+
+
+def _bundle_header(content):
+    """
+    Read the partial bundle name and the version from a plotly.js bundle's
+    license header
+
+    Returns:
+        tuple: (bundle name such as 'basic' or 'custom', None for the full
+            bundle, version or 'unknown')
+    """
+    match = re.search(rb'plotly\.js(?: \((\w+)(?: - \w+)?\))? v(\d+\.\d+\.\d+)', content[:500])
+    if not match:
+        return None, 'unknown'
+    bundle = match.group(1).decode('ascii') if match.group(1) else None
+    return bundle, match.group(2).decode('ascii')
+
+
+def vendor_plotly(source=None):
+    """
+    Copy a Plotly bundle into static/js under a content-hashed filename
+
+    This function:
+    1. Reads the bundle (defaults to downloading the basic partial bundle
+       of the version the plotly package targets from the Plotly CDN)
+    2. Refuses the full bundle, and warns if the version does not match
+    3. Writes it to static/js/plotly-<bundle>-<version>.<hash>.min.js
+    4. Removes previously vendored Plotly bundles
+    5. Points the manifest's plotly.min.js entry at the new file
+
+    Args:
+        source (str): Path to a partial plotly.js bundle, e.g. a custom build
+
+    Returns:
+        str: The new file path relative to static/
+
+    Raises:
+        ValueError: If the bundle is not a partial plotly.js bundle
+    """
+    if source is None:
+        # Only this offline helper needs HTTP, so the web app does not import it
+        import requests
+        url = plotly_cdn_url()
+        print(f"Downloading {url}")
+        response = requests.get(url, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        content = response.content
+    else:
+        with open(source, 'rb') as f:
+            content = f.read()
+
+    bundle, version = _bundle_header(content)
+    if bundle is None:
+        raise ValueError(
+            "Not a partial plotly.js bundle. Vendor plotly-basic.min.js or a "
+            "custom build with the bar, pie and scatter traces instead."
+        )
+
+    from plotly.offline import get_plotlyjs_version
+    if version != get_plotlyjs_version():
+        print(f"WARNING: The bundle is plotly.js {version}, but the plotly package "
+              f"generates figures for plotly.js {get_plotlyjs_version()}")
+
+    digest = hashlib.sha256(content).hexdigest()[:8]
+    filename = f"js/plotly-{bundle}-{version}.{digest}.min.js"
+    path = os.path.join(STATIC_DIR, filename)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    for previous in glob.glob(os.path.join(STATIC_DIR, 'js', 'plotly-*.min.js')):
+        if os.path.abspath(previous) != os.path.abspath(path):
+            os.remove(previous)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+    manifest = load_manifest()
+    manifest[PLOTLY_ASSET] = filename
+    with open(MANIFEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+    print(f"Vendored {len(content) / 1024 / 1024:.1f} MB Plotly {bundle} bundle as static/{filename}")
+    return filename
+
+
+if __name__ == '__main__':
+    vendor_plotly(sys.argv[1] if len(sys.argv) > 1 else None)
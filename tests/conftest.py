@@ -0,0 +1,13 @@
+# -------------------------------------------------------------------------
+# TEST CONFIGURATION
+# -------------------------------------------------------------------------
+# The application modules live at the top level of the repository, so the
+# tests import them from there:
+#
+#   python -m pytest -q tests
+# -------------------------------------------------------------------------
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
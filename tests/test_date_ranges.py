@@ -0,0 +1,52 @@
+# -------------------------------------------------------------------------
+# DATE RANGE PARSING AT THE EDGES OF THE CALENDAR
+# -------------------------------------------------------------------------
+# Valid dates near 0001-01-01 and 9999-12-31 used to pass parsing and then
+# overflow while the panels computed their windows, failing the request.
+# They must come back as a range error with the default selection.
+# -------------------------------------------------------------------------
+
+from datetime import date
+
+import pytest
+
+from date_ranges import MAX_DAY, MIN_DAY, parse_page_range
+from insight_panels import dashboard_windows, inventory_windows, sales_windows
+
+
+def all_window_bounds(page_range):
+    """Bounds of every window the three pages compute for a selection"""
+    bounds = []
+    for page_windows in (dashboard_windows, inventory_windows, sales_windows):
+        for window in page_windows(page_range).values():
+            if window is not None:
+                bounds.append(window.bounds())
+    return bounds
+
+
+@pytest.mark.parametrize('args', [
+    {'start': '0001-01-05', 'end': '0001-01-09', 'compare': 'previous'},
+    {'start': '0001-06-01', 'compare': 'year'},
+    {'start': '2026-01-01', 'end': '9999-12-31'},
+    {'start': '0002-01-01', 'end': '5000-01-01', 'compare': 'previous'},
+    {'compare_start': '0001-01-01', 'compare_end': '0001-02-01'},
+])
+def test_days_outside_the_calendar_fall_back_to_the_default_range(args):
+    page_range, error = parse_page_range(args)
+
+    assert error is not None and error.startswith('Invalid date range')
+    assert page_range.is_default
+    all_window_bounds(page_range)
+
+
+@pytest.mark.parametrize('args', [
+    {'start': MIN_DAY.replace(month=3).isoformat(), 'end': '0002-03-05', 'compare': 'year'},
+    {'start': '9998-12-01', 'end': MAX_DAY.isoformat(), 'compare': 'previous'},
+    {'start': '9998-12-01', 'end': MAX_DAY.isoformat(), 'compare': 'year'},
+])
+def test_days_at_the_supported_edges_compute_every_window(args):
+    page_range, error = parse_page_range(args)
+
+    assert error is None
+    assert page_range.selected.start == date.fromisoformat(args['start'])
+    all_window_bounds(page_range)
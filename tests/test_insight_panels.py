@@ -0,0 +1,125 @@
+# -------------------------------------------------------------------------
+# CONCURRENT PANEL LOADING
+# -------------------------------------------------------------------------
+# Every request shares one pool of PANEL_WORKERS threads. Panels queued
+# behind the panels of other requests must still get their page's full
+# time budget once they run, instead of coming back degraded, and a stream
+# that is abandoned must not keep its queued panels in the pool.
+# -------------------------------------------------------------------------
+
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import insight_panels
+import query_budget
+import shopify_db
+from insight_panels import PANEL_WORKERS, Panel, load_panels, load_panels_as_completed
+
+ROUTE = 'test_concurrency'
+PANEL_SECONDS = 0.3
+ROUTE_BUDGET = 0.5   # Covers one panel, not the queueing of several waves
+CONCURRENT_REQUESTS = 3
+
+
+@pytest.fixture
+def register(tmp_path, monkeypatch):
+    """
+    Register panels of a test page that read an empty database
+
+    Returns:
+        callable: register(loaders) -> panel names, for a list of loaders
+    """
+    db_path = str(tmp_path / 'shopify_data.db')
+    sqlite3.connect(db_path).close()
+    monkeypatch.setattr(shopify_db, 'DB_PATH', db_path)
+    monkeypatch.setattr(shopify_db, 'SNAPSHOT_POINTER', str(tmp_path / 'snapshots' / 'CURRENT'))
+    monkeypatch.setitem(query_budget.ROUTE_BUDGETS, ROUTE, ROUTE_BUDGET)
+
+    def register_loaders(loaders):
+        names = [f'panel_{index}' for index in range(len(loaders))]
+        for name, loader in zip(names, loaders):
+            monkeypatch.setitem(insight_panels.PANELS, name, Panel(name, ROUTE, loader))
+        return names
+    return register_loaders
+
+
+def load_slowly(context):
+    time.sleep(PANEL_SECONDS)
+    return context.budget.read_sql('slow', 'SELECT 1 AS value')
+
+
+def run_concurrently(request):
+    """Run request(index) on CONCURRENT_REQUESTS threads at once"""
+    threads = [threading.Thread(target=request, args=(index,)) for index in range(CONCURRENT_REQUESTS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def wait_for_idle_pool():
+    """Return once every worker is free (all earlier work has finished)"""
+    barrier = threading.Barrier(PANEL_WORKERS)
+    executor = insight_panels._get_executor()
+    for future in [executor.submit(barrier.wait, 5) for _ in range(PANEL_WORKERS)]:
+        future.result()
+
+
+def test_concurrent_requests_do_not_degrade_queued_panels(register):
+    panels = register([load_slowly] * PANEL_WORKERS)
+    results = [None] * CONCURRENT_REQUESTS
+
+    def request(index):
+        results[index] = load_panels(ROUTE, panels)
+
+    run_concurrently(request)
+
+    for page in results:
+        assert page.errors == {}
+        assert page.degraded == []
+        assert [page.frame(name)['value'].tolist() for name in panels] == [[1]] * len(panels)
+
+
+def test_concurrent_streams_do_not_degrade_queued_panels(register):
+    panels = register([load_slowly] * PANEL_WORKERS)
+    streams = [None] * CONCURRENT_REQUESTS
+
+    def request(index):
+        streams[index] = list(load_panels_as_completed(ROUTE, panels))
+
+    run_concurrently(request)
+
+    for stream in streams:
+        assert sorted(name for name, *_ in stream) == sorted(panels)
+        assert [(degraded, error) for _, _, degraded, error, _ in stream] == [(False, None)] * len(panels)
+
+
+def test_abandoned_stream_cancels_its_queued_panels(register):
+    started = []
+    release = threading.Event()
+
+    def load_now(context):
+        started.append('now')
+        return context.budget.read_sql('now', 'SELECT 1 AS value')
+
+    def load_when_released(context):
+        started.append('released')
+        release.wait(5)
+        return context.budget.read_sql('released', 'SELECT 1 AS value')
+
+    # The first panel finishes at once; every other one holds its worker
+    # until released, so PANEL_WORKERS - 1 of them stay queued
+    panels = register([load_now] + [load_when_released] * (2 * PANEL_WORKERS - 1))
+    stream = load_panels_as_completed(ROUTE, panels)
+    assert next(stream)[0] == panels[0]
+    give_up = time.monotonic() + 5
+    while len(started) < PANEL_WORKERS + 1 and time.monotonic() < give_up:
+        time.sleep(0.01)
+    stream.close()
+
+    release.set()
+    wait_for_idle_pool()
+    assert len(started) == PANEL_WORKERS + 1
@@ -0,0 +1,381 @@
+# -------------------------------------------------------------------------
+# VARIANT SCANS
+# -------------------------------------------------------------------------
+# Whole-catalog scans of the variants that sold most, did not sell, or sold
+# least in a window, answered from the columnar snapshot (see
+# columnar_snapshot.py):
+#
+# - top performers:  variants sold in the window, highest window revenue
+#                    first
+# - dead stock:      active variants without a non-refunded sale in the
+#                    window, newest products first
+# - low performers:  active variants of products created before the window,
+#                    lowest window revenue (then units) first
+#
+# Each window keeps a sold-variant bitmap: one bit per catalog variant, set
+# when the variant has a non-refunded line item in the window. Line items
+# are sorted by day, so the window is a slice; its sold items are marked
+# once per item and mapped to their catalog variants. Dead stock is then an
+# anti-join over variant ids done as bitwise operations on the packed
+# bitmaps (active AND NOT sold), without touching the sales again.
+#
+# Every scan orders all matching variants by a unique sort key (ties are
+# broken by variant id), once per snapshot version and window, and keeps
+# the keys in that order. Pages are read by keyset: the page after (or
+# before) a row's key starts at the key's binary-search position, so every
+# page costs the same however deep it is (see insight_panels.py for the
+# cursors).
+# -------------------------------------------------------------------------
+
+import bisect     # For comparing created_at values with a window start
+import threading  # For guarding the per-process scan cache
+
+import numpy as np
+import pandas as pd
+
+# Scans (bitmaps, totals and orders) kept per process; a page view and its
+# neighbours reuse them, other windows evict the oldest
+MAX_CACHED_SCANS = 16
+
+# Per-process cache of scans of the current snapshot version
+_scans_lock = threading.Lock()
+_cached_scans = {}
+
+
+def _cached_scan(snapshot, key, compute):
+    """
+    Get one scan of a snapshot, computing it on first use
+
+    Args:
+        snapshot (SalesSnapshot): The snapshot the scan reads
+        key (tuple): Scan name and window bounds
+        compute (callable): compute() -> the scan result
+
+    Returns:
+        object: The (shared, read-only) scan result
+    """
+    key = (snapshot.version,) + key
+    with _scans_lock:
+        result = _cached_scans.get(key)
+    if result is not None:
+        return result
+
+    result = compute()
+    with _scans_lock:
+        # Scans of older versions are never read again
+        for stale in [cached for cached in _cached_scans if cached[0] != snapshot.version]:
+            del _cached_scans[stale]
+        while len(_cached_scans) >= MAX_CACHED_SCANS:
+            del _cached_scans[next(iter(_cached_scans))]
+        _cached_scans[key] = result
+    return result
+
+
+def _window_items(snapshot, window):
+    """
+    Item codes of the non-refunded line items of a window
+    """
+    rows = snapshot.day_range(*window.bounds())
+    keep = ~snapshot.columns['is_refunded'][rows]
+    return rows, keep, snapshot.columns['item_code'][rows][keep]
+
+
+def sold_bitmap(snapshot, window):
+    """
+    Get the sold-variant bitmap of a window
+
+    Args:
+        snapshot (SalesSnapshot): A mapped snapshot with catalog columns
+        window (DateRange): The window
+
+    Returns:
+        np.ndarray: Packed bits (np.packbits), bit i set when catalog
+            variant i has a non-refunded line item in the window
+    """
+    def compute():
+        size = len(snapshot.catalog['catalog_variant_id'])
+        _, _, items = _window_items(snapshot, window)
+
+        # Mark each sold item once, then its catalog variant
+        item_sold = np.zeros(len(snapshot.item_names), dtype=bool)
+        item_sold[items] = True
+        codes = snapshot.item_catalog_codes()[item_sold]
+        sold = np.zeros(size, dtype=bool)
+        sold[codes[codes >= 0]] = True
+        return np.packbits(sold)
+
+    return _cached_scan(snapshot, ('sold',) + window.bounds(), compute)
+
+
+def window_sales(snapshot, window):
+    """
+    Get the non-refunded units and revenue of every catalog variant in a window
+
+    Returns:
+        tuple: (units, revenue) arrays indexed by catalog code
+    """
+    def compute():
+        size = len(snapshot.catalog['catalog_variant_id'])
+        rows, keep, items = _window_items(snapshot, window)
+        item_count = len(snapshot.item_names)
+        item_units = np.bincount(items, weights=snapshot.columns['quantity'][rows][keep], minlength=item_count)
+        item_revenue = np.bincount(items, weights=snapshot.columns['revenue'][rows][keep], minlength=item_count)
+
+        item_codes = snapshot.item_catalog_codes()
+        in_catalog = item_codes >= 0
+        units = np.bincount(item_codes[in_catalog], weights=item_units[in_catalog], minlength=size)
+        revenue = np.bincount(item_codes[in_catalog], weights=item_revenue[in_catalog], minlength=size)
+        return units.astype(np.int64), revenue
+
+    return _cached_scan(snapshot, ('sales',) + window.bounds(), compute)
+
+
+def _variant_rows(snapshot, codes):
+    """
+    The display columns of some catalog variants
+
+    Returns:
+        pd.DataFrame: variant_id, title, sku, product_type, price and
+            created_at (of the product, '' when unknown), one row per code
+            in order
+    """
+    catalog = snapshot.catalog
+    product_types = snapshot.product_types + [None]
+    created_values = snapshot.catalog_created_values + ['']
+    return pd.DataFrame({
+        'variant_id': np.asarray(catalog['catalog_variant_id'])[codes],
+        'title': [snapshot.catalog_names[code] for code in codes],
+        'sku': [snapshot.catalog_skus[code] for code in codes],
+        'product_type': [product_types[code] for code in np.asarray(catalog['catalog_type_code'])[codes]],
+        'price': np.asarray(catalog['catalog_price'])[codes],
+        'created_at': [created_values[rank] for rank in np.asarray(catalog['catalog_created_rank'])[codes]],
+    })
+
+
+def _created_rank(snapshot, created_at):
+    """
+    The created_at rank of a cursor's created_at value
+
+    Values between two ranks get a fractional rank, so they compare like
+    the text does; '' (unknown) is rank -1.
+    """
+    if created_at == '':
+        return -1.0
+    values = snapshot.catalog_created_values
+    position = bisect.bisect_left(values, created_at)
+    if position < len(values) and values[position] == created_at:
+        return float(position)
+    return position - 0.5
+
+
+def _seek(keys, key):
+    """
+    Find a key in rows sorted by keys
+
+    Args:
+        keys (tuple): Sort key arrays, in row order (ascending, compared
+            lexicographically)
+        key (tuple): The key to find, one value per array
+
+    Returns:
+        tuple: (first row >= key, first row > key)
+    """
+    start, end = 0, len(keys[0])
+    for values, value in zip(keys, key):
+        low = start + int(np.searchsorted(values[start:end], value, 'left'))
+        high = start + int(np.searchsorted(values[start:end], value, 'right'))
+        if low == high:
+            return low, low
+        start, end = low, high
+    return start, end
+
+
+def _page_codes(order, direction=None, key=None, limit=None):
+    """
+    The catalog codes of one keyset page of a scan
+
+    Args:
+        order (tuple): (codes, keys) of the scan, see top_performer_order()
+        direction (str): 'after' or 'before' key, or None from the start
+        key (tuple): Sort key of the row the page starts after or ends before
+        limit (int): Rows to return, or None for all of them
+
+    Returns:
+        np.ndarray: Catalog codes, in page order
+    """
+    codes, keys = order
+    if key is None:
+        return codes[:limit]
+    before, after = _seek(keys, key)
+    if direction == 'before':
+        return codes[0 if limit is None else max(before - limit, 0):before]
+    return codes[after:None if limit is None else after + limit]
+
+
+def top_performer_order(snapshot, window):
+    """
+    Every variant sold in a window, in page order
+
+    Variants of products that no longer exist are left out. The sort key is
+    (total_revenue, variant_id), highest first.
+
+    Returns:
+        tuple: (codes, keys) where codes are catalog codes in page order
+            and keys the ascending sort key arrays in the same order
+            (negated revenue, negated variant id); shared, do not modify
+    """
+    def compute():
+        catalog = snapshot.catalog
+        size = len(catalog['catalog_variant_id'])
+        sold = np.unpackbits(sold_bitmap(snapshot, window), count=size).astype(bool)
+        sold = np.flatnonzero(sold & (np.asarray(catalog['catalog_type_code']) >= 0))
+
+        _, revenue = window_sales(snapshot, window)
+        order = sold[np.lexsort((sold, revenue[sold]))][::-1]
+        variant_ids = np.asarray(catalog['catalog_variant_id'])
+        return order, (-revenue[order], -variant_ids[order])
+
+    return _cached_scan(snapshot, ('top_performers',) + window.bounds(), compute)
+
+
+def dead_stock_order(snapshot, window):
+    """
+    Every dead stock variant of a window, in page order
+
+    This function:
+    1. Takes the packed bitmap of active variants and the window's
+       sold-variant bitmap
+    2. Keeps the active variants whose sold bit is clear (active AND NOT
+       sold) with bitwise operations over the packed bytes
+    3. Orders them by (created_at, variant_id), newest first (variants of
+       unknown creation last)
+
+    Returns:
+        tuple: (codes, keys) as top_performer_order(), with keys negated
+            created_at rank and negated variant id
+    """
+    def compute():
+        catalog = snapshot.catalog
+        size = len(catalog['catalog_variant_id'])
+        active = np.packbits(np.asarray(catalog['catalog_active']))
+        dead = np.flatnonzero(np.unpackbits(active & ~sold_bitmap(snapshot, window), count=size))
+
+        ranks = np.asarray(catalog['catalog_created_rank'])
+        order = dead[np.lexsort((dead, ranks[dead]))][::-1]
+        variant_ids = np.asarray(catalog['catalog_variant_id'])
+        return order, (-ranks[order].astype(np.float64), -variant_ids[order])
+
+    return _cached_scan(snapshot, ('dead_stock',) + window.bounds(), compute)
+
+
+def low_performer_order(snapshot, window):
+    """
+    Every low performer of a window, in page order
+
+    Active variants of products created before the window start (created_at
+    <= the start day, compared as text like SQL) are ordered by
+    (total_revenue, total_sold, variant_id), lowest first.
+
+    Returns:
+        tuple: (codes, keys) as top_performer_order(), with keys revenue,
+            units and variant id
+    """
+    def compute():
+        catalog = snapshot.catalog
+        ranks = np.asarray(catalog['catalog_created_rank'])
+        last_rank = bisect.bisect_right(snapshot.catalog_created_values, window.bounds()[0]) - 1
+        eligible = np.flatnonzero(np.asarray(catalog['catalog_active']) & (ranks >= 0) & (ranks <= last_rank))
+
+        units, revenue = window_sales(snapshot, window)
+        order = eligible[np.lexsort((eligible, units[eligible], revenue[eligible]))]
+        variant_ids = np.asarray(catalog['catalog_variant_id'])
+        return order, (revenue[order], units[order], variant_ids[order])
+
+    return _cached_scan(snapshot, ('low_performers',) + window.bounds(), compute)
+
+
+def scan_top_performers(snapshot, window, direction=None, key=None, limit=None):
+    """
+    One keyset page of the top performers of a window
+
+    Args:
+        snapshot (SalesSnapshot): A mapped snapshot with catalog columns
+        window (DateRange): Window the sales are totalled over
+        direction (str): 'after' or 'before' key, or None from the start
+        key (tuple): (total_revenue, variant_id) of the row the page starts
+            after or ends before
+        limit (int): Rows to return, or None for all of them
+
+    Returns:
+        pd.DataFrame: variant_id, title, sku, product_type, price,
+            total_sold and total_revenue, in page order
+    """
+    if key is not None:
+        key = (-float(key[0]), -int(key[1]))
+    codes = _page_codes(top_performer_order(snapshot, window), direction, key, limit)
+    units, revenue = window_sales(snapshot, window)
+
+    rows = _variant_rows(snapshot, codes).drop(columns='created_at')
+    rows['total_sold'] = units[codes]
+    rows['total_revenue'] = revenue[codes]
+    return rows
+
+
+def scan_dead_stock(snapshot, window, direction=None, key=None, limit=None):
+    """
+    One keyset page of the dead stock variants of a window
+
+    Args:
+        snapshot (SalesSnapshot): A mapped snapshot with catalog columns
+        window (DateRange): Variants without sales in this window are dead
+        direction (str): 'after' or 'before' key, or None from the start
+        key (tuple): (created_at, variant_id) of the row the page starts
+            after or ends before
+        limit (int): Rows to return, or None for all of them
+
+    Returns:
+        pd.DataFrame: variant_id, title, sku, product_type, price and
+            created_at, in page order
+    """
+    if key is not None:
+        key = (-_created_rank(snapshot, key[0]), -int(key[1]))
+    return _variant_rows(snapshot, _page_codes(dead_stock_order(snapshot, window), direction, key, limit))
+
+
+def scan_low_performers(snapshot, window, direction=None, key=None, limit=None):
+    """
+    One keyset page of the low performers of a window
+
+    Args:
+        snapshot (SalesSnapshot): A mapped snapshot with catalog columns
+        window (DateRange): Window the sales are totalled over
+        direction (str): 'after' or 'before' key, or None from the start
+        key (tuple): (total_revenue, total_sold, variant_id) of the row the
+            page starts after or ends before
+        limit (int): Rows to return, or None for all of them
+
+    Returns:
+        pd.DataFrame: variant_id, title, sku, product_type, price,
+            total_sold, total_revenue and created_at, in page order
+    """
+    if key is not None:
+        key = (float(key[0]), int(key[1]), int(key[2]))
+    codes = _page_codes(low_performer_order(snapshot, window), direction, key, limit)
+    units, revenue = window_sales(snapshot, window)
+
+    rows = _variant_rows(snapshot, codes)
+    rows.insert(5, 'total_sold', units[codes])
+    rows.insert(6, 'total_revenue', revenue[codes])
+    return rows
+
+
+def scan_count(snapshot, window, scan):
+    """
+    Number of rows of a scan ('top_performers', 'dead_stock' or 'low_performers')
+    """
+    orders = {
+        'top_performers': top_performer_order,
+        'dead_stock': dead_stock_order,
+        'low_performers': low_performer_order,
+    }
+    return len(orders[scan](snapshot, window)[0])